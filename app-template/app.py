@@ -1,15 +1,42 @@
 import os
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify
+
+from health import HealthMonitor
+from metrics import RequestMetrics
+from response_cache import ResponseCache
+from fast_json import init_json
+from compression import Compression
 
 app = Flask(__name__)
+# orjson-backed jsonify when available
+init_json(app)
+# Per-route latency, status and size metrics, served at /metrics
+metrics = RequestMetrics(app)
+# gzip/brotli for large enough responses the client accepts compressed
+Compression(app)
+# Background dependency probes; /health and /ready serve their cached results
+health_monitor = HealthMonitor()
+# Cached GET responses, shared through Redis when REDIS_HOST is reachable
+response_cache = ResponseCache.from_env()
 
 @app.route('/')
+@response_cache.cached(ttl=300)
 def index():
     return jsonify(message="Welcome to the StockBotWars API!")
 
 @app.route('/health')
 def health():
-    return jsonify(status="healthy")
+    status, body = health_monitor.liveness()
+    return Response(body, status, mimetype="application/json")
+
+@app.route('/ready')
+def ready():
+    status, body = health_monitor.ready()
+    return Response(body, status, mimetype="application/json")
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 if __name__ == '__main__':
     app_port = int(os.getenv("APP_PORT", 5000))  # Default to 5000 if env var is missing
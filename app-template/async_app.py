@@ -0,0 +1,96 @@
+import os
+import asyncio
+
+import httpx
+import redis.asyncio as redis
+from quart import Quart, Response, jsonify
+
+from health import HEALTH_TIMEOUT, HealthMonitor, health_dependencies
+
+# Async variant of app.py for services that mostly wait on Redis or other services.
+# Run it with: SERVER_MODE=async (see the Dockerfile) or
+#   uvicorn async_app:app --port $APP_PORT --limit-concurrency 4096
+
+REDIS_URL = os.getenv("REDIS_URL", f"redis://{os.getenv('REDIS_HOST', 'redis')}:6379/0")
+REDIS_POOL_SIZE = int(os.getenv("REDIS_POOL_SIZE", 50))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 100))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+# Requests handled at once; further requests wait for a free slot
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", 1000))
+
+class ConcurrencyLimit:
+    """ASGI middleware that caps the number of HTTP requests in flight"""
+
+    def __init__(self, app, limit):
+        self.app = app
+        self.limit = limit
+        self.semaphore = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if self.semaphore is None:
+            # Created lazily so it binds to the server's event loop
+            self.semaphore = asyncio.Semaphore(self.limit)
+        async with self.semaphore:
+            return await self.app(scope, receive, send)
+
+app = Quart(__name__)
+app.asgi_app = ConcurrencyLimit(app.asgi_app, MAX_IN_FLIGHT)
+# Probed by a task on the event loop (see dependency_probes), so /ready never waits on a dependency
+health_monitor = HealthMonitor(probes={})
+
+def dependency_probes():
+    """Readiness probes that go through the app's pooled clients.
+
+    Redis is probed when REDIS_HOST or REDIS_URL is set, and every
+    HEALTH_DEPENDENCIES service must answer with a 2xx status.
+    """
+    probes = {}
+    if os.getenv("REDIS_HOST") or os.getenv("REDIS_URL"):
+        probes["redis"] = app.redis.ping
+    for name, url in health_dependencies().items():
+        async def probe(url=url):
+            response = await app.http.get(url, timeout=HEALTH_TIMEOUT)
+            response.raise_for_status()
+        probes[name] = probe
+    return probes
+
+@app.before_serving
+async def open_pools():
+    # Connections are opened on first use and reused across requests and readiness probes.
+    # Point REDIS_URL at a local stand-in (e.g. redis://localhost:6379/0) when developing.
+    app.redis = redis.Redis.from_url(REDIS_URL, max_connections=REDIS_POOL_SIZE)
+    app.http = httpx.AsyncClient(
+        timeout=HTTP_TIMEOUT,
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+    )
+    app.health_task = asyncio.create_task(health_monitor.run_async(dependency_probes()))
+
+@app.after_serving
+async def close_pools():
+    app.health_task.cancel()
+    try:
+        await app.health_task
+    except asyncio.CancelledError:
+        pass
+    await app.http.aclose()
+    await app.redis.aclose()
+
+@app.route('/')
+async def index():
+    return jsonify(message="Welcome to the StockBotWars API!")
+
+@app.route('/health')
+async def health():
+    status, body = health_monitor.liveness()
+    return Response(body, status, content_type="application/json")
+
+@app.route('/ready')
+async def ready():
+    status, body = health_monitor.ready()
+    return Response(body, status, content_type="application/json")
+
+if __name__ == '__main__':
+    app_port = int(os.getenv("APP_PORT", 5000))  # Default to 5000 if env var is missing
+    app.run(host='0.0.0.0', port=app_port)
@@ -0,0 +1,286 @@
+import os
+import gc
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+# Micro-benchmark harness for the app's routes.
+#
+# Each benchmark is calibrated so one round takes about BENCHMARK_ROUND_TIME
+# seconds, warmed up, then run for BENCHMARK_ROUNDS rounds with every call
+# timed individually by perf_counter_ns. Results are written as
+# {"benchmarks": {name: {"p50_ms", "p95_ms", "p99_ms", "mean_ms", ...}}},
+# the format scripts/test_report_generator.py reads from benchmark-*.json.
+#
+# Baselines are kept per runner class and branch in BENCHMARK_BASELINES; a
+# run whose BENCHMARK_STAT is more than BENCHMARK_THRESHOLD slower than the
+# baseline of its branch (or of BENCHMARK_BASE_BRANCH when the branch has
+# none) on the same runner class fails. The runner class is BENCHMARK_RUNNER
+# (default: OS and machine) plus the Python version, so timings from other
+# hardware or interpreters are never compared. Timings taken while coverage
+# traces the process are not comparable either; run this script directly.
+# CI does so in its own step and sets BENCHMARK_STEP=true for the test
+# suites, so tests/test_optional.py does not benchmark a second time.
+#
+# Usage: python benchmark.py run [--output tests/test-reports/benchmark-optional.json] [--update-baseline]
+#        python benchmark.py check tests/test-reports/benchmark-optional.json [--update-baseline]
+
+BENCHMARK_ROUNDS = int(os.getenv("BENCHMARK_ROUNDS", 5))
+BENCHMARK_ROUND_TIME = float(os.getenv("BENCHMARK_ROUND_TIME", 0.2))
+BENCHMARK_BASELINES = os.getenv("BENCHMARK_BASELINES", "benchmark-baselines.json")
+BENCHMARK_BASE_BRANCH = os.getenv("BENCHMARK_BASE_BRANCH", "master")
+BENCHMARK_THRESHOLD = float(os.getenv("BENCHMARK_THRESHOLD", 0.25))
+BENCHMARK_STEP = os.getenv("BENCHMARK_STEP", "false").lower() == "true"
+BENCHMARK_STAT = os.getenv("BENCHMARK_STAT", "p50_ms")
+BENCHMARK_RUNNER = os.getenv("BENCHMARK_RUNNER") or f"{platform.system()}-{platform.machine()}"
+
+# Bounds for calibrated iteration counts per round
+MIN_ITERATIONS = 10
+MAX_ITERATIONS = 100000
+
+class BenchmarkError(Exception):
+    """Custom exception for benchmark errors"""
+    pass
+
+def runner_class():
+    """Where a result can be compared: the runner plus the Python minor version"""
+    return f"{BENCHMARK_RUNNER}-py{sys.version_info.major}.{sys.version_info.minor}"
+
+def under_coverage():
+    """Whether coverage is tracing this process, which inflates every timing"""
+    coverage = sys.modules.get("coverage")
+    return coverage is not None and coverage.Coverage.current() is not None
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return ordered[index]
+
+def summarize(samples_ns, elapsed_ns):
+    """Statistics in milliseconds for per-call timings; rps is calls over the measured wall time"""
+    ordered = sorted(samples_ns)
+    to_ms = 1e-6
+    return {
+        "p50_ms": percentile(ordered, 0.50) * to_ms,
+        "p95_ms": percentile(ordered, 0.95) * to_ms,
+        "p99_ms": percentile(ordered, 0.99) * to_ms,
+        "mean_ms": statistics.fmean(ordered) * to_ms,
+        "stddev_ms": (statistics.stdev(ordered) if len(ordered) > 1 else 0.0) * to_ms,
+        "min_ms": ordered[0] * to_ms,
+        "max_ms": ordered[-1] * to_ms,
+        "rps": len(ordered) / (elapsed_ns / 1e9) if elapsed_ns else 0.0,
+    }
+
+def calibrate(func, round_time=BENCHMARK_ROUND_TIME):
+    """Number of calls that take about round_time seconds"""
+    timer = time.perf_counter_ns
+    calls = 0
+    started = timer()
+    # Average over a tenth of a round, so a slow first (cold) call does not skew the count
+    while True:
+        func()
+        calls += 1
+        elapsed = timer() - started
+        if elapsed >= round_time * 1e8 or calls >= MAX_ITERATIONS:
+            break
+    per_call = elapsed / calls
+    return min(MAX_ITERATIONS, max(MIN_ITERATIONS, int(round_time * 1e9 / per_call)))
+
+def measure(func, iterations):
+    """Time each of `iterations` calls; returns (samples in ns, wall time in ns)"""
+    timer = time.perf_counter_ns
+    samples = [0] * iterations
+    started = timer()
+    for i in range(iterations):
+        start = timer()
+        func()
+        samples[i] = timer() - start
+    return samples, timer() - started
+
+def run_benchmark(func, rounds=BENCHMARK_ROUNDS, round_time=BENCHMARK_ROUND_TIME, iterations=None):
+    """Calibrate, warm up and measure func; returns (statistics, run details)"""
+    iterations = iterations or calibrate(func, round_time)
+    warmup = max(MIN_ITERATIONS, iterations // 10)
+    measure(func, warmup)
+    samples = []
+    elapsed = 0
+    for _ in range(rounds):
+        # Collect between rounds so one round does not pay for the garbage of the last
+        gc.collect()
+        round_samples, round_elapsed = measure(func, iterations)
+        samples.extend(round_samples)
+        elapsed += round_elapsed
+    return summarize(samples, elapsed), {"iterations": iterations, "rounds": rounds, "warmup": warmup}
+
+def run_all(cases, rounds=BENCHMARK_ROUNDS, round_time=BENCHMARK_ROUND_TIME, only=None):
+    """Run {name: func} cases and return the results document"""
+    benchmarks = {}
+    runs = {}
+    for name, func in cases.items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        benchmarks[name], runs[name] = run_benchmark(func, rounds, round_time)
+    return {
+        "benchmarks": benchmarks,
+        "runs": runs,
+        "branch": current_branch(),
+        "runner": runner_class(),
+        "commit": os.getenv("COMMIT_HASH") or os.getenv("APP_COMMIT"),
+        "python": sys.version.split()[0],
+        "created_at": time.time(),
+    }
+
+def current_branch():
+    branch = os.getenv("BRANCH_NAME")
+    if branch:
+        return branch
+    try:
+        result = subprocess.run(["git", "rev-parse", "--abbrev-ref", "HEAD"],
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def endpoint_cases(client):
+    """Benchmarks for the template's routes through a Flask test client"""
+    def get(path):
+        def call():
+            response = client.get(path)
+            if response.status_code != 200:
+                raise BenchmarkError(f"GET {path} returned {response.status_code}")
+        return call
+    return {
+        "GET /": get("/"),
+        "GET /health": get("/health"),
+    }
+
+class BaselineStore:
+    """Benchmark baselines per runner class and branch, kept in one JSON file"""
+
+    def __init__(self, path=BENCHMARK_BASELINES, base_branch=BENCHMARK_BASE_BRANCH):
+        self.path = path
+        self.base_branch = base_branch
+        try:
+            with open(path) as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            self.data = {}
+        except json.JSONDecodeError as e:
+            raise BenchmarkError(f"Invalid baseline file {path}: {e}")
+        # Baselines written before runner classes were recorded cannot be matched to one
+        self.data.pop("branches", None)
+        self.data.setdefault("runners", {})
+
+    def baseline(self, branch, runner=None):
+        """(branch the baseline came from, {name: statistics}) or (None, {})"""
+        branches = self.data["runners"].get(runner or runner_class(), {}).get("branches", {})
+        for candidate in (branch, self.base_branch):
+            if candidate and candidate in branches:
+                return candidate, branches[candidate]["benchmarks"]
+        return None, {}
+
+    def compare(self, results, branch=None, threshold=BENCHMARK_THRESHOLD, stat=BENCHMARK_STAT):
+        """Benchmarks whose `stat` is more than `threshold` (relative) slower than the baseline"""
+        source, baseline = self.baseline(branch or results.get("branch"), results.get("runner"))
+        regressions = []
+        for name, stats in results["benchmarks"].items():
+            reference = baseline.get(name, {}).get(stat)
+            value = stats.get(stat)
+            if not reference or value is None:
+                continue
+            change = (value - reference) / reference
+            if change > threshold:
+                regressions.append({"name": name, "stat": stat, "baseline": reference,
+                                    "value": value, "change": change, "baseline_branch": source})
+        return source, regressions
+
+    def update(self, results, branch=None):
+        """Record results as the baseline of their branch and runner class (atomically replaces the file)"""
+        branch = branch or results.get("branch")
+        if not branch:
+            raise BenchmarkError("Cannot store a baseline without a branch name")
+        runner = results.get("runner") or runner_class()
+        branches = self.data["runners"].setdefault(runner, {"branches": {}})["branches"]
+        branches[branch] = {
+            "benchmarks": results["benchmarks"],
+            "commit": results.get("commit"),
+            "updated_at": results.get("created_at") or time.time(),
+        }
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.data, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+def write_results(results, output):
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+def report(results, source, regressions, threshold, stat):
+    for name, stats in results["benchmarks"].items():
+        print(f"{name:<20} p50 {stats['p50_ms']:.3f}ms  p95 {stats['p95_ms']:.3f}ms  "
+              f"p99 {stats['p99_ms']:.3f}ms  stddev {stats['stddev_ms']:.3f}ms  {stats['rps']:.0f} req/s")
+    if source is None:
+        print(f"No baseline to compare with for {results.get('runner') or runner_class()}")
+        return
+    for item in regressions:
+        print(f"REGRESSION {item['name']}: {stat} {item['baseline']:.3f}ms -> {item['value']:.3f}ms "
+              f"({item['change']:+.1%}, baseline from {item['baseline_branch']})")
+    print(f"{len(regressions)} regression(s) over {threshold:.0%} against the {source} baseline "
+          f"for {results.get('runner') or runner_class()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's routes and compare with branch baselines")
+    parser.add_argument('action', choices=['run', 'check'])
+    parser.add_argument('results', nargs='?', help='check: results file written by run')
+    parser.add_argument('--output', help='run: write results JSON here')
+    parser.add_argument('--filter', action='append', help='run: only benchmarks whose name contains this')
+    parser.add_argument('--rounds', type=int, default=BENCHMARK_ROUNDS)
+    parser.add_argument('--round-time', type=float, default=BENCHMARK_ROUND_TIME, help='Seconds per round')
+    parser.add_argument('--baselines', default=BENCHMARK_BASELINES, help='Baseline file')
+    parser.add_argument('--branch', help='Branch whose baseline is used (default: results branch)')
+    parser.add_argument('--threshold', type=float, default=BENCHMARK_THRESHOLD)
+    parser.add_argument('--stat', default=BENCHMARK_STAT, help='Statistic compared with the baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='Store results as the branch baseline if they pass')
+
+    args = parser.parse_args()
+    try:
+        if args.action == 'run':
+            if under_coverage():
+                raise BenchmarkError("Benchmarks cannot run under coverage, their timings would not be comparable")
+            from app import app
+            app.config['TESTING'] = True
+            with app.test_client() as client:
+                results = run_all(endpoint_cases(client), args.rounds, args.round_time, args.filter)
+            if args.branch:
+                results["branch"] = args.branch
+            if args.output:
+                write_results(results, args.output)
+        else:
+            if not args.results:
+                raise ValueError("A results file is required for check action")
+            with open(args.results) as f:
+                results = json.load(f)
+
+        store = BaselineStore(args.baselines)
+        source, regressions = store.compare(results, args.branch, args.threshold, args.stat)
+        report(results, source, regressions, args.threshold, args.stat)
+        if regressions:
+            exit(1)
+        if args.update_baseline:
+            store.update(results, args.branch)
+            print(f"Updated baseline for {args.branch or results.get('branch')}")
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import os
+import gzip
+import threading
+import importlib.util
+from collections import OrderedDict
+from flask import request
+
+# Negotiated response compression for app.py.
+#
+# Responses of a compressible type and at least COMPRESS_MIN_SIZE bytes are
+# sent with brotli (when the brotli package is installed) or gzip, whichever
+# the client prefers. Bodies that carry an ETag are constant for that tag
+# (cached responses, static files), so their compressed form is computed
+# once and reused.
+
+# brotli is only imported once a response is brotli-compressed
+HAVE_BROTLI = importlib.util.find_spec("brotli") is not None
+
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 512))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 5))
+COMPRESS_CACHE_ENTRIES = int(os.getenv("COMPRESS_CACHE_ENTRIES", 256))
+COMPRESSIBLE_TYPES = {
+    "application/json", "application/javascript", "application/xml", "image/svg+xml",
+    "text/html", "text/css", "text/plain", "text/xml", "text/csv", "text/javascript",
+}
+
+class Compression:
+    """after_request hook compressing responses the client accepts compressed"""
+
+    def __init__(self, app=None, min_size=COMPRESS_MIN_SIZE, cache_entries=COMPRESS_CACHE_ENTRIES):
+        self.min_size = min_size
+        self.cache_entries = cache_entries
+        self.algorithms = ["br", "gzip"] if HAVE_BROTLI else ["gzip"]
+        # (etag, encoding) -> compressed body
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.compress_response)
+
+    def compress(self, body, encoding):
+        if encoding == "br":
+            import brotli
+            return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY)
+        return gzip.compress(body, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+    def _compressed(self, body, encoding, etag):
+        if not etag:
+            return self.compress(body, encoding)
+        key = (etag, encoding)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+        compressed = self.compress(body, encoding)
+        with self._lock:
+            self._cache[key] = compressed
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return compressed
+
+    def compress_response(self, response):
+        if (response.direct_passthrough or response.is_streamed or request.method == "HEAD"
+                or not 200 <= response.status_code < 300 or response.status_code == 204
+                or "Content-Encoding" in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = request.accept_encodings.best_match(self.algorithms)
+        if encoding is None:
+            return response
+        body = response.get_data()
+        if len(body) < self.min_size:
+            return response
+        etag, weak = response.get_etag()
+        compressed = self._compressed(body, encoding, etag)
+        if len(compressed) >= len(body):
+            return response
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+        if etag and not weak:
+            # The compressed bytes differ, so only a weak match with the identity ETag holds
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,56 @@
+import os
+from flask.json.provider import DefaultJSONProvider
+
+# Faster JSON for app.py: orjson when it is installed, the standard library otherwise.
+# Set JSON_PROVIDER=stdlib to force Flask's default provider.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, falling back to json for what orjson refuses.
+
+    Output matches the default provider for ASCII data: compact separators,
+    sorted keys and a trailing newline on responses. Non-ASCII text is sent
+    as UTF-8 rather than \\u escapes.
+    """
+
+    def _options(self):
+        # Dates and dataclasses go through self.default like they do in json,
+        # so dates stay HTTP dates instead of orjson's RFC 3339
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        return options | orjson.OPT_SORT_KEYS if self.sort_keys else options
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get("indent") or kwargs.get("cls"):
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+        except TypeError:
+            # Non-string keys, integers beyond 64 bits and the like
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        try:
+            body = orjson.dumps(obj, default=self.default,
+                                option=self._options() | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+def init_json(app):
+    """Install the fastest available JSON provider on app"""
+    if orjson is not None and os.getenv("JSON_PROVIDER", "orjson") == "orjson":
+        app.json_provider_class = OrjsonProvider
+        app.json = OrjsonProvider(app)
+    return app.json
@@ -0,0 +1,47 @@
+# Gunicorn settings for running app.py in production mode
+#
+# Every value can be tuned per environment from the .env file.
+# Send SIGHUP to the master process to reload gracefully: new workers
+# are started with the new config before the old ones finish their
+# requests and stop. With preload_app the code is imported by the master,
+# so code changes need a restart (or GUNICORN_PRELOAD=false).
+import os
+import shutil
+import tempfile
+import multiprocessing
+
+bind = f"0.0.0.0:{os.getenv('APP_PORT', '5000')}"
+
+# Pre-fork worker processes, each running a pool of threads
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+worker_class = "gthread" if threads > 1 else "sync"
+
+# Import the app once in the master so workers share its memory copy-on-write
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+# Keep connections from nginx open between requests
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+# Time given to in-flight requests when workers are stopped or reloaded
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+# Recycle workers now and then so slow leaks never build up
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+# Workers save their request metrics here so /metrics can add them up
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"app-metrics-{os.getenv('APP_PORT', '5000')}"))
+
+def on_starting(server):
+    # Start each server with fresh counters
+    shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+
+def worker_exit(server, worker):
+    # Runs in the exiting worker: fold its counters, including those since the last flush, into retired.json
+    from app import metrics
+    metrics.retire()
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import threading
+
+# Health checks for app.py and async_app.py.
+#
+# Dependency probes run every HEALTH_INTERVAL seconds, in a background thread
+# for app.py and as a task on the event loop (through the pooled clients) for
+# async_app.py, and the responses are serialized once per round, so /health
+# and /ready only return bytes that already exist and never wait on a
+# dependency.
+
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", 10))
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_TIMEOUT", 2))
+
+def redis_probe(host, port=6379, timeout=HEALTH_TIMEOUT):
+    """Check that Redis answers PING"""
+    def probe():
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.sendall(b"PING\r\n")
+            reply = sock.recv(64)
+        if not reply.startswith(b"+PONG"):
+            raise ConnectionError(f"unexpected reply {reply[:20]!r}")
+    return probe
+
+def http_probe(url, timeout=HEALTH_TIMEOUT):
+    """Check that a downstream service answers with a 2xx status"""
+    def probe():
+        import urllib.request
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+    return probe
+
+def health_dependencies():
+    """{name: url} of the services in HEALTH_DEPENDENCIES.
+
+    Services are comma-separated name=url pairs, e.g. "trades=http://trades:5000/health".
+    """
+    dependencies = {}
+    for item in os.getenv("HEALTH_DEPENDENCIES", "").split(","):
+        name, sep, url = item.strip().partition("=")
+        if sep:
+            dependencies[name.strip()] = url.strip()
+    return dependencies
+
+def default_probes():
+    """Probes configured by the environment.
+
+    REDIS_HOST enables the Redis probe; HEALTH_DEPENDENCIES adds services.
+    """
+    probes = {}
+    if os.getenv("REDIS_HOST"):
+        probes["redis"] = redis_probe(os.getenv("REDIS_HOST"), int(os.getenv("REDIS_PORT", 6379)))
+    for name, url in health_dependencies().items():
+        probes[name] = http_probe(url)
+    return probes
+
+def _serialize(payload):
+    # Same bytes as Flask's jsonify, so responses match the plain routes
+    return (json.dumps(payload, separators=(",", ":")) + "\n").encode()
+
+class HealthMonitor:
+    """Runs dependency probes in the background and caches the responses"""
+
+    LIVENESS = _serialize({"status": "healthy"})
+
+    def __init__(self, probes=None, interval=HEALTH_INTERVAL):
+        self.probes = default_probes() if probes is None else probes
+        self.interval = interval
+        self.results = {}
+        self.checked_at = None
+        # (status code, body) for /ready, replaced in one assignment per round
+        self.readiness = (503, _serialize({"status": "starting", "checks": {}}))
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the probe thread in this process (workers forked after preload need their own)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            if not self.probes:
+                self.check()
+                return
+            threading.Thread(target=self._run, name="health-probes", daemon=True).start()
+
+    def _run(self):
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(self.probes), thread_name_prefix="health-probe") as pool:
+            while True:
+                self.check(pool)
+                time.sleep(self.interval)
+
+    async def run_async(self, probes):
+        """Probe with coroutine functions on the running event loop instead of a thread"""
+        self._pid = os.getpid()
+        self.probes = probes
+        while True:
+            await self.check_async()
+            await asyncio.sleep(self.interval)
+
+    @staticmethod
+    def _result(started, error):
+        result = {"ok": error is None, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+        if error:
+            result["error"] = error
+        return result
+
+    @classmethod
+    def _timed(cls, probe):
+        started = time.perf_counter()
+        try:
+            probe()
+            error = None
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        return cls._result(started, error)
+
+    @classmethod
+    async def _timed_async(cls, probe):
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(probe(), HEALTH_TIMEOUT)
+            error = None
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        return cls._result(started, error)
+
+    def check(self, pool=None):
+        """Run every probe once (concurrently when given a pool) and refresh the cached responses"""
+        names = list(self.probes)
+        if pool is None:
+            outcomes = [self._timed(self.probes[name]) for name in names]
+        else:
+            outcomes = list(pool.map(self._timed, [self.probes[name] for name in names]))
+        return self._record(names, outcomes)
+
+    async def check_async(self):
+        """Await every coroutine probe once, concurrently, and refresh the cached responses"""
+        names = list(self.probes)
+        outcomes = await asyncio.gather(*(self._timed_async(self.probes[name]) for name in names))
+        return self._record(names, outcomes)
+
+    def _record(self, names, outcomes):
+        self.results = dict(zip(names, outcomes))
+        self.checked_at = time.time()
+        ready = all(result["ok"] for result in outcomes)
+        self.readiness = (200 if ready else 503, _serialize({
+            "status": "ready" if ready else "not ready",
+            "checked_at": round(self.checked_at, 3),
+            "checks": self.results,
+        }))
+        return ready
+
+    def liveness(self):
+        """(status code, body) for /health"""
+        self.ensure_started()
+        return 200, self.LIVENESS
+
+    def ready(self):
+        """(status code, body) for /ready"""
+        self.ensure_started()
+        return self.readiness
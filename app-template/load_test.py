@@ -0,0 +1,567 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+import http.client
+import importlib.util
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from concurrent.futures import ProcessPoolExecutor
+
+# HTTP load generator for a running service (python serve.py on APP_PORT,
+# or --serve to start one).
+#
+#   closed loop - each of --connections keeps one request in flight; with
+#                 --rate the connections are paced (wrk2 style)
+#   open loop   - requests arrive at --rate per second whether or not earlier
+#                 ones finished, sent over a keep-alive pool of --connections
+#
+# Latency is measured from when a request was *meant* to be sent, so a
+# stalled server is charged for the requests it kept waiting (coordinated
+# omission correction); the uncorrected service time is reported next to it.
+# Unpaced closed-loop runs can be corrected with --expected-interval-ms.
+#
+# Usage: python load_test.py --mode open --rate 2000 --connections 256 --duration 30 \
+#            --request "GET /@3" --request "GET /health" [--output tests/test-reports/benchmark-load.json]
+
+DEFAULT_PERCENTILES = (50, 75, 90, 95, 99, 99.9, 99.99)
+
+class LoadTestError(Exception):
+    """Custom exception for load test errors"""
+    pass
+
+class Histogram:
+    """HDR-style latency histogram over integer microseconds.
+
+    Values are bucketed log-linearly: each power of two is split into
+    2**sub_bucket_bits slots, keeping `significant_digits` of precision at
+    any magnitude in fixed memory. Histograms with the same settings merge
+    by adding counts.
+    """
+
+    def __init__(self, highest=60_000_000, significant_digits=3):
+        self.highest = highest
+        self.significant_digits = significant_digits
+        self.sub_bucket_bits = (2 * 10 ** significant_digits - 1).bit_length()
+        self.sub_bucket_half = 1 << (self.sub_bucket_bits - 1)
+        self.counts = [0] * (self._index(highest) + 1)
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def _index(self, value):
+        shift = max(0, value.bit_length() - self.sub_bucket_bits)
+        return shift * self.sub_bucket_half + (value >> shift)
+
+    def _highest_equivalent(self, index):
+        if index < 2 * self.sub_bucket_half:
+            return index
+        shift = (index - 2 * self.sub_bucket_half) // self.sub_bucket_half + 1
+        return ((index - shift * self.sub_bucket_half + 1) << shift) - 1
+
+    def record(self, value, count=1):
+        value = min(max(0, int(value)), self.highest)
+        self.counts[self._index(value)] += count
+        self.total += count
+        self.sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def record_corrected(self, value, expected_interval):
+        """Record value plus the samples a stalled closed loop never got to send"""
+        self.record(value)
+        if not expected_interval:
+            return
+        missing = value - expected_interval
+        while missing >= expected_interval:
+            self.record(missing)
+            missing -= expected_interval
+
+    def merge(self, other):
+        if (other.highest, other.significant_digits) != (self.highest, self.significant_digits):
+            raise LoadTestError("Cannot merge histograms with different settings")
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def value_at(self, percentile):
+        if not self.total:
+            return 0
+        target = max(1, int(round(percentile / 100 * self.total)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._highest_equivalent(index), self.max)
+        return self.max
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0.0
+
+    def distribution(self, ticks_per_half=5):
+        """HdrHistogram-style percentile distribution: [(value, percentile, count at or below)]"""
+        rows = []
+        percentile = 0.0
+        while self.total:
+            count = max(1, round(percentile / 100 * self.total))
+            if count >= self.total:
+                break
+            rows.append((self.value_at(percentile), percentile, count))
+            # Each tick closes a fixed share of the distance to 100%, so the tail gets finer steps
+            percentile += (100 - percentile) / (2 * ticks_per_half)
+        rows.append((self.max, 100.0, self.total))
+        return rows
+
+def parse_request(spec):
+    """'METHOD PATH[@WEIGHT]' -> request entry, e.g. 'GET /health@3'"""
+    spec, _, weight = spec.partition("@")
+    method, _, path = spec.strip().partition(" ")
+    if not method or not path.startswith("/"):
+        raise LoadTestError(f"Invalid request '{spec}', expected 'METHOD /path[@weight]'")
+    return {"method": method.upper(), "path": path.strip(), "weight": float(weight or 1)}
+
+def load_mix(path):
+    """Request mix from a JSON list of {"method", "path", "weight", "headers", "body"}"""
+    with open(path) as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise LoadTestError(f"Request mix {path} must be a non-empty JSON list")
+    return entries
+
+def build_request(entry, host):
+    """Serialize a request once so the hot loop only writes bytes"""
+    body = entry.get("body", b"")
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body)
+    if isinstance(body, str):
+        body = body.encode()
+    headers = {"Host": host, "User-Agent": "load-test", "Accept": "*/*"}
+    if isinstance(entry.get("body"), (dict, list)):
+        headers["Content-Type"] = "application/json"
+    headers.update(entry.get("headers", {}))
+    if body or entry["method"] in ("POST", "PUT", "PATCH"):
+        headers["Content-Length"] = str(len(body))
+    head = f"{entry['method']} {entry['path']} HTTP/1.1\r\n"
+    head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    return (head + "\r\n").encode() + body
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection, opened on first use and reopened after errors"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, payload, head_only=False):
+        """Send pre-built request bytes; returns the status code"""
+        reused = self.writer is not None
+        if not reused:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        reader = self.reader
+        self.writer.write(payload)
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            # The server may close an idle keep-alive connection (worker recycled, keepalive
+            # expired) just as we reuse it; retry once on a fresh connection, as browsers do
+            self.close()
+            if not reused:
+                raise
+            return await self.request(payload, head_only)
+        status = int(head[9:12])
+        lower = head.lower()
+        if head_only or status in (204, 304) or 100 <= status < 200:
+            pass
+        elif b"\r\ntransfer-encoding: chunked" in lower:
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b"\r\n", b""):
+                        pass
+                    break
+                await reader.readexactly(size + 2)
+        else:
+            start = lower.find(b"\r\ncontent-length:")
+            if start >= 0:
+                end = lower.find(b"\r\n", start + 2)
+                await reader.readexactly(int(lower[start + 17:end]))
+            else:
+                await reader.read()
+                self.close()
+                return status
+        if b"\r\nconnection: close" in lower:
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+class Recorder:
+    """Corrected and uncorrected histograms per request name, plus status and error counts"""
+
+    def __init__(self, names, highest, significant_digits):
+        self.corrected = {name: Histogram(highest, significant_digits) for name in names}
+        self.uncorrected = {name: Histogram(highest, significant_digits) for name in names}
+        self.statuses = {}
+        self.errors = {}
+
+    def success(self, name, status, intended, sent, finished, expected_interval=None):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.corrected[name].record_corrected((finished - intended) * 1e6, expected_interval)
+        self.uncorrected[name].record((finished - sent) * 1e6)
+
+    def failure(self, error):
+        kind = type(error).__name__
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def merge(self, other):
+        for name in self.corrected:
+            self.corrected[name].merge(other.corrected[name])
+            self.uncorrected[name].merge(other.uncorrected[name])
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        for kind, count in other.errors.items():
+            self.errors[kind] = self.errors.get(kind, 0) + count
+
+class LoadTest:
+    """Drives one event loop's share of the load and records the results"""
+
+    def __init__(self, url, requests, mode="closed", connections=64, rate=None, duration=10, warmup=2,
+                 timeout=10, arrivals="uniform", expected_interval_ms=None, significant_digits=3, seed=None):
+        parts = urlsplit(url)
+        if parts.scheme != "http":
+            raise LoadTestError(f"Only http:// targets are supported, got {url}")
+        if mode == "open" and not rate:
+            raise LoadTestError("Open-loop mode needs a --rate")
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        prefix = parts.path.rstrip("/")
+        self.requests = requests
+        self.names = [f"{entry['method']} {entry['path']}" for entry in requests]
+        self.payloads = [build_request(dict(entry, path=prefix + entry["path"]), parts.netloc) for entry in requests]
+        self.head_only = [entry["method"] == "HEAD" for entry in requests]
+        self.weights = [float(entry.get("weight", 1)) for entry in requests]
+        self.mode = mode
+        self.connections = connections
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+        self.timeout = timeout
+        self.arrivals = arrivals
+        self.expected_interval = expected_interval_ms * 1000 if expected_interval_ms else None
+        self.random = random.Random(seed)
+        self.recorder = Recorder(self.names, int(max(timeout, 1) * 1e6) * 2, significant_digits)
+        self.completed = 0
+
+    def _choices(self, count):
+        return self.random.choices(range(len(self.requests)), self.weights, k=count)
+
+    async def _send(self, connection, choice, intended, expected_interval=None):
+        sent = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.timeout):
+                status = await connection.request(self.payloads[choice], self.head_only[choice])
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ValueError) as e:
+            connection.close()
+            if intended >= self.measure_from:
+                self.recorder.failure(e)
+            return
+        finished = time.perf_counter()
+        if intended >= self.measure_from:
+            self.completed += 1
+            self.recorder.success(self.names[choice], status, intended, sent, finished, expected_interval)
+
+    async def _closed_worker(self, interval):
+        connection = Connection(self.host, self.port)
+        # Stagger paced connections so they do not fire in lockstep
+        intended = time.perf_counter() + (self.random.random() * interval if interval else 0)
+        try:
+            while intended < self.deadline:
+                if interval:
+                    delay = intended - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                else:
+                    intended = time.perf_counter()
+                choice = self._choices(1)[0]
+                await self._send(connection, choice, intended, None if interval else self.expected_interval)
+                if interval:
+                    intended += interval
+        finally:
+            connection.close()
+
+    async def _open_request(self, pool, choice, intended):
+        # Waiting for a free connection counts towards latency: the request was due at `intended`
+        connection = await pool.get()
+        try:
+            await self._send(connection, choice, intended)
+        finally:
+            pool.put_nowait(connection)
+
+    async def _open_loop(self):
+        pool = asyncio.Queue()
+        for _ in range(self.connections):
+            pool.put_nowait(Connection(self.host, self.port))
+        pending = set()
+        intended = self.started
+        mean_gap = 1 / self.rate
+        batch = []
+        while intended < self.deadline:
+            now = time.perf_counter()
+            if intended > now:
+                await asyncio.sleep(intended - now)
+            if not batch:
+                batch = self._choices(1024)
+            task = asyncio.create_task(self._open_request(pool, batch.pop(), intended))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            intended += self.random.expovariate(self.rate) if self.arrivals == "poisson" else mean_gap
+        if pending:
+            await asyncio.wait(pending, timeout=self.timeout)
+        while not pool.empty():
+            pool.get_nowait().close()
+
+    async def run(self):
+        self.started = time.perf_counter()
+        self.measure_from = self.started + self.warmup
+        self.deadline = self.measure_from + self.duration
+        if self.mode == "open":
+            await self._open_loop()
+        else:
+            interval = self.connections / self.rate if self.rate else None
+            await asyncio.gather(*(self._closed_worker(interval) for _ in range(self.connections)))
+        return self.recorder
+
+def _run_share(options):
+    """Run one process's share of the load (ProcessPoolExecutor entry point)"""
+    raise_file_limit(options["connections"])
+    runner = asyncio.run
+    if importlib.util.find_spec("uvloop"):
+        import uvloop
+        runner = uvloop.run
+    return runner(LoadTest(**options).run())
+
+def raise_file_limit(connections):
+    """Thousands of sockets need more than the usual 1024 open files"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = connections + 256
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+def run_load(options, processes=1):
+    """Split the connections and rate over processes and merge their recorders"""
+    if processes <= 1:
+        return _run_share(options)
+    shares = []
+    for i in range(processes):
+        share = dict(options)
+        share["connections"] = options["connections"] // processes + (i < options["connections"] % processes)
+        if options.get("rate"):
+            share["rate"] = options["rate"] / processes
+        if options.get("seed") is not None:
+            share["seed"] = options["seed"] + i
+        shares.append(share)
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        recorders = list(pool.map(_run_share, shares))
+    merged = recorders[0]
+    for recorder in recorders[1:]:
+        merged.merge(recorder)
+    return merged
+
+def totals(histograms):
+    merged = None
+    for histogram in histograms.values():
+        if merged is None:
+            merged = Histogram(histogram.highest, histogram.significant_digits)
+        merged.merge(histogram)
+    return merged
+
+def histogram_stats(histogram, duration):
+    to_ms = 1e-3
+    return {
+        "p50_ms": histogram.value_at(50) * to_ms,
+        "p90_ms": histogram.value_at(90) * to_ms,
+        "p95_ms": histogram.value_at(95) * to_ms,
+        "p99_ms": histogram.value_at(99) * to_ms,
+        "p999_ms": histogram.value_at(99.9) * to_ms,
+        "mean_ms": histogram.mean() * to_ms,
+        "max_ms": histogram.max * to_ms,
+        "rps": histogram.total / duration if duration else 0.0,
+    }
+
+def summarize(recorder, options):
+    """Results document; "benchmarks" uses corrected latencies in the report generator's format"""
+    duration = options["duration"]
+    corrected = dict(recorder.corrected, total=totals(recorder.corrected))
+    uncorrected = dict(recorder.uncorrected, total=totals(recorder.uncorrected))
+    completed = sum(recorder.statuses.values())
+    failed = sum(recorder.errors.values())
+    return {
+        "benchmarks": {
+            f"load {name}": histogram_stats(histogram, duration)
+            for name, histogram in corrected.items() if histogram.total
+        },
+        "uncorrected": {
+            f"load {name}": histogram_stats(histogram, duration)
+            for name, histogram in uncorrected.items() if histogram.total
+        },
+        "load": {
+            "url": options["url"],
+            "mode": options["mode"],
+            "rate": options.get("rate"),
+            "connections": options["connections"],
+            "duration": duration,
+            "completed": completed,
+            "failed": failed,
+            "throughput": completed / duration if duration else 0.0,
+            "statuses": {str(status): count for status, count in sorted(recorder.statuses.items())},
+            "errors": recorder.errors,
+        },
+    }
+
+def report(results, histogram=None, percentiles=DEFAULT_PERCENTILES):
+    load = results["load"]
+    target = f"{load['rate']:g} req/s" if load["rate"] else "unpaced"
+    print(f"{load['mode']}-loop, {load['connections']} connections, {target}, {load['duration']:g}s against {load['url']}")
+    print(f"  {load['completed']} responses ({load['throughput']:.1f}/s), {load['failed']} errors")
+    print(f"  status codes: {', '.join(f'{status}={count}' for status, count in load['statuses'].items()) or '-'}")
+    for kind, count in load["errors"].items():
+        print(f"  {kind}: {count}")
+    header = "".join(f"{'p' + format(p, 'g'):>10}" for p in percentiles)
+    for title, key in (("Latency from intended send (corrected)", "corrected"), ("Service time (uncorrected)", "uncorrected")):
+        print(f"\n{title}, ms")
+        print(f"  {'request':<24}{header}{'max':>10}{'mean':>10}")
+        for name, row in histogram[key].items():
+            if not row.total:
+                continue
+            cells = "".join(f"{row.value_at(p) / 1000:>10.3f}" for p in percentiles)
+            print(f"  {name:<24}{cells}{row.max / 1000:>10.3f}{row.mean() / 1000:>10.3f}")
+
+def print_distribution(histogram):
+    print(f"\n{'Value(ms)':>12} {'Percentile':>14} {'TotalCount':>12} {'1/(1-Percentile)':>18}")
+    for value, percentile, count in histogram.distribution():
+        inverse = f"{1 / (1 - percentile / 100):>18.2f}" if percentile < 100 else f"{'inf':>18}"
+        print(f"{value / 1000:>12.3f} {percentile / 100:>14.12f} {count:>12} {inverse}")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def serve_locally(port, mode, timeout=30):
+    """Start serve.py on port and wait until /health answers"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, APP_PORT=str(port), SERVER_MODE=mode)
+    process = subprocess.Popen([sys.executable, "serve.py"], cwd=here, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        started = time.perf_counter()
+        while True:
+            if process.poll() is not None:
+                raise LoadTestError(f"serve.py exited with status {process.returncode}")
+            if time.perf_counter() - started > timeout:
+                raise LoadTestError(f"/health did not answer within {timeout}s")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", "/health")
+                if conn.getresponse().status == 200:
+                    break
+            except OSError:
+                pass
+            finally:
+                conn.close()
+            time.sleep(0.05)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate HTTP load against a running service")
+    parser.add_argument('--url', help='Target (default: http://127.0.0.1:$APP_PORT)')
+    parser.add_argument('--serve', choices=['production', 'async', 'development'],
+                        help='Start serve.py in this SERVER_MODE on APP_PORT (or a free port) for the run')
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed')
+    parser.add_argument('--connections', type=int, default=64, help='Concurrent keep-alive connections')
+    parser.add_argument('--rate', type=float, help='Target requests/s (required for open loop, paces closed loop)')
+    parser.add_argument('--arrivals', choices=['uniform', 'poisson'], default='uniform', help='Open-loop arrival spacing')
+    parser.add_argument('--duration', type=float, default=10, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=2, help='Seconds of load before measuring')
+    parser.add_argument('--timeout', type=float, default=10, help='Per-request timeout in seconds')
+    parser.add_argument('--request', action='append', help="'METHOD /path[@weight]', repeatable (default: 'GET /')")
+    parser.add_argument('--mix', help='JSON request mix file')
+    parser.add_argument('--expected-interval-ms', type=float,
+                        help='Correct unpaced closed-loop results for this expected interval')
+    parser.add_argument('--processes', type=int, default=1, help='Event loops in separate processes')
+    parser.add_argument('--significant-digits', type=int, default=3, choices=range(1, 6))
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--distribution', action='store_true', help='Print the full corrected percentile distribution')
+    parser.add_argument('--output', help='Write results JSON here (e.g. tests/test-reports/benchmark-load.json)')
+
+    args = parser.parse_args()
+    try:
+        if args.mix:
+            requests = load_mix(args.mix)
+        else:
+            requests = [parse_request(spec) for spec in args.request or ["GET /"]]
+        options = {
+            "requests": requests, "mode": args.mode, "connections": args.connections, "rate": args.rate,
+            "duration": args.duration, "warmup": args.warmup, "timeout": args.timeout,
+            "arrivals": args.arrivals, "expected_interval_ms": args.expected_interval_ms,
+            "significant_digits": args.significant_digits, "seed": args.seed,
+        }
+        if args.connections < args.processes:
+            raise ValueError("--connections must be at least --processes")
+
+        if args.serve:
+            port = int(os.getenv("APP_PORT") or free_port())
+            with serve_locally(port, args.serve) as url:
+                options["url"] = url
+                recorder = run_load(options, args.processes)
+        else:
+            options["url"] = args.url or f"http://127.0.0.1:{os.getenv('APP_PORT', 5000)}"
+            recorder = run_load(options, args.processes)
+
+        results = summarize(recorder, options)
+        histograms = {
+            "corrected": dict(recorder.corrected, total=totals(recorder.corrected)),
+            "uncorrected": dict(recorder.uncorrected, total=totals(recorder.uncorrected)),
+        }
+        report(results, histograms)
+        if args.distribution:
+            print_distribution(histograms["corrected"]["total"])
+        if args.output:
+            directory = os.path.dirname(args.output)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import fcntl
+import bisect
+import tempfile
+import threading
+from contextlib import contextmanager
+from flask import request
+
+# Request metrics for app.py, exposed at /metrics in Prometheus text format.
+#
+# Every thread records into its own shard, so the request path takes no
+# locks. When METRICS_DIR is set (gunicorn.conf.py sets it), each worker
+# process also saves its totals there every METRICS_FLUSH_INTERVAL seconds
+# and /metrics adds up the files of all workers. Workers that exit are
+# folded into a single retired.json (gunicorn.conf.py calls retire() from
+# worker_exit), as are files left by workers that died without retiring,
+# so counters never go backwards and the directory does not grow.
+
+# Latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+RETIRED_FILE = "retired.json"
+
+class _Shard:
+    """Counters written by a single thread"""
+    __slots__ = ("active", "start", "started", "finished", "requests", "latency")
+
+    def __init__(self):
+        # A thread handles one request at a time, so its start time lives here
+        self.active = False
+        self.start = 0.0
+        self.started = 0
+        self.finished = 0
+        # (route, method, status) -> [count, response bytes]
+        self.requests = {}
+        # (route, method) -> [bucket counts..., +Inf count, sum of seconds]
+        self.latency = {}
+
+def _merge(totals, snapshot):
+    totals["in_flight"] += snapshot["in_flight"]
+    for key, values in snapshot["requests"].items():
+        current = totals["requests"].setdefault(key, [0, 0])
+        current[0] += values[0]
+        current[1] += values[1]
+    for key, values in snapshot["latency"].items():
+        current = totals["latency"].setdefault(key, [0] * (len(BUCKETS) + 2))
+        for i, value in enumerate(values):
+            current[i] += value
+
+def _labels(**labels):
+    return ",".join(f'{name}="{value}"' for name, value in labels.items())
+
+class RequestMetrics:
+    """Per-route latency, status, size and in-flight metrics for a Flask app"""
+
+    def __init__(self, app=None, directory=None):
+        self.directory = directory if directory is not None else os.getenv("METRICS_DIR")
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._flusher_pid = None
+        # Tells this process's worker file from one left by an earlier process with the same pid
+        self._token = None
+        self._token_pid = None
+        self._retired = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before)
+        app.after_request(self._after)
+        app.teardown_request(self._teardown)
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            # Only taken once per thread
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._ensure_flusher()
+        return shard
+
+    def _before(self):
+        shard = self._shard()
+        shard.started += 1
+        shard.active = True
+        shard.start = time.perf_counter()
+
+    def _after(self, response):
+        shard = self._shard()
+        elapsed = time.perf_counter() - shard.start
+        rule = request.url_rule
+        # Unmatched paths share one label so 404 scans cannot blow up cardinality
+        route = rule.rule if rule is not None else "<unmatched>"
+        key = (route, request.method, response.status_code)
+        counts = shard.requests.get(key)
+        if counts is None:
+            counts = shard.requests[key] = [0, 0]
+        counts[0] += 1
+        # Buffered bodies are a list of chunks; streamed sizes are not known up front
+        body = response.response
+        if isinstance(body, list):
+            counts[1] += sum(map(len, body))
+        histogram = shard.latency.get(key[:2])
+        if histogram is None:
+            histogram = shard.latency[key[:2]] = [0] * (len(BUCKETS) + 2)
+        histogram[bisect.bisect_left(BUCKETS, elapsed)] += 1
+        histogram[-1] += elapsed
+        return response
+
+    def _teardown(self, exc):
+        shard = self._shard()
+        if shard.active:
+            shard.active = False
+            shard.finished += 1
+
+    def snapshot(self):
+        """This process's totals, keyed by JSON-friendly strings"""
+        with self._shards_lock:
+            shards = list(self._shards)
+        totals = {"pid": os.getpid(), "in_flight": 0, "requests": {}, "latency": {}}
+        for shard in shards:
+            _merge(totals, {
+                "in_flight": shard.started - shard.finished,
+                "requests": {"\t".join(map(str, key)): list(values) for key, values in list(shard.requests.items())},
+                "latency": {"\t".join(key): list(values) for key, values in list(shard.latency.items())},
+            })
+        return totals
+
+    def _ensure_flusher(self):
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def _process_token(self):
+        if self._token_pid != os.getpid():
+            self._token_pid = os.getpid()
+            self._token = f"{os.getpid()}-{time.time_ns()}"
+            self._retired = False
+        return self._token
+
+    def _worker_file(self, pid=None):
+        return os.path.join(self.directory, f"worker-{pid or os.getpid()}.json")
+
+    @contextmanager
+    def _locked(self):
+        """Hold the metrics directory lock, which guards retired.json and folding"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, ".lock"), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, name, data):
+        temp_fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".metrics-")
+        with os.fdopen(temp_fd, 'w') as temp_file:
+            json.dump(data, temp_file)
+        os.replace(temp_path, os.path.join(self.directory, name))
+
+    def _fold(self, path, snapshot):
+        """Add snapshot to retired.json and delete the worker file at path; the lock must be held"""
+        retired = self._read(os.path.join(self.directory, RETIRED_FILE)) or {"in_flight": 0, "requests": {}, "latency": {}}
+        # Counters of exited workers still count; their in-flight requests do not
+        _merge(retired, dict(snapshot, in_flight=0))
+        self._write(RETIRED_FILE, retired)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _is_stale(self, snapshot):
+        """Whether a worker file belongs to a process that is gone"""
+        if snapshot.get("pid") == os.getpid():
+            return snapshot.get("token") != self._process_token()
+        try:
+            os.kill(snapshot["pid"], 0)
+        except (OSError, KeyError, TypeError):
+            return True
+        return False
+
+    def flush(self):
+        """Save this worker's totals for the other workers' /metrics"""
+        token = self._process_token()
+        if self._retired:
+            return
+        snapshot = dict(self.snapshot(), token=token)
+        with self._locked():
+            # retire() may have folded this worker's totals while the snapshot was taken
+            if self._retired:
+                return
+            path = self._worker_file()
+            previous = self._read(path)
+            if previous is not None and previous.get("token") != token:
+                # A worker with the same pid died without retiring; keep its counts
+                self._fold(path, previous)
+            self._write(os.path.basename(path), snapshot)
+
+    def retire(self):
+        """Fold this worker's final totals into retired.json; called as the worker exits"""
+        if not self.directory:
+            return
+        self._process_token()
+        with self._locked():
+            path = self._worker_file()
+            previous = self._read(path)
+            if previous is not None and previous.get("token") != self._token:
+                self._fold(path, previous)
+            self._fold(path, self.snapshot())
+            # The periodic flush must not write the file back
+            self._retired = True
+
+    def collect(self):
+        """Totals across all workers: this one live, the others as last saved, plus retired workers"""
+        totals = {"in_flight": 0, "requests": {}, "latency": {}}
+        _merge(totals, self.snapshot())
+        if not self.directory or not os.path.isdir(self.directory):
+            return totals
+        # Under the lock no worker is folded while its file and retired.json are being read
+        with self._locked():
+            live = []
+            for name in sorted(os.listdir(self.directory)):
+                if not name.startswith("worker-"):
+                    continue
+                path = os.path.join(self.directory, name)
+                snapshot = self._read(path)
+                if snapshot is None:
+                    continue
+                if self._is_stale(snapshot):
+                    self._fold(path, snapshot)
+                elif snapshot.get("pid") != os.getpid():
+                    live.append(snapshot)
+            retired = self._read(os.path.join(self.directory, RETIRED_FILE))
+        for snapshot in live + ([retired] if retired else []):
+            _merge(totals, snapshot)
+        return totals
+
+    def render(self):
+        """Prometheus text exposition of collect()"""
+        totals = self.collect()
+        lines = [
+            "# HELP app_requests_in_flight Requests currently being handled",
+            "# TYPE app_requests_in_flight gauge",
+            f"app_requests_in_flight {totals['in_flight']}",
+            "# HELP app_requests_total Requests handled, by route, method and status",
+            "# TYPE app_requests_total counter",
+        ]
+        for key, (count, _) in sorted(totals["requests"].items()):
+            route, method, status = key.split("\t")
+            lines.append(f"app_requests_total{{{_labels(route=route, method=method, status=status)}}} {count}")
+        lines += [
+            "# HELP app_response_bytes_total Response body bytes sent, by route, method and status",
+            "# TYPE app_response_bytes_total counter",
+        ]
+        for key, (_, size) in sorted(totals["requests"].items()):
+            route, method, status = key.split("\t")
+            lines.append(f"app_response_bytes_total{{{_labels(route=route, method=method, status=status)}}} {size}")
+        lines += [
+            "# HELP app_request_duration_seconds Request handling time, by route and method",
+            "# TYPE app_request_duration_seconds histogram",
+        ]
+        for key, values in sorted(totals["latency"].items()):
+            route, method = key.split("\t")
+            labels = _labels(route=route, method=method)
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), values[:-1]):
+                cumulative += count
+                lines.append(f'app_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"app_request_duration_seconds_sum{{{labels}}} {values[-1]:.6f}")
+            lines.append(f"app_request_duration_seconds_count{{{labels}}} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+def benchmark(requests=20000, rounds=5):
+    """Print the per-request cost of the metrics hooks.
+
+    Reports the hooks alone and the end-to-end difference through the test
+    client, taking the best of several interleaved rounds to damp noise.
+    """
+    from flask import Flask
+
+    def build(instrumented):
+        app = Flask(__name__)
+        app.add_url_rule("/health", "health", lambda: "ok")
+        metrics = RequestMetrics(app, directory="") if instrumented else None
+        return app, metrics
+
+    app, metrics = build(True)
+    with app.test_request_context("/health"):
+        response = app.make_response("ok")
+        started = time.perf_counter_ns()
+        for _ in range(requests):
+            metrics._before()
+            metrics._after(response)
+            metrics._teardown(None)
+        hooks = (time.perf_counter_ns() - started) / requests / 1000
+
+    clients = {instrumented: build(instrumented)[0].test_client() for instrumented in (False, True)}
+    best = {False: float("inf"), True: float("inf")}
+    for _ in range(rounds):
+        for instrumented, client in clients.items():
+            started = time.perf_counter_ns()
+            for _ in range(requests // rounds):
+                client.get("/health")
+            elapsed = (time.perf_counter_ns() - started) / (requests // rounds) / 1000
+            best[instrumented] = min(best[instrumented], elapsed)
+    print(f"hooks alone:  {hooks:.2f} us/request")
+    print(f"baseline:     {best[False]:.1f} us/request")
+    print(f"instrumented: {best[True]:.1f} us/request")
+    print(f"overhead:     {best[True] - best[False]:.1f} us/request")
+
+if __name__ == '__main__':
+    benchmark()
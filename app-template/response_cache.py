@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import importlib.util
+from functools import wraps
+from collections import OrderedDict
+from flask import Response, make_response, request
+from werkzeug.http import is_hop_by_hop_header, parse_set_header
+
+# Response cache for read-heavy Flask routes.
+#
+#   response_cache = ResponseCache()
+#
+#   @app.route('/quotes')
+#   @response_cache.cached(ttl=30)
+#   def quotes():
+#       ...
+#
+# Hits return the stored body without running the view or serializing
+# anything, and answer If-None-Match with 304. Entries live in a bounded
+# in-process LRU and, when REDIS_HOST is set and reachable, are shared
+# through Redis between workers and containers.
+#
+# The view's own headers are replayed on hits, except hop-by-hop ones and
+# those rebuilt from the entry. Responses that set cookies are never cached,
+# and a response with Vary is stored per value of the varied request headers.
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 1024))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 16 * 1024 * 1024))
+# Seconds to stop asking Redis after it fails, so an outage costs one timeout
+REDIS_RETRY_AFTER = float(os.getenv("CACHE_REDIS_RETRY_AFTER", 30))
+# Rebuilt from the entry in respond(), so never stored
+REBUILT_HEADERS = {"content-length", "content-type", "etag", "cache-control"}
+
+class CachedResponse:
+    __slots__ = ("body", "status", "mimetype", "etag", "expires_at", "headers", "vary")
+
+    def __init__(self, body, status, mimetype, etag, expires_at, headers=(), vary=()):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.etag = etag
+        self.expires_at = expires_at
+        self.headers = [tuple(header) for header in headers]
+        # Request headers named by the view's Vary; the entry under the plain key only records these
+        self.vary = list(vary)
+
+    def dumps(self):
+        header = json.dumps([self.status, self.mimetype, self.etag, self.expires_at, self.headers, self.vary])
+        return header.encode() + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, data):
+        header, _, body = data.partition(b"\n")
+        return cls(body, *json.loads(header))
+
+class LRUStore:
+    """In-process entries bounded by count and total body size"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        if len(entry.body) > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = entry
+            self.size += len(entry.body)
+            while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        self.size -= len(self.entries.pop(key).body)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+class RedisStore:
+    """Entries shared through Redis; any error disables it for a while"""
+
+    def __init__(self, host, port=6379, prefix="response-cache:"):
+        self.host = host
+        self.port = port
+        self.prefix = prefix
+        self.retry_at = 0.0
+        self._client = None
+
+    @property
+    def client(self):
+        # redis is imported on first use; it costs more start-up time than the rest of the app
+        if self._client is None:
+            import redis
+            self._client = redis.Redis(host=self.host, port=self.port, socket_timeout=0.1, socket_connect_timeout=0.1)
+        return self._client
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.retry_at
+
+    def _failed(self):
+        self.retry_at = time.monotonic() + REDIS_RETRY_AFTER
+
+    def get(self, key):
+        try:
+            data = self.client.get(self.prefix + key)
+        except Exception:
+            self._failed()
+            return None
+        return CachedResponse.loads(data) if data is not None else None
+
+    def set(self, key, entry, ttl):
+        try:
+            self.client.set(self.prefix + key, entry.dumps(), px=max(1, int(ttl * 1000)))
+        except Exception:
+            self._failed()
+
+def default_shared_store():
+    """A RedisStore for REDIS_HOST, or None to stay in-process"""
+    host = os.getenv("REDIS_HOST")
+    if not host or os.getenv("CACHE_BACKEND", "redis") != "redis" or importlib.util.find_spec("redis") is None:
+        return None
+    return RedisStore(host, int(os.getenv("REDIS_PORT", 6379)))
+
+class ResponseCache:
+    """Decorator-based cache of successful GET/HEAD responses"""
+
+    def __init__(self, local=None, shared=None):
+        self.local = local or LRUStore()
+        self.shared = shared
+
+    @classmethod
+    def from_env(cls):
+        return cls(shared=default_shared_store())
+
+    def lookup(self, key):
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None and self.shared.available:
+            entry = self.shared.get(key)
+            if entry is not None and entry.expires_at > time.time():
+                self.local.set(key, entry)
+            else:
+                entry = None
+        return entry
+
+    def _set(self, key, entry, ttl):
+        self.local.set(key, entry)
+        if self.shared is not None and self.shared.available:
+            self.shared.set(key, entry, ttl)
+
+    @staticmethod
+    def variant_key(key, vary):
+        """The key of the entry for this request's values of the varied headers"""
+        values = json.dumps([request.headers.get(name, "") for name in vary])
+        return f"{key}:vary:{hashlib.sha1(values.encode()).hexdigest()}"
+
+    @staticmethod
+    def cacheable(response):
+        return (response.status_code == 200 and not response.is_streamed
+                and "Set-Cookie" not in response.headers
+                and "*" not in parse_set_header(response.headers.get("Vary")))
+
+    def store(self, key, response, ttl):
+        body = response.get_data()
+        etag = hashlib.sha1(body).hexdigest()
+        headers = [
+            (name, value) for name, value in response.headers.items()
+            if name.lower() not in REBUILT_HEADERS and not is_hop_by_hop_header(name)
+        ]
+        vary = sorted({name.lower() for name in parse_set_header(response.headers.get("Vary"))})
+        entry = CachedResponse(body, response.status_code, response.mimetype, etag, time.time() + ttl, headers)
+        if vary:
+            self._set(key, CachedResponse(b"", 200, None, None, entry.expires_at, vary=vary), ttl)
+            key = self.variant_key(key, vary)
+        self._set(key, entry, ttl)
+        return entry
+
+    @staticmethod
+    def respond(entry, ttl):
+        headers = {"ETag": f'"{entry.etag}"', "Cache-Control": f"max-age={max(0, int(ttl))}"}
+        if request.if_none_match.contains_weak(entry.etag):
+            return Response(status=304, headers=headers)
+        return Response(entry.body, entry.status, headers=entry.headers + list(headers.items()),
+                        mimetype=entry.mimetype)
+
+    def cached(self, ttl=60, key_prefix=None):
+        """Cache a view's 200 responses for ttl seconds, keyed by path, query string and Vary"""
+        def decorator(view):
+            prefix = key_prefix or view.__name__
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method not in ("GET", "HEAD"):
+                    return view(*args, **kwargs)
+                key = f"{prefix}:{request.full_path}"
+                entry = self.lookup(key)
+                if entry is not None and entry.vary:
+                    entry = self.lookup(self.variant_key(key, entry.vary))
+                if entry is None:
+                    response = make_response(view(*args, **kwargs))
+                    if not self.cacheable(response):
+                        return response
+                    entry = self.store(key, response, ttl)
+                return self.respond(entry, entry.expires_at - time.time())
+            return wrapper
+        return decorator
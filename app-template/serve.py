@@ -0,0 +1,25 @@
+import os
+import sys
+
+# Container entry point, run directly by the Dockerfile's CMD without a shell.
+# SERVER_MODE picks the server: production (gunicorn, default), async
+# (async_app.py under uvicorn) or development (Flask development server).
+
+def main():
+    mode = os.getenv("SERVER_MODE", "production")
+    port = int(os.getenv("APP_PORT", 5000))
+    if mode == "development":
+        from app import app
+        app.run(host='0.0.0.0', port=port)
+    elif mode == "async":
+        import uvicorn
+        uvicorn.run("async_app:app", host='0.0.0.0', port=port,
+                    workers=int(os.getenv("UVICORN_WORKERS", 1)),
+                    limit_concurrency=int(os.getenv("UVICORN_LIMIT_CONCURRENCY", 4096)))
+    else:
+        from gunicorn.app.wsgiapp import run
+        sys.argv = ["gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+        run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import http.client
+
+# Measures how fast the app starts:
+#   import time             - cumulative time to import app.py (python -X importtime)
+#   time to first healthy   - from starting serve.py until /health answers 200
+#
+# Usage: python startup_benchmark.py [--runs 5] [--mode production|async|development]
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def import_time_ms(module="app"):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=HERE, capture_output=True, text=True, check=True)
+    for line in reversed(result.stderr.splitlines()):
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def first_healthy_ms(mode, timeout=30):
+    port = free_port()
+    env = dict(os.environ, APP_PORT=str(port), SERVER_MODE=mode)
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "serve.py"], cwd=HERE, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"serve.py exited with status {process.returncode}")
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                conn.request("GET", "/health")
+                if conn.getresponse().status == 200:
+                    return (time.perf_counter() - started) * 1000
+            except OSError:
+                pass
+            finally:
+                conn.close()
+            time.sleep(0.005)
+        raise RuntimeError(f"/health did not answer within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait()
+
+def summarize(samples):
+    return {
+        "min": round(min(samples), 1),
+        "median": round(statistics.median(samples), 1),
+        "max": round(max(samples), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app start-up time")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--mode', default=os.getenv("SERVER_MODE", "production"))
+    parser.add_argument('--module', default="app", help='Module whose import time is measured')
+    args = parser.parse_args()
+
+    imports = [import_time_ms(args.module) for _ in range(args.runs)]
+    healthy = [first_healthy_ms(args.mode) for _ in range(args.runs)]
+    print(json.dumps({
+        "mode": args.mode,
+        "runs": args.runs,
+        "import_ms": summarize(imports),
+        "first_healthy_ms": summarize(healthy),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
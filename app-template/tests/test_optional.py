@@ -23,113 +23,46 @@ Testing Concepts Covered:
 5. Documentation verification
 """
 
+import os
 import pytest
 import time
 from datetime import datetime
 
-"""
-# Example 1: Performance Test
-# -------------------------
-# When to uncomment: When you want to optimize response times
-# What to modify: The performance thresholds for your feature
+from benchmark import BENCHMARK_STEP, BaselineStore, endpoint_cases, run_all, under_coverage, write_results
 
-def test_trade_performance():
-    '''
-    Purpose: Ensure trading operations are fast enough
-    What it does:
-    1. Measures operation time
-    2. Compares against threshold
-    3. Reports detailed timing
-    
-    This helps identify slow operations
-    '''
-    # Performance thresholds (in seconds)
-    ACCEPTABLE_TIME = 0.1
-    OPTIMAL_TIME = 0.05
-    
-    # Start timing
-    start_time = time.time()
-    
-    # Perform operation (example: create trade)
-    trade_data = {
-        "symbol": "AAPL",
-        "amount": 100,
-        "type": "BUY",
-        "price": 150.50
-    }
-    
-    # Your trade creation code here
-    # create_trade(trade_data)
-    
-    # Calculate execution time
-    execution_time = time.time() - start_time
-    
-    # Performance assertions
-    if execution_time > ACCEPTABLE_TIME:
-        print(f"⚠️ Warning: Operation took {execution_time:.3f}s (Above acceptable {ACCEPTABLE_TIME}s)")
-    elif execution_time > OPTIMAL_TIME:
-        print(f"📊 Note: Operation took {execution_time:.3f}s (Above optimal {OPTIMAL_TIME}s)")
-    else:
-        print(f"✅ Operation completed in {execution_time:.3f}s")
-
-# Example 2: Load Test
-# ------------------
-# When to uncomment: When testing system capacity
-# What to modify: The load parameters for your feature
+REPORTS_DIR = os.path.join(os.path.dirname(__file__), "test-reports")
 
-def test_concurrent_trades(client):
-    '''
-    Purpose: Test system behavior under load
+@pytest.mark.skipif(BENCHMARK_STEP, reason="benchmark.py runs in its own CI step")
+@pytest.mark.skipif(under_coverage(), reason="timings under coverage are not comparable; run benchmark.py instead")
+def test_endpoint_benchmarks(client):
+    """
+    Endpoint Benchmarks (ENABLED)
+    ----------------
+    Purpose: Track how fast the template's routes answer
     What it does:
-    1. Simulates multiple concurrent trades
-    2. Measures system response
-    3. Checks for errors
-    
-    This helps understand system capacity
-    '''
-    import threading
-    
-    # Test parameters
-    NUM_CONCURRENT_TRADES = 10
-    TRADE_DELAY = 0.1  # seconds between trades
-    
-    # Track results
-    successful_trades = 0
-    failed_trades = 0
-    
-    def make_trade():
-        nonlocal successful_trades, failed_trades
-        try:
-            response = client.post('/api/trades', json={
-                "symbol": "AAPL",
-                "amount": 100,
-                "type": "BUY"
-            })
-            if response.status_code == 201:
-                successful_trades += 1
-            else:
-                failed_trades += 1
-        except Exception:
-            failed_trades += 1
-    
-    # Create and run threads
-    threads = []
-    for _ in range(NUM_CONCURRENT_TRADES):
-        t = threading.Thread(target=make_trade)
-        threads.append(t)
-        t.start()
-        time.sleep(TRADE_DELAY)
-    
-    # Wait for all trades to complete
-    for t in threads:
-        t.join()
-    
-    # Report results
-    print(f"Successful trades: {successful_trades}")
-    print(f"Failed trades: {failed_trades}")
-    print(f"Success rate: {(successful_trades/NUM_CONCURRENT_TRADES)*100:.1f}%")
+    1. Calibrates, warms up and times GET / and GET /health (see benchmark.py)
+    2. Writes p50/p95/p99 and requests/s to test-reports/benchmark-optional.json
+    3. Fails if a route got slower than its branch baseline on the same
+       runner class by more than BENCHMARK_THRESHOLD (25% by default)
+
+    Skipped under coverage, which slows every call, and in CI, which runs
+    benchmark.py in its own step instead (BENCHMARK_STEP=true).
 
-# Example 3: User Experience Test
+    Add your own routes to endpoint_cases() in benchmark.py.
+    """
+    results = run_all(endpoint_cases(client), rounds=3)
+    # CI creates test-reports/; local runs only print
+    if os.path.isdir(REPORTS_DIR):
+        write_results(results, os.path.join(REPORTS_DIR, "benchmark-optional.json"))
+    for name, stats in results["benchmarks"].items():
+        print(f"{name}: p50 {stats['p50_ms']:.3f}ms, p99 {stats['p99_ms']:.3f}ms, {stats['rps']:.0f} req/s")
+
+    source, regressions = BaselineStore().compare(results)
+    assert not regressions, "Slower than the {} baseline: {}".format(
+        source, ", ".join(f"{item['name']} {item['change']:+.0%}" for item in regressions))
+
+"""
+# Example 1: User Experience Test
 # ---------------------------
 # When to uncomment: When improving user interaction
 # What to modify: The UX requirements for your feature
@@ -171,7 +104,7 @@ def test_trade_feedback(client):
         assert len(response.json['message']) >= 10, f"Message too short in {case['scenario']}"
         assert response.json['message'] == case['expected_message'], f"Unclear message in {case['scenario']}"
 
-# Example 4: Advanced Error Recovery
+# Example 2: Advanced Error Recovery
 # ------------------------------
 # When to uncomment: When implementing robust error handling
 # What to modify: The recovery scenarios for your feature
@@ -231,4 +164,6 @@ def test_trade_recovery(client):
 # - Set realistic thresholds
 # - Consider real-world conditions
 # - Focus on user experience
-# - Test recovery scenarios
\ No newline at end of file
+# - Test recovery scenarios
+# - Load test the real server, not the test client: start it with
+#   `python load_test.py --serve production ...` (see load_test.py)
\ No newline at end of file
@@ -12,7 +12,7 @@ When to Use Recommended Tests:
 3. When improving error handling
 4. When working with multiple components
 
-All examples are commented out by default - uncomment them as you implement features.
+The JSON provider test is enabled; the examples are commented out - uncomment them as you implement features.
 
 Testing Concepts Covered:
 ----------------------
@@ -24,7 +24,36 @@ Testing Concepts Covered:
 """
 
 import pytest
-from datetime import datetime
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from flask.json.provider import DefaultJSONProvider
+
+from app import app
+
+@dataclass
+class Quote:
+    symbol: str
+    quoted_at: datetime
+
+def test_json_provider_matches_default():
+    """
+    JSON Provider Test (ENABLED)
+    ----------------
+    Purpose: Make sure the faster JSON provider installed by fast_json.py
+    sends the same bodies as Flask's default provider
+    What it does: Renders dates, datetimes and dataclasses with both providers
+    and compares the responses byte for byte
+    """
+    data = {
+        "quoted_at": datetime(2024, 5, 17, 14, 30, 5, tzinfo=timezone.utc),
+        "naive": datetime(2024, 5, 17, 14, 30, 5),
+        "day": date(2024, 5, 17),
+        "quote": Quote("AAPL", datetime(2024, 5, 17, 9, 0, tzinfo=timezone.utc)),
+        "amount": 100,
+    }
+    expected = DefaultJSONProvider(app)
+    assert app.json.response(data).get_data() == expected.response(data).get_data()
+    assert app.json.loads(app.json.dumps(data)) == expected.loads(expected.dumps(data))
 
 """
 # Example 1: Integration Test
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import tempfile
+import argparse
+from pathlib import Path
+
+# Keys written for every environment, in file order
+RENDERED_KEYS = (
+    "APP_NAME", "APP_IMAGE", "APP_PORT", "VIRTUAL_HOST", "VIRTUAL_PORT", "REDIS_HOST",
+    "ENABLE_SSL", "APP_VERSION", "APP_COMMIT", "BUILD_TIMESTAMP", "ENVIRONMENT",
+)
+
+class EnvFileError(Exception):
+    """Custom exception for .env file errors."""
+    pass
+
+def _unquote(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+        if value[0] == '"':
+            # Written by format_value with JSON escapes
+            try:
+                return json.loads(value)
+            except ValueError:
+                pass
+        return value[1:-1]
+    # Unquoted values may carry a trailing comment
+    return value.split(" #", 1)[0].rstrip()
+
+def parse_env(text):
+    """Parse .env text into an ordered {key: value} dict."""
+    values = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("export "):
+            line = line[len("export "):]
+        key, sep, value = line.partition("=")
+        if sep and key.strip():
+            values[key.strip()] = _unquote(value)
+    return values
+
+def format_value(value):
+    value = str(value)
+    if value and (value[0].isspace() or value[-1].isspace() or value[0] in "'\"" or "#" in value or "\n" in value):
+        return json.dumps(value)
+    return value
+
+def render_env(values):
+    """Render a {key: value} dict as .env text."""
+    return "".join(f"{key}={format_value(value)}\n" for key, value in values.items())
+
+def update_env(text, updates):
+    """Set KEY=value lines in .env text, keeping comments and order, appending missing keys."""
+    remaining = dict(updates)
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped.startswith("#") or "=" not in stripped:
+            continue
+        key = stripped.partition("=")[0].strip()
+        if key.startswith("export "):
+            key = key[len("export "):].strip()
+        if key in remaining:
+            lines[i] = f"{key}={format_value(remaining.pop(key))}"
+    lines.extend(f"{key}={format_value(value)}" for key, value in remaining.items())
+    return "\n".join(lines) + "\n"
+
+class EnvFileCache:
+    """Parsed .env files, reused while the file's mtime and size are unchanged."""
+
+    def __init__(self):
+        self._entries = {}
+
+    def read(self, path):
+        """Return (text, values) for path, or (None, {}) if it does not exist."""
+        path = str(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self._entries.pop(path, None)
+            return None, {}
+        key = (st.st_mtime_ns, st.st_size)
+        entry = self._entries.get(path)
+        if entry is None or entry[0] != key:
+            with open(path, 'r') as f:
+                text = f.read()
+            entry = (key, text, parse_env(text))
+            self._entries[path] = entry
+        return entry[1], dict(entry[2])
+
+    def write(self, path, text):
+        """Atomically replace path with text; returns False if it already had it."""
+        path = Path(path)
+        if self.read(path)[0] == text:
+            return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=".env.")
+        try:
+            with os.fdopen(temp_fd, 'w') as temp_file:
+                temp_file.write(text)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return True
+
+_cache = EnvFileCache()
+
+def read_env(path):
+    """Return the parsed values of a .env file, using the shared mtime-keyed cache."""
+    return _cache.read(path)[1]
+
+class EnvRenderer:
+    """Renders environment .env files from ports.json and the tracking data.
+
+    Port assignments and tracking data are loaded once per renderer, so
+    regenerating every environment is a single pass over the environments
+    directory with one write per file whose content actually changes.
+    """
+
+    def __init__(self, workspace_root=".", ports_file="ports.json", domain="emerginary.com",
+                 image_repository="rohittru/microservicecicdtest", redis_host="redis",
+                 port_manager=None, environment_manager=None, cache=None):
+        self.workspace_root = Path(workspace_root)
+        self.ports_file = ports_file
+        self.domain = domain
+        self.image_repository = image_repository
+        self.redis_host = redis_host
+        self.cache = cache or _cache
+        self._port_manager = port_manager
+        self._environment_manager = environment_manager
+        self._assignments = None
+
+    @property
+    def assignments(self):
+        """{env: {"<microservice>/<branch>": port}}, read once"""
+        if self._assignments is None:
+            if self._port_manager is None:
+                from port_manager import PortManager
+                self._port_manager = PortManager(self.ports_file)
+            self._assignments = self._port_manager.list_assignments()
+        return self._assignments
+
+    @property
+    def environment_manager(self):
+        if self._environment_manager is None:
+            from environment_manager import EnvironmentManager
+            self._environment_manager = EnvironmentManager(self.workspace_root)
+        return self._environment_manager
+
+    def config(self, environment, branch, microservice, port=None, existing=None, overrides=None):
+        """Return the ordered .env values for one branch of a microservice.
+
+        Keys not derived here (build metadata, custom settings) are carried
+        over from existing; overrides are applied last.
+        """
+        values = dict(existing or {})
+        values.update(overrides or {})
+        if port is None:
+            port = self.assignments.get(environment, {}).get(f"{microservice}/{branch}")
+        if port is None:
+            port = values.get("APP_PORT")
+        if port is None:
+            raise EnvFileError(f"No port assigned to {microservice}/{branch} in {environment}")
+        # Staging always runs the latest build of its image
+        version = "latest" if environment == "staging" else values.get("APP_VERSION") or "latest"
+        derived = {
+            "APP_NAME": f"{microservice}_{branch}",
+            "APP_IMAGE": f"{self.image_repository}_{branch}:{version}",
+            "APP_PORT": port,
+            "VIRTUAL_HOST": f"{branch}.{self.domain}",
+            "VIRTUAL_PORT": port,
+            "REDIS_HOST": values.get("REDIS_HOST", self.redis_host),
+            "ENABLE_SSL": values.get("ENABLE_SSL", "false"),
+            "ENVIRONMENT": environment,
+        }
+        config = {key: derived.get(key, values.get(key)) for key in RENDERED_KEYS}
+        config = {key: value for key, value in config.items() if value is not None}
+        for key, value in values.items():
+            config.setdefault(key, value)
+        config.update(overrides or {})
+        return config
+
+    def identify(self, env_path, existing):
+        """Work out (environment, branch, microservice) for an environment directory.
+
+        Returns None when neither the tracking data nor the directory's own
+        APP_NAME says what it holds, e.g. a feature branch's copy under
+        staging in a job without its tracking data.
+        """
+        env_path = Path(env_path)
+        environment, name = env_path.parent.name, env_path.name
+        tracked = self.environment_manager.get_record("feature_branches", name)
+        if tracked is not None:
+            return environment, name, tracked["microservice"]
+        app_name = existing.get("APP_NAME", "")
+        if environment == "development":
+            microservice = app_name.partition("_")[0]
+            if not microservice:
+                return None
+            return environment, name, microservice
+        # Shared staging/production directories are named after the microservice
+        # and their APP_NAME is "<microservice>_<branch>"
+        if not app_name.startswith(f"{name}_"):
+            return None
+        if environment == "staging":
+            return environment, "staging", name
+        return environment, app_name[len(name) + 1:], name
+
+    def environment_paths(self, environments=None):
+        for env_dir in sorted(self.workspace_root.joinpath("environments").iterdir()):
+            if env_dir.name.startswith(".") or not env_dir.is_dir():
+                continue
+            if environments and env_dir.name not in environments:
+                continue
+            for env_path in sorted(env_dir.iterdir()):
+                if env_path.is_dir() and not env_path.is_symlink() and (env_path / ".env").exists():
+                    yield env_path
+
+    def regenerate(self, paths=None, environments=None, overrides=None, dry_run=False):
+        """Re-render the .env of every environment (or the given paths) in one pass.
+
+        Directories that cannot be identified are left untouched and listed
+        under "skipped"; only environments that fail to render are errors.
+        """
+        report = {"written": [], "unchanged": 0, "skipped": [], "errors": {}}
+        for env_path in paths or self.environment_paths(environments):
+            env_file = Path(env_path) / ".env"
+            text, existing = self.cache.read(env_file)
+            identity = self.identify(env_path, existing)
+            if identity is None:
+                report["skipped"].append(str(env_path))
+                continue
+            environment, branch, microservice = identity
+            try:
+                config = self.config(environment, branch, microservice, existing=existing, overrides=overrides)
+            except EnvFileError as e:
+                report["errors"][str(env_path)] = str(e)
+                continue
+            rendered = update_env(text or "", config)
+            if rendered == text:
+                report["unchanged"] += 1
+                continue
+            if not dry_run:
+                self.cache.write(env_file, rendered)
+            report["written"].append(str(env_file))
+        return report
+
+def parse_assignments(items):
+    values = {}
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep or not key:
+            raise ValueError(f"Invalid --set value {item!r}, expected KEY=VALUE")
+        values[key] = value
+    return values
+
+def main():
+    parser = argparse.ArgumentParser(description="Render and regenerate environment .env files")
+    parser.add_argument('action', choices=['render', 'regenerate', 'get', 'set'])
+    parser.add_argument('--environment', nargs='+', help='Environment name (regenerate: limit to these)')
+    parser.add_argument('--branch', help='render: branch name')
+    parser.add_argument('--microservice', help='render: microservice name')
+    parser.add_argument('--port', type=int, help='render: port to use instead of the ports.json assignment')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help='Extra key to set')
+    parser.add_argument('--domain', default=os.environ.get("ENV_DOMAIN", "emerginary.com"), help='Domain for VIRTUAL_HOST')
+    parser.add_argument('--ports-file', default='ports.json')
+    parser.add_argument('--output', help='render: write here instead of stdout')
+    parser.add_argument('--path', nargs='+', help='regenerate: environment directories; get/set: .env file')
+    parser.add_argument('--key', nargs='*', help='get: keys to print (all if omitted)')
+    parser.add_argument('--dry-run', action='store_true', help='regenerate: report what would be written')
+
+    args = parser.parse_args()
+    port_manager = environment_manager = None
+    # STATE_DB switches both ports and tracking data to the SQLite state store
+    if os.environ.get("STATE_DB") and args.action in ('render', 'regenerate'):
+        from state_store import SqliteStateStore
+        from port_manager import PortManager
+        from environment_manager import EnvironmentManager
+        store = SqliteStateStore(os.environ["STATE_DB"])
+        port_manager = PortManager(args.ports_file, store=store)
+        environment_manager = EnvironmentManager(store=store)
+    renderer = EnvRenderer(ports_file=args.ports_file, domain=args.domain, port_manager=port_manager,
+                           environment_manager=environment_manager)
+
+    try:
+        overrides = parse_assignments(args.set)
+        if args.action == 'render':
+            if not args.environment or len(args.environment) != 1 or not args.branch or not args.microservice:
+                raise ValueError("--environment, --branch and --microservice are required for render action")
+            existing = read_env(args.output) if args.output else {}
+            config = renderer.config(args.environment[0], args.branch, args.microservice, args.port,
+                                     existing=existing, overrides=overrides)
+            if args.output:
+                renderer.cache.write(args.output, render_env(config))
+            else:
+                sys.stdout.write(render_env(config))
+
+        elif args.action == 'regenerate':
+            report = renderer.regenerate(args.path, args.environment, overrides, args.dry_run)
+            print(json.dumps(report, indent=2))
+            for env_path in report["skipped"]:
+                print(f"Warning: skipped {env_path}, it is not tracked and its APP_NAME does not identify it",
+                      file=sys.stderr)
+            if report["errors"]:
+                exit(1)
+
+        elif args.action == 'set':
+            if not args.path or len(args.path) != 1 or not overrides:
+                raise ValueError("A single --path and at least one --set are required for set action")
+            text = renderer.cache.read(args.path[0])[0] or ""
+            renderer.cache.write(args.path[0], update_env(text, overrides))
+
+        elif args.action == 'get':
+            if not args.path or len(args.path) != 1:
+                raise ValueError("A single --path is required for get action")
+            values = read_env(args.path[0])
+            for key in args.key or values:
+                if key in values:
+                    print(f"{key}={values[key]}")
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,58 +1,250 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import json
+import time
+import fcntl
 import shutil
+import tempfile
 import argparse
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from env_file import update_env
+
+# Files each environment owns: never copied from the source tree nor removed when it is rebuilt
+ENVIRONMENT_LOCAL_FILES = (".env", "tests/test-reports", "tests/test-reports/*")
+
+class TrackingIndex:
+    """Reverse indexes over the tracking data, kept in step with every mutation."""
+
+    def __init__(self, tracking_data):
+        # source branch -> staging paths linked to it
+        self.staging_by_source = {}
+        # branch -> environment paths (its feature environment and staging links)
+        self.environments_by_branch = {}
+        # preserved source path -> target paths referencing it
+        self.states_by_source = {}
+        for section, records in tracking_data.items():
+            for key, record in records.items():
+                self.add(section, key, record)
+
+    @staticmethod
+    def _link(mapping, key, value):
+        mapping.setdefault(key, set()).add(value)
+
+    @staticmethod
+    def _unlink(mapping, key, value):
+        values = mapping.get(key)
+        if values is not None:
+            values.discard(value)
+            if not values:
+                del mapping[key]
+
+    def add(self, section, key, record):
+        if section == "feature_branches":
+            self._link(self.environments_by_branch, key, record["environment_path"])
+        elif section == "staging_references":
+            self._link(self.staging_by_source, record["source_branch"], key)
+            self._link(self.environments_by_branch, record["source_branch"], key)
+        elif section == "environment_states":
+            self._link(self.states_by_source, record["source"], key)
+
+    def remove(self, section, key, record):
+        if section == "feature_branches":
+            self._unlink(self.environments_by_branch, key, record["environment_path"])
+        elif section == "staging_references":
+            self._unlink(self.staging_by_source, record["source_branch"], key)
+            self._unlink(self.environments_by_branch, record["source_branch"], key)
+        elif section == "environment_states":
+            self._unlink(self.states_by_source, record["source"], key)
 
 class EnvironmentManager:
-    def __init__(self, workspace_root="."):
+    def __init__(self, workspace_root=".", store=None, compact=False):
         self.workspace_root = Path(workspace_root)
         self.environments_dir = self.workspace_root / "environments"
         self.tracking_file = self.workspace_root / "environment_tracking.json"
-        self.load_tracking_data()
+        self.lock_file = self.workspace_root / "environment_tracking.json.lock"
+        # Optional state_store.SqliteStateStore used instead of the tracking file
+        self.store = store
+        # Write the tracking file without indentation
+        self.compact = compact
+        # Built from tracking_data on first use, then updated by every mutation
+        self._index = None
+        # Content-addressed store behind materialize_environment, created on first use
+        self._object_store = None
+        # Nesting depth of transaction() and whether it has unsaved changes
+        self._transaction_depth = 0
+        self._dirty = False
+        # Stamp of the tracking file tracking_data was loaded from or last written as
+        self._stamp = None
+        if store is None:
+            self.load_tracking_data()
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = TrackingIndex(self.tracking_data)
+        return self._index
+
+    def _tracking_file_stamp(self, fd=None):
+        """Identify the current tracking file contents without reading them"""
+        try:
+            st = os.fstat(fd) if fd is not None else os.stat(self.tracking_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
 
     def load_tracking_data(self):
         """Load or initialize the environment tracking data."""
+        self._stamp = None
         if self.tracking_file.exists():
             with open(self.tracking_file, 'r') as f:
+                self._stamp = self._tracking_file_stamp(f.fileno())
                 self.tracking_data = json.load(f)
         else:
+            # Nothing is written until the first mutation
             self.tracking_data = {
                 "feature_branches": {},
                 "staging_references": {},
                 "environment_states": {}
             }
-            self.save_tracking_data()
+        self._index = None
 
     def save_tracking_data(self):
-        """Save the current tracking data to file."""
-        with open(self.tracking_file, 'w') as f:
-            json.dump(self.tracking_data, f, indent=2)
+        """Save the current tracking data to file.
+
+        Inside a transaction the write is deferred until the transaction ends.
+        """
+        if self._transaction_depth:
+            self._dirty = True
+            return
+        with self._locked():
+            self._write_tracking_data()
+
+    def _write_tracking_data(self):
+        """Atomically replace the tracking file with the current data."""
+        temp_fd, temp_path = tempfile.mkstemp(dir=self.tracking_file.parent, prefix=".environment_tracking.")
+        try:
+            with os.fdopen(temp_fd, 'w') as temp_file:
+                if self.compact:
+                    json.dump(self.tracking_data, temp_file, separators=(',', ':'))
+                else:
+                    json.dump(self.tracking_data, temp_file, indent=2)
+            os.replace(temp_path, self.tracking_file)
+            self._stamp = self._tracking_file_stamp()
+        except Exception:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    @contextmanager
+    def _locked(self):
+        """Hold the tracking lock file exclusively."""
+        with open(self.lock_file, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @contextmanager
+    def transaction(self):
+        """Batch mutations into a single locked, atomic write of the tracking file.
+
+        Tracking data is reloaded under the lock, only if another process
+        changed the file since it was last read or written, so concurrent runs
+        build on each other's changes while the reverse index is otherwise kept
+        and updated in place. If the block raises, its changes are discarded.
+        """
+        if self.store is not None:
+            with self.store.transaction():
+                yield self
+            return
+        if self._transaction_depth:
+            self._transaction_depth += 1
+            try:
+                yield self
+            finally:
+                self._transaction_depth -= 1
+            return
+        with self._locked():
+            if self._stamp is None or self._stamp != self._tracking_file_stamp():
+                self.load_tracking_data()
+            self._transaction_depth = 1
+            self._dirty = False
+            try:
+                yield self
+            except BaseException:
+                self.load_tracking_data()
+                raise
+            finally:
+                self._transaction_depth = 0
+            if self._dirty:
+                self._write_tracking_data()
+                self._dirty = False
+
+    def all_records(self, section):
+        """Return every record in a tracking section as {key: record}"""
+        if self.store is not None:
+            return self.store.all_tracking(section)
+        return dict(self.tracking_data[section])
+
+    def get_record(self, section, key):
+        """Get one tracking record from the configured storage"""
+        if self.store is not None:
+            return self.store.get_tracking(section, key)
+        return self.tracking_data[section].get(key)
+
+    def put_record(self, section, key, record):
+        """Create or replace one tracking record and persist it"""
+        if self.store is not None:
+            self.store.put_tracking(section, key, record)
+            return
+        with self.transaction():
+            previous = self.tracking_data[section].get(key)
+            if self._index is not None:
+                if previous is not None:
+                    self._index.remove(section, key, previous)
+                self._index.add(section, key, record)
+            self.tracking_data[section][key] = record
+            self.save_tracking_data()
+
+    def delete_record(self, section, key):
+        """Remove one tracking record, if present, and persist the change"""
+        if self.store is not None:
+            self.store.delete_tracking(section, key)
+            return
+        with self.transaction():
+            if key in self.tracking_data[section]:
+                record = self.tracking_data[section].pop(key)
+                if self._index is not None:
+                    self._index.remove(section, key, record)
+                self.save_tracking_data()
 
     def track_feature_branch(self, branch_name, microservice_name):
         """Track a new feature branch environment."""
         timestamp = datetime.now().isoformat()
-        self.tracking_data["feature_branches"][branch_name] = {
+        self.put_record("feature_branches", branch_name, {
             "microservice": microservice_name,
             "created_at": timestamp,
             "last_updated": timestamp,
             "environment_path": f"environments/development/{microservice_name}/{branch_name}"
-        }
-        self.save_tracking_data()
+        })
 
     def link_to_staging(self, feature_branch, staging_path):
         """Create a link between a feature branch and its staging deployment."""
-        if feature_branch not in self.tracking_data["feature_branches"]:
-            raise ValueError(f"Feature branch {feature_branch} not found in tracking data")
-        
-        self.tracking_data["staging_references"][staging_path] = {
-            "source_branch": feature_branch,
-            "linked_at": datetime.now().isoformat()
-        }
-        self.save_tracking_data()
+        with self.transaction():
+            if self.get_record("feature_branches", feature_branch) is None:
+                raise ValueError(f"Feature branch {feature_branch} not found in tracking data")
+            
+            self.put_record("staging_references", staging_path, {
+                "source_branch": feature_branch,
+                "linked_at": datetime.now().isoformat()
+            })
 
     def preserve_environment(self, source_path, target_path):
         """Preserve an environment by creating a reference instead of copying."""
@@ -74,21 +266,116 @@ class EnvironmentManager:
         os.symlink(source_path.absolute(), target_path)
         
         # Update tracking data
-        self.tracking_data["environment_states"][str(target_path)] = {
+        self.put_record("environment_states", str(target_path), {
             "type": "symlink",
             "source": str(source_path),
             "created_at": datetime.now().isoformat()
-        }
-        self.save_tracking_data()
+        })
+
+    @property
+    def object_store(self):
+        if self._object_store is None:
+            from object_store import ObjectStore
+            self._object_store = ObjectStore(self.environments_dir / ".objects")
+        return self._object_store
+
+    def materialize_environment(self, source_path, target_path, reflink=False, exclude=ENVIRONMENT_LOCAL_FILES):
+        """Build or update target_path as a copy of source_path.
+
+        With reflink, files are stored once in the content-addressed object
+        store and reflinked into the target; otherwise they are copied from
+        the source and the target holds a full copy. Only files whose content
+        changed since the last run are hashed or copied. Paths matching exclude, by
+        default the environment's own .env and test reports, are left alone.
+        """
+        source_path = Path(source_path)
+        if not source_path.is_dir():
+            raise ValueError(f"Source environment {source_path} does not exist")
+        if reflink:
+            self.object_store.reflink = True
+        return self.object_store.materialize(source_path, target_path, exclude=exclude)
+
+    def sync(self, source_path, target_path, env_updates=None, dry_run=False):
+        """Bring target_path in line with source_path and report what differed.
+
+        Both trees are compared by cached manifests, so an unchanged pair costs
+        one stat per file. Only differing files are transferred. The target's
+        .env is the source's with env_updates applied (e.g. ENVIRONMENT,
+        APP_PORT, VIRTUAL_PORT) and is rewritten only if that result changed.
+        """
+        started = time.perf_counter()
+        source_path = Path(source_path)
+        target_path = Path(target_path)
+        if not source_path.is_dir():
+            raise ValueError(f"Source environment {source_path} does not exist")
+
+        summary = self.object_store.diff(source_path, target_path, exclude=ENVIRONMENT_LOCAL_FILES)
+        if not dry_run and (summary["added"] or summary["changed"] or summary["removed"]):
+            self.object_store.materialize(source_path, target_path, exclude=ENVIRONMENT_LOCAL_FILES)
+
+        source_env = source_path / ".env"
+        target_env = target_path / ".env"
+        existing = target_env.read_text() if target_env.exists() else None
+        if source_env.exists():
+            content = update_env(source_env.read_text(), env_updates or {})
+            if existing is None:
+                summary["added"].append(".env")
+            elif existing != content:
+                summary["changed"].append(".env")
+            else:
+                summary["unchanged"] += 1
+            if not dry_run and existing != content:
+                target_path.mkdir(parents=True, exist_ok=True)
+                temp_fd, temp_path = tempfile.mkstemp(dir=target_path, prefix=".env.")
+                with os.fdopen(temp_fd, 'w') as temp_file:
+                    temp_file.write(content)
+                os.chmod(temp_path, os.stat(source_env).st_mode & 0o777)
+                os.replace(temp_path, target_env)
+        elif existing is not None:
+            summary["removed"].append(".env")
+            if not dry_run:
+                target_env.unlink()
+
+        summary["dry_run"] = dry_run
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+        return summary
 
     def is_environment_preserved(self, env_path):
         """Check if an environment is preserved (has active references)."""
         env_path = str(Path(env_path))
+        if self.store is not None:
+            return (
+                self.store.get_tracking("environment_states", env_path) is not None or
+                self.store.is_staging_source(env_path)
+            )
         return (
             env_path in self.tracking_data["environment_states"] or
-            any(ref["source_branch"] == env_path for ref in self.tracking_data["staging_references"].values())
+            env_path in self.index.staging_by_source
         )
 
+    def environments_for_branch(self, branch_name):
+        """Return the environment paths created for or linked from a branch."""
+        if self.store is not None:
+            paths = set(self.store.find_tracking("staging_references", "source_branch", branch_name))
+            feature = self.store.get_tracking("feature_branches", branch_name)
+            if feature is not None:
+                paths.add(feature["environment_path"])
+            return paths
+        return set(self.index.environments_by_branch.get(branch_name, ()))
+
+    def staging_references_for(self, source_branch):
+        """Return the staging paths linked to a source branch."""
+        if self.store is not None:
+            return set(self.store.find_tracking("staging_references", "source_branch", source_branch))
+        return set(self.index.staging_by_source.get(source_branch, ()))
+
+    def preserved_references_to(self, source_path):
+        """Return the preserved environment paths that reference source_path."""
+        source_path = str(Path(source_path))
+        if self.store is not None:
+            return set(self.store.find_tracking("environment_states", "source", source_path))
+        return set(self.index.states_by_source.get(source_path, ()))
+
     def cleanup_environment(self, env_path):
         """Safely cleanup an environment if it's not preserved."""
         env_path = Path(env_path)
@@ -99,42 +386,210 @@ class EnvironmentManager:
                 shutil.rmtree(env_path)
             
             # Clean up tracking data
-            env_path_str = str(env_path)
-            if env_path_str in self.tracking_data["environment_states"]:
-                del self.tracking_data["environment_states"][env_path_str]
-            self.save_tracking_data()
+            self.delete_record("environment_states", str(env_path))
+
+    def find_stale_environments(self, ttl_days=None, existing_branches=None, now=None):
+        """Return {branch: record} for feature environments that can be collected.
+
+        A branch is stale when existing_branches is given and no longer contains
+        it, or when it has not been updated within ttl_days. Preserved
+        environments are never returned.
+        """
+        now = now or datetime.now()
+        cutoff = now - timedelta(days=ttl_days) if ttl_days is not None else None
+        existing = set(existing_branches) if existing_branches is not None else None
+        stale = {}
+        for branch, record in self.all_records("feature_branches").items():
+            gone = existing is not None and branch not in existing
+            updated = record.get("last_updated") or record.get("created_at")
+            expired = cutoff is not None and updated is not None and datetime.fromisoformat(updated) < cutoff
+            if (gone or expired) and not self.is_environment_preserved(record["environment_path"]):
+                stale[branch] = record
+        return stale
+
+    def environment_dirs(self, branch, record):
+        """The directories holding a feature branch's environment that still exist.
+
+        Records point at environments/development/<microservice>/<branch>, while
+        the CI workflow builds environments/development/<branch>.
+        """
+        candidates = dict.fromkeys((record["environment_path"], f"environments/development/{branch}"))
+        return [
+            self.workspace_root / candidate for candidate in candidates
+            if (self.workspace_root / candidate).is_symlink() or (self.workspace_root / candidate).exists()
+        ]
+
+    def _remove_tree(self, path):
+        """Delete an environment directory and return the bytes that deletion freed.
+
+        Files with other hard links keep their data, so only their last link counts.
+        """
+        if path.is_symlink():
+            path.unlink()
+            return 0
+        freed = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    st = os.lstat(os.path.join(root, name))
+                except OSError:
+                    continue
+                if st.st_nlink == 1:
+                    freed += st.st_size
+        shutil.rmtree(path)
+        return freed
+
+    def garbage_collect(self, ttl_days=None, existing_branches=None, max_workers=8, dry_run=False, port_manager=None):
+        """Delete stale feature environments in parallel and release their ports.
+
+        Ports are looked up in the development assignments under
+        "<microservice>/<branch>". A branch's record is dropped and its port
+        released only once its directory is gone; failed deletions are reported
+        under "errors" and retried by the next run. "bytes_freed" counts the
+        environment directories and "object_bytes_freed" the pruned objects.
+        """
+        started = time.perf_counter()
+        stale = self.find_stale_environments(ttl_days, existing_branches)
+        report = {"environments": sorted(stale), "bytes_freed": 0, "object_bytes_freed": 0,
+                  "released_ports": {}, "errors": {}, "dry_run": dry_run}
+        if stale:
+            if port_manager is None:
+                from port_manager import PortManager
+                # Shares the SQLite store when STATE_DB is set; otherwise goes through a running port daemon
+                port_manager = PortManager(str(self.workspace_root / "ports.json"), store=self.store)
+            assignments = port_manager.list_assignments("development")["development"]
+            port_keys = {
+                branch: f"{record['microservice']}/{branch}" for branch, record in stale.items()
+                if f"{record['microservice']}/{branch}" in assignments
+            }
+            directories = {branch: self.environment_dirs(branch, record) for branch, record in stale.items()}
+
+            if dry_run:
+                report["released_ports"] = {key: assignments[key] for key in port_keys.values()}
+            else:
+                removed = []
+                with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                    deletions = {
+                        branch: [pool.submit(self._remove_tree, path) for path in paths]
+                        for branch, paths in directories.items()
+                    }
+                    for branch, futures in deletions.items():
+                        errors = []
+                        for future in futures:
+                            try:
+                                report["bytes_freed"] += future.result()
+                            except OSError as e:
+                                errors.append(str(e))
+                        if errors:
+                            report["errors"][branch] = "; ".join(errors)
+                        else:
+                            removed.append(branch)
+
+                with self.transaction():
+                    for branch in removed:
+                        self.delete_record("feature_branches", branch)
+                        self.delete_record("environment_states", stale[branch]["environment_path"])
+
+                released = [port_keys[branch] for branch in removed if branch in port_keys]
+                if released:
+                    port_manager.apply_batch([
+                        {"action": "release", "branch": key, "env": "development"} for key in released
+                    ])
+                report["released_ports"] = {key: assignments[key] for key in released}
+                if removed and self.environments_dir.joinpath(".objects").exists():
+                    # Objects are separate copies, so their bytes are not part of bytes_freed
+                    report["object_bytes_freed"] = self.object_store.prune()
+        report["seconds"] = round(time.perf_counter() - started, 3)
+        return report
 
 def main():
     parser = argparse.ArgumentParser(description="Manage microservice environments")
-    parser.add_argument('action', choices=['track', 'link', 'preserve', 'cleanup'])
-    parser.add_argument('--branch', help='Feature branch name')
+    parser.add_argument('action', choices=['track', 'link', 'preserve', 'cleanup', 'gc', 'materialize', 'sync'])
+    parser.add_argument('--branch', nargs='+', help='Feature branch name(s)')
     parser.add_argument('--microservice', help='Microservice name')
     parser.add_argument('--source', help='Source environment path')
-    parser.add_argument('--target', help='Target environment path')
+    parser.add_argument('--target', nargs='+', help='Target environment path(s)')
+    parser.add_argument('--compact', action='store_true', help='Write the tracking file without indentation')
+    parser.add_argument('--ttl-days', type=float, help='gc: collect environments not updated for this many days')
+    parser.add_argument('--existing-branches', help='gc: file listing live branches, one per line (- for stdin)')
+    parser.add_argument('--workers', type=int, default=8, help='gc: parallel deletion workers')
+    parser.add_argument('--dry-run', action='store_true', help='gc/sync: report what would change without changing it')
+    parser.add_argument('--reflink', action='store_true', help='materialize: use reflinks where supported')
+    parser.add_argument('--environment', help='sync: ENVIRONMENT value for the target .env')
+    parser.add_argument('--port', type=int, help='sync: APP_PORT and VIRTUAL_PORT for the target .env')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE', help='sync: extra .env key to set')
     
     args = parser.parse_args()
-    manager = EnvironmentManager()
+    # STATE_DB switches from environment_tracking.json to the SQLite state store
+    if os.environ.get("STATE_DB"):
+        from state_store import SqliteStateStore
+        manager = EnvironmentManager(store=SqliteStateStore(os.environ["STATE_DB"]))
+    else:
+        manager = EnvironmentManager(compact=args.compact)
     
     try:
-        if args.action == 'track':
-            if not args.branch or not args.microservice:
-                raise ValueError("Both --branch and --microservice are required for track action")
-            manager.track_feature_branch(args.branch, args.microservice)
-        
-        elif args.action == 'link':
-            if not args.branch or not args.target:
-                raise ValueError("Both --branch and --target are required for link action")
-            manager.link_to_staging(args.branch, args.target)
-        
-        elif args.action == 'preserve':
-            if not args.source or not args.target:
-                raise ValueError("Both --source and --target are required for preserve action")
-            manager.preserve_environment(args.source, args.target)
-        
-        elif args.action == 'cleanup':
-            if not args.target:
-                raise ValueError("--target is required for cleanup action")
-            manager.cleanup_environment(args.target)
+        if args.action == 'gc':
+            if args.ttl_days is None and args.existing_branches is None:
+                raise ValueError("gc requires --ttl-days and/or --existing-branches")
+            existing = None
+            if args.existing_branches:
+                source = sys.stdin if args.existing_branches == '-' else open(args.existing_branches)
+                with source:
+                    existing = [line.strip() for line in source if line.strip()]
+            report = manager.garbage_collect(args.ttl_days, existing, args.workers, args.dry_run)
+            print(json.dumps(report, indent=2))
+            if report["errors"]:
+                exit(1)
+            return
+
+        if args.action == 'materialize':
+            if not args.source or not args.target or len(args.target) != 1:
+                raise ValueError("Both --source and a single --target are required for materialize action")
+            stats = manager.materialize_environment(args.source, args.target[0], reflink=args.reflink)
+            print(json.dumps(stats))
+            return
+
+        if args.action == 'sync':
+            if not args.source or not args.target or len(args.target) != 1:
+                raise ValueError("Both --source and a single --target are required for sync action")
+            updates = {}
+            if args.environment:
+                updates["ENVIRONMENT"] = args.environment
+            if args.port is not None:
+                updates["APP_PORT"] = updates["VIRTUAL_PORT"] = args.port
+            for item in args.set:
+                key, sep, value = item.partition("=")
+                if not sep or not key:
+                    raise ValueError(f"Invalid --set value {item!r}, expected KEY=VALUE")
+                updates[key] = value
+            summary = manager.sync(args.source, args.target[0], updates, dry_run=args.dry_run)
+            print(json.dumps(summary, indent=2))
+            return
+
+        # Every branch/target given in one invocation costs a single write
+        with manager.transaction():
+            if args.action == 'track':
+                if not args.branch or not args.microservice:
+                    raise ValueError("Both --branch and --microservice are required for track action")
+                for branch in args.branch:
+                    manager.track_feature_branch(branch, args.microservice)
+            
+            elif args.action == 'link':
+                if not args.branch or not args.target or len(args.branch) != len(args.target):
+                    raise ValueError("--branch and --target are required for link action, one target per branch")
+                for branch, target in zip(args.branch, args.target):
+                    manager.link_to_staging(branch, target)
+            
+            elif args.action == 'preserve':
+                if not args.source or not args.target or len(args.target) != 1:
+                    raise ValueError("Both --source and a single --target are required for preserve action")
+                manager.preserve_environment(args.source, args.target[0])
+            
+            elif args.action == 'cleanup':
+                if not args.target:
+                    raise ValueError("--target is required for cleanup action")
+                for target in args.target:
+                    manager.cleanup_environment(target)
     
     except Exception as e:
         print(f"Error: {str(e)}")
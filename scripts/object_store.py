@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import stat
+import fcntl
+import shutil
+import hashlib
+import tempfile
+import fnmatch
+from pathlib import Path
+
+# ioctl request number for Linux FICLONE (reflink a whole file)
+FICLONE = 0x40049409
+
+# Stored objects carry this mtime; any other value means one was written to
+OBJECT_MTIME_NS = 0
+
+class ObjectStore:
+    """Content-addressed file store used to materialize environment trees.
+
+    With reflink, each distinct file content is stored once under
+    objects/<sha256>, made read-only, and reflinked into environment
+    directories (copy-on-write, so environments share blocks but never an
+    inode); a file's data is on disk once however many environments hold it.
+    Without reflink (the default, and the fallback once the filesystem
+    refuses a clone) nothing is stored and files are copied straight from the
+    source, so every environment costs a full copy of the files it holds.
+    Environment files are never hardlinked: an in-place write to one must not
+    reach its siblings or the store. Either way scans cache each file's
+    digest against its size, mtime and inode, so rebuilding a tree only
+    hashes and copies files that actually changed; the cached manifests
+    double as the reference count for prune.
+    """
+
+    def __init__(self, root, reflink=False):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.manifests_dir = self.root / "manifests"
+        self.reflink = reflink
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+
+    def object_path(self, digest, executable=False):
+        # Linked files share the object's permissions, so executables are kept apart
+        return self.objects_dir / digest[:2] / (digest[2:] + (".x" if executable else ""))
+
+    @staticmethod
+    def hash_file(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _cache_file(self, tree):
+        key = hashlib.sha1(str(Path(tree).resolve()).encode()).hexdigest()
+        return self.manifests_dir / f"{key}.json"
+
+    def scan(self, tree):
+        """Return {relative path: entry} for a tree, reusing cached digests.
+
+        Entries are {"digest", "size", "mode"} for files, {"link": target} for
+        symlinks and {"dir": True} for directories.
+        """
+        tree = Path(tree)
+        cache_file = self._cache_file(tree)
+        try:
+            with open(cache_file, 'r') as f:
+                cache = json.load(f)
+            # Manifests written before they recorded their tree are a bare file map
+            cache = cache.get("files", {}) if "tree" in cache else cache
+        except (OSError, ValueError, AttributeError):
+            cache = {}
+
+        manifest = {}
+        fresh_cache = {}
+        for root, dirs, files in os.walk(tree):
+            rel_root = os.path.relpath(root, tree)
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                rel_path = os.path.normpath(os.path.join(rel_root, name))
+                st = os.lstat(path)
+                if stat.S_ISLNK(st.st_mode):
+                    manifest[rel_path] = {"link": os.readlink(path)}
+                elif stat.S_ISDIR(st.st_mode):
+                    manifest[rel_path] = {"dir": True}
+                elif stat.S_ISREG(st.st_mode):
+                    key = [st.st_size, st.st_mtime_ns, st.st_ino]
+                    cached = cache.get(rel_path)
+                    digest = cached[3] if cached and cached[:3] == key else self.hash_file(path)
+                    fresh_cache[rel_path] = key + [digest]
+                    manifest[rel_path] = {"digest": digest, "size": st.st_size, "mode": stat.S_IMODE(st.st_mode)}
+            # Symlinked directories are recorded as links, not followed
+            dirs[:] = [d for d in dirs if not os.path.islink(os.path.join(root, d))]
+
+        self._write_json(cache_file, {"tree": str(tree.resolve()), "files": fresh_cache})
+        return manifest
+
+    def _write_json(self, path, data):
+        temp_fd, temp_path = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(temp_fd, 'w') as temp_file:
+            json.dump(data, temp_file, separators=(',', ':'))
+        os.replace(temp_path, path)
+
+    def _clone(self, source, target):
+        """Reflink source to target; returns False if the filesystem cannot"""
+        try:
+            with open(source, 'rb') as src, open(target, 'wb') as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return True
+        except OSError:
+            if os.path.exists(target):
+                os.unlink(target)
+            self.reflink = False
+            return False
+
+    def is_intact(self, object_path, digest, size):
+        """Whether a stored object still holds the content its name claims.
+
+        An untouched object has the size it was stored with and OBJECT_MTIME_NS,
+        which costs one stat; anything else is re-hashed.
+        """
+        try:
+            st = os.stat(object_path)
+        except FileNotFoundError:
+            return False
+        if st.st_size == size and st.st_mtime_ns == OBJECT_MTIME_NS:
+            return True
+        return st.st_size == size and self.hash_file(object_path) == digest
+
+    def ingest(self, path, digest, executable=False, size=None):
+        """Store path's content under digest unless an intact copy is already stored.
+
+        Objects are reflinked from path; when the filesystem cannot clone,
+        nothing is stored (reflink is switched off) and False is returned.
+        """
+        object_path = self.object_path(digest, executable)
+        if size is None:
+            size = os.stat(path).st_size
+        if self.is_intact(object_path, digest, size):
+            return False
+        object_path.parent.mkdir(exist_ok=True)
+        temp_fd, temp_path = tempfile.mkstemp(dir=object_path.parent)
+        os.close(temp_fd)
+        if not (self.reflink and self._clone(path, temp_path)):
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return False
+        if self.hash_file(temp_path) != digest:
+            os.unlink(temp_path)
+            raise OSError(f"{path} changed while it was being stored")
+        os.chmod(temp_path, 0o555 if executable else 0o444)
+        os.utime(temp_path, ns=(OBJECT_MTIME_NS, OBJECT_MTIME_NS))
+        # Replaces a corrupted object, if that is why it was not intact
+        os.replace(temp_path, object_path)
+        return True
+
+    def place(self, digest, target, mode=0o644):
+        """Create target as an independent file with the stored object's content.
+
+        Returns True for a reflink (shared blocks) and False for a copy.
+        """
+        return self.write(self.object_path(digest, bool(mode & stat.S_IXUSR)), target, mode)
+
+    def write(self, source_file, target, mode=0o644):
+        """Replace target with a reflink (True) or copy (False) of source_file"""
+        temp_path = target.parent / f".{target.name}.materialize"
+        if os.path.lexists(temp_path):
+            temp_path.unlink()
+        cloned = self.reflink and self._clone(source_file, temp_path)
+        if not cloned:
+            shutil.copyfile(source_file, temp_path)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, target)
+        return cloned
+
+    @staticmethod
+    def same_entry(entry, have):
+        """True if a target entry already matches the wanted source entry"""
+        if have is None:
+            return False
+        if entry.get("dir") or "link" in entry:
+            return have == entry
+        return (have.get("digest") == entry["digest"]
+                and have["mode"] & stat.S_IXUSR == entry["mode"] & stat.S_IXUSR)
+
+    def diff(self, source, target, exclude=()):
+        """Compare two trees by manifest; returns added, changed and removed paths.
+
+        Directories only count when added or removed. Paths matching an
+        exclude pattern are left out on both sides.
+        """
+        wanted = self._filter(self.scan(source), exclude)
+        current = self._filter(self.scan(target), exclude) if Path(target).is_dir() else {}
+        summary = {"added": [], "changed": [], "removed": sorted(set(current) - set(wanted)), "unchanged": 0}
+        for rel_path in sorted(wanted):
+            entry = wanted[rel_path]
+            if rel_path not in current:
+                summary["added"].append(rel_path)
+            elif not self.same_entry(entry, current[rel_path]):
+                summary["changed"].append(rel_path)
+            elif not entry.get("dir"):
+                summary["unchanged"] += 1
+        return summary
+
+    @staticmethod
+    def _filter(manifest, exclude):
+        if not exclude:
+            return manifest
+        return {rel_path: entry for rel_path, entry in manifest.items()
+                if not any(fnmatch.fnmatch(rel_path, pattern) for pattern in exclude)}
+
+    def materialize(self, source, target, exclude=()):
+        """Make target an exact copy of source, touching only files that differ.
+
+        Paths matching an exclude pattern are neither copied nor removed.
+        Files go through the object store only with reflink; copies are made
+        from the source directly. Returns counts of files cloned (reflinked),
+        copied, removed and unchanged, plus the number of new objects stored.
+        """
+        source = Path(source)
+        target = Path(target)
+        wanted = self._filter(self.scan(source), exclude)
+        target.mkdir(parents=True, exist_ok=True)
+        current = self._filter(self.scan(target), exclude)
+        stats = {"cloned": 0, "copied": 0, "symlinked": 0, "removed": 0, "unchanged": 0, "stored": 0}
+
+        # Remove what source no longer has, deepest paths first
+        for rel_path in sorted(set(current) - set(wanted), key=len, reverse=True):
+            path = target / rel_path
+            if path.is_dir() and not path.is_symlink():
+                shutil.rmtree(path)
+            elif os.path.lexists(path):
+                path.unlink()
+            stats["removed"] += 1
+
+        for rel_path in sorted(wanted, key=len):
+            entry = wanted[rel_path]
+            have = current.get(rel_path)
+            path = target / rel_path
+            if entry.get("dir"):
+                if have and have.get("dir"):
+                    continue
+                if os.path.lexists(path):
+                    path.unlink()
+                path.mkdir(parents=True, exist_ok=True)
+            elif "link" in entry:
+                if self.same_entry(entry, have):
+                    stats["unchanged"] += 1
+                    continue
+                if have and have.get("dir"):
+                    shutil.rmtree(path)
+                elif os.path.lexists(path):
+                    path.unlink()
+                os.symlink(entry["link"], path)
+                stats["symlinked"] += 1
+            else:
+                if self.same_entry(entry, have):
+                    stats["unchanged"] += 1
+                    continue
+                if have and have.get("dir"):
+                    shutil.rmtree(path)
+                if self.reflink:
+                    stats["stored"] += self.ingest(source / rel_path, entry["digest"],
+                                                   bool(entry["mode"] & stat.S_IXUSR), entry["size"])
+                # ingest switches reflink off when the filesystem cannot clone
+                if self.reflink:
+                    cloned = self.place(entry["digest"], path, mode=entry["mode"])
+                else:
+                    # A stored object would only be one more full copy
+                    cloned = self.write(source / rel_path, path, mode=entry["mode"])
+                stats["cloned" if cloned else "copied"] += 1
+
+        # Refresh the target's digest cache for the next run
+        self.scan(target)
+        return stats
+
+    def referenced(self):
+        """Digests listed in the manifest of any tree that still exists.
+
+        Manifests of trees that no longer exist are deleted, so objects only
+        they referenced become unreferenced.
+        """
+        digests = set()
+        for cache_file in self.manifests_dir.glob("*.json"):
+            try:
+                with open(cache_file, 'r') as f:
+                    cache = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if "tree" in cache:
+                if not os.path.isdir(cache["tree"]):
+                    cache_file.unlink()
+                    continue
+                cache = cache.get("files", {})
+            digests.update(entry[3] for entry in cache.values())
+        return digests
+
+    def prune(self):
+        """Delete objects no existing tree's manifest references; returns bytes freed"""
+        referenced = self.referenced()
+        freed = 0
+        for object_path in self.objects_dir.glob("*/*"):
+            name = object_path.name.split(".")[0]
+            # Skip temporary files of an ingest in progress
+            if len(name) != 62:
+                continue
+            if object_path.parent.name + name not in referenced:
+                freed += os.lstat(object_path).st_size
+                object_path.unlink()
+        return freed
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+import os
+import json
+import fcntl
+import signal
+import asyncio
+
+from port_manager import PortManager, PortManagerError, apply_record
+
+class PortDaemon:
+    """Serves port operations from memory over a Unix domain socket.
+
+    Requests and responses are newline-delimited JSON objects, answered in
+    order per connection, so clients may pipeline many requests at once.
+    Every mutation is appended to a write-ahead log and fsynced (grouped
+    across requests handled in the same loop iteration) before it is
+    acknowledged. The log is periodically compacted into ports.json.
+    """
+
+    def __init__(self, manager, compact_interval=30, compact_threshold=1000):
+        self.manager = manager
+        self.compact_interval = compact_interval
+        self.compact_threshold = compact_threshold
+        self.data = None
+        self.index = None
+        self.wal = None
+        # Size of the write-ahead log up to its last successful fsync
+        self.wal_durable = 0
+        self.wal_records = 0
+        # Records applied since the last compaction, journaled when compacting
+        self.pending_records = []
+        self.flush_waiter = None
+        self.instance_lock = None
+
+    @classmethod
+    def for_ports_file(cls, ports_file, **kwargs):
+        """Build a daemon around a PortManager imported from the port_manager module.
+
+        When started via 'port_manager.py serve' the caller's classes live in
+        __main__, so errors raised by them would not match PortManagerError here.
+        """
+        # The daemon's own manager must write ports.json, not route back to the daemon
+        return cls(PortManager(ports_file, use_daemon=False), **kwargs)
+
+    def load_state(self):
+        """Load ports.json, replay the write-ahead log on top and compact"""
+        with self.manager.locked(), open(self.manager.ports_file, 'r') as f:
+            self.data = json.load(f)
+            if not self.manager.journal.has_base():
+                self.manager.journal.snapshot(self.data)
+        self.index = self.manager.load_index(self.data)
+
+        if os.path.exists(self.manager.wal_file):
+            with open(self.manager.wal_file, 'r') as wal:
+                for line in wal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn final record was never acknowledged
+                        break
+                    self.replay(record)
+                    self.pending_records.append(record)
+                    self.wal_records += 1
+
+        self.wal = open(self.manager.wal_file, 'a')
+        self.wal_durable = self.wal.tell()
+        self.compact()
+
+    def replay(self, record):
+        """Apply a logged set/del record to the in-memory state and index"""
+        env = record["env"]
+        previous = self.data["environments"][env]["assignments"].get(record["branch"])
+        if previous is not None:
+            self.index[env].release(previous)
+        apply_record(self.data, record)
+        if record["op"] == "set":
+            self.index[env].take(record["port"])
+
+    def log(self, records):
+        """Buffer records in the log and return a future resolved once durable"""
+        for record in records:
+            self.wal.write(json.dumps(record) + "\n")
+            self.wal_records += 1
+        self.pending_records.extend(records)
+        if self.flush_waiter is None:
+            loop = asyncio.get_running_loop()
+            self.flush_waiter = loop.create_future()
+            loop.call_soon(self.flush_wal)
+        return self.flush_waiter
+
+    def flush_wal(self):
+        """Fsync buffered records and acknowledge every request waiting on them"""
+        waiter, self.flush_waiter = self.flush_waiter, None
+        try:
+            self.wal.flush()
+            os.fsync(self.wal.fileno())
+        except OSError as e:
+            if waiter is not None:
+                waiter.set_exception(PortManagerError(f"Failed to persist write-ahead log: {e}"))
+            # In-memory state may be ahead of disk now; start again from disk, without the
+            # records that were never made durable (their requests are told they failed)
+            try:
+                self.wal.close()
+            except OSError:
+                pass
+            os.truncate(self.manager.wal_file, self.wal_durable)
+            self.wal_records = 0
+            self.pending_records = []
+            self.load_state()
+            return
+        self.wal_durable = self.wal.tell()
+        if waiter is not None:
+            waiter.set_result(None)
+        if self.wal_records >= self.compact_threshold:
+            self.compact()
+
+    def compact(self):
+        """Fold the write-ahead log into ports.json and truncate it"""
+        if self.flush_waiter is not None:
+            self.flush_wal()
+        if not self.wal_records:
+            return
+        with self.manager.locked():
+            self.manager.commit(self.data, self.index)
+            self.manager.journal.append(self.pending_records, self.data)
+        os.ftruncate(self.wal.fileno(), 0)
+        self.wal_durable = 0
+        self.wal_records = 0
+        self.pending_records = []
+
+    def handle_request(self, line):
+        """Process one request line, returning (response, durability future).
+
+        A malformed request is answered with an error; it never ends the
+        connection or the responses queued on it.
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {"ok": False, "error": f"Invalid request: {e}"}, None
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "Invalid request: expected a JSON object"}, None
+
+        response = {"id": request.get("id")}
+        action = request.get("action")
+        try:
+            if action == "lookup":
+                if not request.get("branch"):
+                    raise PortManagerError("lookup requires a branch")
+                found = self.manager.lookup_in(self.data, request["branch"], request.get("env"))
+                response.update(found, ok=True)
+                return response, None
+            if action == "list":
+                response.update(ok=True, assignments=self.manager.list_in(self.data, request.get("env")))
+                return response, None
+            if action == "stats":
+                response.update(ok=True, stats=self.manager.stats_in(self.data, self.index))
+                return response, None
+            if action == "batch":
+                operations = request.get("operations", [])
+                # Checked up front so a bad entry cannot stop a batch half applied
+                if not isinstance(operations, list) or not all(isinstance(op, dict) for op in operations):
+                    raise PortManagerError("batch operations must be a list of JSON objects")
+                results, records = self.manager.apply_operations(self.data, self.index, operations)
+                response.update(ok=True, results=results)
+            else:
+                outcome, records = self.manager.apply_operation(self.data, self.index, request)
+                response.update(outcome, ok=True)
+        except PortManagerError as e:
+            response.update(ok=False, error=str(e))
+            return response, None
+        except Exception as e:
+            response.update(ok=False, error=f"Invalid request: {type(e).__name__}: {e}")
+            return response, None
+        return response, self.log(records) if records else None
+
+    async def handle_connection(self, reader, writer):
+        pending = asyncio.Queue()
+        sender = asyncio.create_task(self.send_responses(pending, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    pending.put_nowait(self.handle_request(line))
+        finally:
+            pending.put_nowait(None)
+            await sender
+            writer.close()
+
+    async def send_responses(self, pending, writer):
+        """Write responses in request order once their mutations are durable"""
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            response, durable = item
+            if durable is not None:
+                try:
+                    await asyncio.shield(durable)
+                except PortManagerError as e:
+                    response = {"id": response.get("id"), "ok": False, "error": str(e)}
+            writer.write((json.dumps(response) + "\n").encode())
+            if pending.empty():
+                await writer.drain()
+
+    async def compact_periodically(self):
+        while True:
+            await asyncio.sleep(self.compact_interval)
+            self.compact()
+
+    async def serve(self):
+        socket_path = self.manager.socket_file
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        compactor = asyncio.create_task(self.compact_periodically())
+        try:
+            await stop.wait()
+        finally:
+            compactor.cancel()
+            server.close()
+            await server.wait_closed()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self.compact()
+            self.wal.close()
+
+    def run(self):
+        """Serve until SIGINT/SIGTERM; only one daemon may own a ports file"""
+        self.instance_lock = open(f"{self.manager.socket_file}.lock", 'w')
+        try:
+            fcntl.flock(self.instance_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise PortManagerError(f"A port daemon is already serving {self.manager.ports_file}")
+        self.load_state()
+        asyncio.run(self.serve())
@@ -4,85 +4,482 @@ import json
 import os
 import fcntl
 import time
-import shutil
+import zlib
 import tempfile
+import socket
+import bisect
+import random
+import mmap
+import marshal
 from datetime import datetime
+from operator import itemgetter
+from contextlib import contextmanager
+
+# Bump whenever the on-disk layout of the free-port index changes
+INDEX_SCHEMA_VERSION = 1
 
 class PortManagerError(Exception):
     """Custom exception for PortManager errors"""
     pass
 
+class PortLockTimeout(PortManagerError):
+    """Raised when the ports lock could not be acquired in time"""
+    pass
+
+class PortDaemonStarted(PortManagerError):
+    """Raised when a port daemon took over ports.json before a direct write"""
+    pass
+
+class PortMetrics:
+    """Records lock wait/hold time, retries and latency per operation.
+
+    One JSON line per operation is appended to the metrics file with a single
+    O_APPEND write, so concurrent pipelines never need to coordinate.
+    prometheus() aggregates the file into Prometheus text format; delete the
+    file to reset the counters.
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+    def __init__(self, path=None):
+        self.path = path
+        self.current = None
+        self.started = None
+
+    def start(self, operation):
+        self.current = {"op": operation, "lock_wait": 0.0, "lock_hold": 0.0, "retries": 0}
+        self.started = time.perf_counter()
+
+    def add(self, key, value):
+        if self.current is not None:
+            self.current[key] += value
+
+    def finish(self, ok):
+        record, self.current = self.current, None
+        if record is None or not self.path:
+            return
+        record.update(ts=time.time(), latency=time.perf_counter() - self.started, ok=ok)
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, (json.dumps(record, separators=(',', ':')) + "\n").encode())
+            finally:
+                os.close(fd)
+        except OSError:
+            # Metrics must never fail an allocation
+            pass
+
+    def prometheus(self):
+        """Aggregate the recorded operations into Prometheus text format"""
+        histograms = {"latency": {}, "lock_wait": {}, "lock_hold": {}}
+        retries = {}
+        failures = {}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    op = record["op"]
+                    for key, series in histograms.items():
+                        buckets, total, count = series.get(op, ([0] * len(self.BUCKETS), 0.0, 0))
+                        value = record[key]
+                        buckets = [n + (value <= le) for n, le in zip(buckets, self.BUCKETS)]
+                        series[op] = (buckets, total + value, count + 1)
+                    retries[op] = retries.get(op, 0) + record["retries"]
+                    failures[op] = failures.get(op, 0) + (not record["ok"])
+
+        names = {
+            "latency": ("port_manager_operation_seconds", "Operation latency including lock waits and retries"),
+            "lock_wait": ("port_manager_lock_wait_seconds", "Time spent waiting to acquire the ports lock"),
+            "lock_hold": ("port_manager_lock_hold_seconds", "Time the ports lock was held"),
+        }
+        lines = []
+        for key, (name, help_text) in names.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+            for op, (buckets, total, count) in sorted(histograms[key].items()):
+                for le, n in zip(self.BUCKETS, buckets):
+                    lines.append(f'{name}_bucket{{op="{op}",le="{le}"}} {n}')
+                lines.append(f'{name}_bucket{{op="{op}",le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{op="{op}"}} {total:.6f}')
+                lines.append(f'{name}_count{{op="{op}"}} {count}')
+        for name, help_text, values in (
+            ("port_manager_retries_total", "Retried attempts", retries),
+            ("port_manager_failures_total", "Operations that failed", failures),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{op="{op}"}} {n}' for op, n in sorted(values.items())]
+        return "\n".join(lines) + "\n"
+
+class FreePortIndex:
+    """Sorted list of free [start, end] port intervals for one environment"""
+
+    def __init__(self, start_port, end_port, intervals=None):
+        self.start_port = start_port
+        self.end_port = end_port
+        self.intervals = intervals if intervals is not None else [[start_port, end_port]]
+
+    @classmethod
+    def from_assignments(cls, port_range, assignments):
+        """Build the index from an environment's current assignments"""
+        start_port, end_port = port_range["start"], port_range["end"]
+        used_ports = sorted(p for p in set(assignments.values()) if start_port <= p <= end_port)
+        intervals = []
+        cursor = start_port
+        for port in used_ports:
+            if port > cursor:
+                intervals.append([cursor, port - 1])
+            cursor = port + 1
+        if cursor <= end_port:
+            intervals.append([cursor, end_port])
+        return cls(start_port, end_port, intervals)
+
+    def _find(self, port):
+        """Return the position of the interval that could contain port, or -1"""
+        return bisect.bisect_right(self.intervals, port, key=itemgetter(0)) - 1
+
+    def is_free(self, port):
+        i = self._find(port)
+        return i >= 0 and self.intervals[i][1] >= port
+
+    def allocate(self):
+        """Take and return the lowest free port, or None if the range is full"""
+        if not self.intervals:
+            return None
+        port = self.intervals[0][0]
+        self.take(port)
+        return port
+
+    def take(self, port):
+        """Mark a port as used"""
+        i = self._find(port)
+        if i < 0 or self.intervals[i][1] < port:
+            return
+        start, end = self.intervals[i]
+        if start == end:
+            del self.intervals[i]
+        elif port == start:
+            self.intervals[i][0] = port + 1
+        elif port == end:
+            self.intervals[i][1] = port - 1
+        else:
+            self.intervals[i][1] = port - 1
+            self.intervals.insert(i + 1, [port + 1, end])
+
+    def release(self, port):
+        """Mark a port as free again, merging with adjacent intervals"""
+        if not self.start_port <= port <= self.end_port or self.is_free(port):
+            return
+        i = self._find(port)
+        merge_left = i >= 0 and self.intervals[i][1] == port - 1
+        merge_right = i + 1 < len(self.intervals) and self.intervals[i + 1][0] == port + 1
+        if merge_left and merge_right:
+            self.intervals[i][1] = self.intervals[i + 1][1]
+            del self.intervals[i + 1]
+        elif merge_left:
+            self.intervals[i][1] = port
+        elif merge_right:
+            self.intervals[i + 1][0] = port
+        else:
+            self.intervals.insert(i + 1, [port, port])
+
+    def to_dict(self):
+        return {"port_range": [self.start_port, self.end_port], "free": self.intervals}
+
+def set_record(env, branch_name, port):
+    """Journal record for branch_name now holding port in env"""
+    return {"op": "set", "env": env, "branch": branch_name, "port": port}
+
+def del_record(env, branch_name):
+    """Journal record for branch_name no longer holding a port in env"""
+    return {"op": "del", "env": env, "branch": branch_name}
+
+def apply_record(data, record):
+    """Replay a set/del record onto a ports document"""
+    assignments = data["environments"][record["env"]]["assignments"]
+    if record["op"] == "set":
+        assignments[record["branch"]] = record["port"]
+    elif record["op"] == "del":
+        assignments.pop(record["branch"], None)
+
+class PortJournal:
+    """Append-only journal of port mutations with periodic full snapshots.
+
+    Each line of journal.jsonl is one set/del/restore record carrying a
+    sequence number, a timestamp and a CRC32 of its contents. Every
+    snapshot_interval records the full ports document is written to
+    snapshot_<seq>.json; the state at any retained sequence number is
+    the nearest earlier snapshot plus the journal records after it.
+    """
+
+    def __init__(self, directory, snapshot_interval=100, keep_snapshots=5):
+        self.directory = directory
+        self.journal_file = os.path.join(directory, "journal.jsonl")
+        self.snapshot_interval = snapshot_interval
+        self.keep_snapshots = keep_snapshots
+
+    @staticmethod
+    def checksum(record):
+        body = {key: value for key, value in record.items() if key != "crc"}
+        return zlib.crc32(json.dumps(body, sort_keys=True, separators=(',', ':')).encode())
+
+    def has_base(self):
+        """The first snapshot is always written before the journal file exists"""
+        return os.path.exists(self.journal_file)
+
+    def last_seq(self):
+        """Read the sequence number of the final record without scanning the file"""
+        if not os.path.exists(self.journal_file):
+            return 0
+        with open(self.journal_file, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 4096))
+            lines = f.read().splitlines()
+        for line in reversed(lines):
+            try:
+                return json.loads(line)["seq"]
+            except (ValueError, KeyError):
+                continue
+        return 0
+
+    def snapshot_file(self, seq):
+        return os.path.join(self.directory, f"snapshot_{seq:010d}.json")
+
+    def snapshots(self):
+        """Sequence numbers of the retained snapshots, oldest first"""
+        return sorted(
+            int(name[len("snapshot_"):-len(".json")])
+            for name in os.listdir(self.directory)
+            if name.startswith("snapshot_") and name.endswith(".json")
+        )
+
+    def snapshot(self, data, seq=None):
+        """Write a full snapshot of data as the state at seq"""
+        seq = self.last_seq() if seq is None else seq
+        temp_fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(temp_fd, 'w') as temp_file:
+            json.dump(data, temp_file, separators=(',', ':'))
+        os.replace(temp_path, self.snapshot_file(seq))
+        if not os.path.exists(self.journal_file):
+            open(self.journal_file, 'a').close()
+
+    def truncate_torn_tail(self):
+        """Cut off a final record left incomplete by a crash mid-append"""
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'rb+') as f:
+            end = f.seek(0, os.SEEK_END)
+            start = f.seek(max(0, end - 4096))
+            tail = f.read()
+            if tail and not tail.endswith(b"\n"):
+                f.truncate(start + tail.rfind(b"\n") + 1)
+
+    def append(self, records, data, force_snapshot=False):
+        """Journal records that produced data, snapshotting on interval boundaries"""
+        # Otherwise the first new record would share a line with the torn one and be skipped
+        self.truncate_torn_tail()
+        first_seq = self.last_seq() + 1
+        timestamp = datetime.now().isoformat()
+        lines = []
+        for seq, record in enumerate(records, start=first_seq):
+            record = dict(record, seq=seq, ts=timestamp)
+            record["crc"] = self.checksum(record)
+            lines.append(json.dumps(record, separators=(',', ':')) + "\n")
+        with open(self.journal_file, 'a') as f:
+            f.write("".join(lines))
+        last_seq = first_seq + len(records) - 1
+        if force_snapshot or (first_seq - 1) // self.snapshot_interval != last_seq // self.snapshot_interval:
+            self.snapshot(data, last_seq)
+            self.prune()
+        return last_seq
+
+    def prune(self):
+        """Drop snapshots beyond keep_snapshots and the records only they needed"""
+        snapshots = self.snapshots()
+        if len(snapshots) <= self.keep_snapshots:
+            return
+        for seq in snapshots[:-self.keep_snapshots]:
+            os.remove(self.snapshot_file(seq))
+        oldest = snapshots[-self.keep_snapshots]
+        kept = [record for record in self.records() if record["seq"] > oldest]
+        temp_fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(temp_fd, 'w') as temp_file:
+            for record in kept:
+                temp_file.write(json.dumps(record, separators=(',', ':')) + "\n")
+        os.replace(temp_path, self.journal_file)
+
+    def records(self):
+        """Yield journal records in order, stopping at the first corrupt one"""
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    return
+                if record.get("crc") != self.checksum(record):
+                    return
+                yield record
+
+    def resolve(self, point):
+        """Turn a sequence number or ISO timestamp into a sequence number"""
+        if str(point).isdigit():
+            return int(point)
+        target = datetime.fromisoformat(point)
+        seq = None
+        for record in self.records():
+            if datetime.fromisoformat(record["ts"]) > target:
+                break
+            seq = record["seq"]
+        if seq is None:
+            raise PortManagerError(f"No history recorded at or before {point}")
+        return seq
+
+    def state_at(self, seq):
+        """Rebuild the ports document as it was right after record seq"""
+        bases = [snapshot for snapshot in self.snapshots() if snapshot <= seq]
+        if not bases:
+            raise PortManagerError(f"No snapshot at or before sequence {seq}")
+        with open(self.snapshot_file(bases[-1]), 'r') as f:
+            data = json.load(f)
+        reached = bases[-1]
+        for record in self.records():
+            if record["seq"] <= bases[-1]:
+                continue
+            if record["seq"] > seq:
+                break
+            apply_record(data, record)
+            reached = record["seq"]
+        if reached != seq:
+            raise PortManagerError(f"Journal does not reach sequence {seq} (last valid record is {reached})")
+        return data
+
+def default_ports_data():
+    """Return the initial ports document with the standard environment ranges"""
+    return {
+        "environments": {
+            "development": {
+                "port_range": {"start": 5000, "end": 5999},
+                "assignments": {}
+            },
+            "staging": {
+                "port_range": {"start": 6000, "end": 6999},
+                "assignments": {}
+            },
+            "production": {
+                "port_range": {"start": 7000, "end": 7999},
+                "assignments": {}
+            }
+        }
+    }
+
 class PortManager:
-    def __init__(self, ports_file="ports.json", max_retries=3, retry_delay=1):
+    """Assigns, releases and migrates ports kept in ports.json.
+
+    Picking a free port is O(log n) through the free-port index, but every
+    direct operation still parses ports.json (unless the cached parse is
+    current) and rewrites all of it, so an assign or release costs O(size of
+    ports.json). Operations served by a running port daemon avoid that: it
+    keeps the state in memory and only appends to its write-ahead log.
+    """
+
+    def __init__(self, ports_file="ports.json", max_retries=3, retry_delay=1, store=None, read_cache=True,
+                 lock_timeout=30, max_retry_delay=2, metrics_file=None, use_daemon=True):
         self.ports_file = ports_file
+        # Route operations through a running port daemon, which owns ports.json while it runs
+        self.use_daemon = use_daemon
         self.max_retries = max_retries
+        # Retries back off exponentially from retry_delay up to max_retry_delay
         self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.lock_timeout = lock_timeout
+        self.metrics = PortMetrics(metrics_file)
+        # Serve read-only queries from a pre-parsed copy of ports.json
+        self.read_cache = read_cache
+        self._cached = None
+        # Optional state_store.SqliteStateStore used instead of ports.json
+        self.store = store
+        if store is not None:
+            if not store.has_port_ranges():
+                store.import_ports(default_ports_data())
+            return
         self.backup_dir = os.path.join(os.path.dirname(ports_file), '.port_manager_backups')
         os.makedirs(self.backup_dir, exist_ok=True)
+        self.journal = PortJournal(self.backup_dir)
         self.ensure_ports_file_exists()
 
-    def create_backup(self):
-        """Create a backup of the ports file"""
-        if not os.path.exists(self.ports_file):
-            return
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_file = os.path.join(self.backup_dir, f'ports_{timestamp}.json')
-        shutil.copy2(self.ports_file, backup_file)
-        
-        # Keep only last 5 backups
-        backups = sorted([f for f in os.listdir(self.backup_dir) if f.startswith('ports_')])
-        for old_backup in backups[:-5]:
-            os.remove(os.path.join(self.backup_dir, old_backup))
-
-    def atomic_write(self, data):
+    def atomic_write(self, data, path=None):
         """Write data atomically using a temporary file"""
+        path = path or self.ports_file
         # Create a temporary file in the same directory
-        temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.ports_file))
+        temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or None)
         try:
             with os.fdopen(temp_fd, 'w') as temp_file:
                 json.dump(data, temp_file, indent=2)
             # Atomic rename
-            os.replace(temp_path, self.ports_file)
+            os.replace(temp_path, path)
         except Exception:
             # Clean up the temporary file if something goes wrong
             if os.path.exists(temp_path):
                 os.unlink(temp_path)
             raise
 
-    def with_retries(self, func):
-        """Decorator to implement retry logic"""
+    def with_retries(self, func, name=None):
+        """Decorator to implement retry logic with exponential backoff and jitter"""
         def wrapper(*args, **kwargs):
+            self.metrics.start(name or func.__name__.lstrip('_'))
             last_error = None
             for attempt in range(self.max_retries):
                 try:
-                    return func(*args, **kwargs)
+                    result = func(*args, **kwargs)
+                    self.metrics.finish(ok=True)
+                    return result
                 except Exception as e:
                     last_error = e
-                    if attempt < self.max_retries - 1:
-                        time.sleep(self.retry_delay)
-                    continue
+                if attempt < self.max_retries - 1:
+                    self.metrics.add("retries", 1)
+                    delay = min(self.max_retry_delay, self.retry_delay * 2 ** attempt)
+                    time.sleep(random.uniform(delay / 2, delay))
+            self.metrics.finish(ok=False)
             raise PortManagerError(f"Operation failed after {self.max_retries} attempts: {last_error}")
         return wrapper
 
+    @contextmanager
+    def locked(self, shared=False):
+        """Hold the ports lock, polling with backoff until lock_timeout.
+
+        The lock lives on a separate lock file because ports.json itself is
+        replaced on every write, so a lock on its inode would not exclude a
+        process that opened the previous file.
+        """
+        mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        with open(self.lock_file, 'a') as lock:
+            started = time.perf_counter()
+            delay = 0.001
+            while True:
+                try:
+                    fcntl.flock(lock, mode | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    remaining = self.lock_timeout - (time.perf_counter() - started)
+                    if remaining <= 0:
+                        self.metrics.add("lock_wait", time.perf_counter() - started)
+                        raise PortLockTimeout(f"Timed out after {self.lock_timeout}s waiting for {self.lock_file}")
+                    time.sleep(min(remaining, random.uniform(delay / 2, delay)))
+                    delay = min(delay * 2, 0.1)
+            acquired = time.perf_counter()
+            self.metrics.add("lock_wait", acquired - started)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+                self.metrics.add("lock_hold", time.perf_counter() - acquired)
+
     def ensure_ports_file_exists(self):
         if not os.path.exists(self.ports_file):
-            self.atomic_write({
-                "environments": {
-                    "development": {
-                        "port_range": {"start": 5000, "end": 5999},
-                        "assignments": {}
-                    },
-                    "staging": {
-                        "port_range": {"start": 6000, "end": 6999},
-                        "assignments": {}
-                    },
-                    "production": {
-                        "port_range": {"start": 7000, "end": 7999},
-                        "assignments": {}
-                    }
-                }
-            })
+            self.atomic_write(default_ports_data())
 
     def get_environment_for_branch(self, branch_name):
         if branch_name.endswith("/master"):
@@ -97,116 +494,548 @@ class PortManager:
         """Get the path to the lock file"""
         return f"{self.ports_file}.lock"
 
-    def get_next_available_port(self, branch_name, target_env=None):
-        return self.with_retries(self._get_next_available_port)(branch_name, target_env)
+    @property
+    def socket_file(self):
+        """Get the path to the allocation daemon's Unix socket"""
+        return f"{self.ports_file}.sock"
 
-    def _get_next_available_port(self, branch_name, target_env=None):
-        self.create_backup()
-        with open(self.ports_file, 'r') as f:
-            fcntl.flock(f, fcntl.LOCK_EX)
+    @property
+    def wal_file(self):
+        """Get the path to the allocation daemon's write-ahead log"""
+        return f"{self.ports_file}.wal"
+
+    @property
+    def index_file(self):
+        """Get the path to the free-port index"""
+        return f"{self.ports_file}.index"
+
+    @property
+    def cache_file(self):
+        """Get the path to the pre-parsed read cache"""
+        return f"{self.ports_file}.cache"
+
+    def daemon_running(self):
+        """Whether a port daemon holds its instance lock on this ports file"""
+        try:
+            lock = open(f"{self.socket_file}.lock", 'r')
+        except FileNotFoundError:
+            return False
+        with lock:
             try:
-                data = json.load(f)
-                
-                # Determine environment
-                env = target_env or self.get_environment_for_branch(branch_name)
-                if env not in data["environments"]:
-                    raise PortManagerError(f"Invalid environment: {env}")
-                
-                env_data = data["environments"][env]
-                
-                # Get port range for environment
-                start_port = env_data["port_range"]["start"]
-                end_port = env_data["port_range"]["end"]
-                
-                # Get used ports
-                used_ports = set(env_data["assignments"].values())
-                
-                # Find next available port
-                for port in range(start_port, end_port + 1):
-                    if port not in used_ports:
-                        # Assign port
-                        env_data["assignments"][branch_name] = port
-                        
-                        # Write changes atomically
-                        self.atomic_write(data)
-                        return port
-                
-                raise PortManagerError(f"No available ports in range {start_port}-{end_port}")
-            finally:
-                fcntl.flock(f, fcntl.LOCK_UN)
+                fcntl.flock(lock, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(lock, fcntl.LOCK_UN)
+            return False
 
-    def release_port(self, branch_name, environment=None):
-        return self.with_retries(self._release_port)(branch_name, environment)
+    def daemon_client(self):
+        """Connected client for the daemon owning ports.json, or None if there is none.
+
+        While a daemon runs its in-memory state is authoritative and ports.json
+        lags behind it, so writing the file directly would be lost at the next
+        compaction. A daemon that is still starting is waited for.
+        """
+        if self.store is not None or not self.use_daemon:
+            return None
+        started = time.perf_counter()
+        while True:
+            client = PortDaemonClient.connect(self.socket_file, timeout=self.lock_timeout)
+            if client is not None or not self.daemon_running():
+                return client
+            if time.perf_counter() - started > self.lock_timeout:
+                raise PortLockTimeout(f"Port daemon for {self.ports_file} is running but not accepting connections")
+            time.sleep(0.05)
+
+    def _via_daemon(self, func):
+        """Return func(client) if a daemon owns ports.json, else None"""
+        client = self.daemon_client()
+        if client is None:
+            return None
+        try:
+            return (func(client),)
+        finally:
+            client.close()
+
+    def _ports_file_stamp(self, fd=None):
+        """Identify the current ports file contents without reading them"""
+        st = os.fstat(fd) if fd is not None else os.stat(self.ports_file)
+        return {"ino": st.st_ino, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
 
-    def _release_port(self, branch_name, environment=None):
-        self.create_backup()
-        with open(self.ports_file, 'r') as f:
-            fcntl.flock(f, fcntl.LOCK_EX)
+    def _load_cached(self, f):
+        """Parse the locked ports file f, reusing a cached parse if it is unchanged.
+
+        The parse is memoised in-process and also kept on disk as a marshal
+        payload behind a one-line stamp header, read through mmap so that
+        short-lived CLI processes skip JSON parsing too.
+        """
+        stamp = self._ports_file_stamp(f.fileno())
+        header = f"{stamp['ino']} {stamp['size']} {stamp['mtime_ns']}\n".encode()
+        if self._cached is not None and self._cached[0] == header:
+            return self._cached[1]
+        data = None
+        try:
+            with open(self.cache_file, 'rb') as cache:
+                with mmap.mmap(cache.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if mm[:len(header)] == header:
+                        data = marshal.loads(mm[len(header):])
+        except (OSError, ValueError, EOFError, TypeError):
+            data = None
+        if data is None:
+            data = json.load(f)
             try:
+                temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.cache_file) or None)
+                with os.fdopen(temp_fd, 'wb') as temp_file:
+                    temp_file.write(header + marshal.dumps(data))
+                os.replace(temp_path, self.cache_file)
+            except OSError:
+                # The cache is an optimisation only
+                pass
+        self._cached = (header, data)
+        return data
+
+    def _read(self, func):
+        """Run func(data) under a shared lock without writing anything"""
+        with self.locked(shared=True), open(self.ports_file, 'r') as f:
+            data = self._load_cached(f) if self.read_cache else json.load(f)
+            return func(data)
+
+    def load_index(self, data):
+        """Load the free-port index, rebuilding it if stale or from another schema"""
+        try:
+            with open(self.index_file, 'r') as f:
+                stored = json.load(f)
+            if (stored.get("schema") != INDEX_SCHEMA_VERSION
+                    or stored.get("source") != self._ports_file_stamp()):
+                raise ValueError("stale index")
+            index = {}
+            for env, env_data in data["environments"].items():
+                entry = stored["environments"][env]
+                port_range = env_data["port_range"]
+                if entry["port_range"] != [port_range["start"], port_range["end"]]:
+                    raise ValueError("port range changed")
+                index[env] = FreePortIndex(port_range["start"], port_range["end"], entry["free"])
+            return index
+        except (OSError, ValueError, KeyError, TypeError):
+            return self.rebuild_index(data)
+
+    def rebuild_index(self, data):
+        """Rebuild the free-port index from the assignments in data"""
+        return {
+            env: FreePortIndex.from_assignments(env_data["port_range"], env_data["assignments"])
+            for env, env_data in data["environments"].items()
+        }
+
+    def save_index(self, index):
+        """Persist the free-port index, stamped against the current ports file"""
+        self.atomic_write({
+            "schema": INDEX_SCHEMA_VERSION,
+            "source": self._ports_file_stamp(),
+            "environments": {env: env_index.to_dict() for env, env_index in index.items()}
+        }, path=self.index_file)
+
+    def commit(self, data, index):
+        """Write the ports file followed by the index that matches it"""
+        self.atomic_write(data)
+        self.save_index(index)
+
+    def _assign(self, data, index, env, branch_name):
+        """Assign the lowest free port in env to branch_name"""
+        env_data = data["environments"][env]
+        port = index[env].allocate()
+        if port is None:
+            start_port = env_data["port_range"]["start"]
+            end_port = env_data["port_range"]["end"]
+            raise PortManagerError(f"No available ports in range {start_port}-{end_port}")
+        previous = env_data["assignments"].get(branch_name)
+        env_data["assignments"][branch_name] = port
+        if previous is not None:
+            index[env].release(previous)
+        return port
+
+    def validate_environments(self, data, *envs):
+        invalid = [env for env in envs if env not in data["environments"]]
+        if len(envs) == 1 and invalid:
+            raise PortManagerError(f"Invalid environment: {envs[0]}")
+        if invalid:
+            raise PortManagerError(f"Invalid environment(s): {' and/or '.join(envs)}")
+
+    def apply_operation(self, data, index, operation):
+        """Apply a single operation to data and index in memory.
+
+        Returns a (result, records) tuple where records are the set/del journal
+        records describing the change (empty for a no-op); nothing is written
+        to disk here.
+        """
+        action = operation.get("action")
+        branch_name = operation.get("branch")
+        if not branch_name:
+            raise PortManagerError(f"Operation is missing a branch: {operation}")
+
+        if action == "assign":
+            env = operation.get("env") or self.get_environment_for_branch(branch_name)
+            self.validate_environments(data, env)
+            # Re-running a pipeline must not hand the branch a second port
+            existing = data["environments"][env]["assignments"].get(branch_name)
+            if existing is not None:
+                return {"env": env, "port": existing}, []
+            port = self._assign(data, index, env, branch_name)
+            return {"env": env, "port": port}, [set_record(env, branch_name, port)]
+
+        if action == "release":
+            env = operation.get("env") or self.get_environment_for_branch(branch_name)
+            self.validate_environments(data, env)
+            port = data["environments"][env]["assignments"].pop(branch_name, None)
+            if port is not None:
+                index[env].release(port)
+            return {"env": env, "released": port}, [del_record(env, branch_name)] if port is not None else []
+
+        if action == "migrate":
+            from_env = operation.get("from_env")
+            to_env = operation.get("to_env")
+            if not from_env or not to_env:
+                raise PortManagerError("migrate requires from_env and to_env parameters")
+            self.validate_environments(data, from_env, to_env)
+            port = self._assign(data, index, to_env, branch_name)
+            return {"env": to_env, "port": port}, [set_record(to_env, branch_name, port)]
+
+        raise PortManagerError(f"Unknown action: {action}")
+
+    def _transaction(self, func):
+        """Run func(data, index) under the lock and persist if it changed anything"""
+        with self.locked():
+            # A daemon that started since the caller looked has already loaded ports.json
+            # and would drop this write at its next compaction
+            if self.use_daemon and self.daemon_running():
+                raise PortDaemonStarted(f"A port daemon now serves {self.ports_file}")
+            with open(self.ports_file, 'r') as f:
                 data = json.load(f)
-                
-                # Determine environment
-                env = environment or self.get_environment_for_branch(branch_name)
-                if env not in data["environments"]:
-                    raise PortManagerError(f"Invalid environment: {env}")
-                
-                # Remove port assignment if it exists
-                if branch_name in data["environments"][env]["assignments"]:
-                    del data["environments"][env]["assignments"][branch_name]
-                    
-                    # Write changes atomically
-                    self.atomic_write(data)
-            finally:
-                fcntl.flock(f, fcntl.LOCK_UN)
+            if not self.journal.has_base():
+                self.journal.snapshot(data)
+            index = self.load_index(data)
+            result, records = func(data, index)
+            if records:
+                # Write changes atomically, then journal them
+                self.commit(data, index)
+                self.journal.append(records, data)
+            return result
+
+    def resolve_environment(self, operation):
+        """Fill in the branch's default environment for assign/release operations"""
+        if operation.get("action") in ("assign", "release") and not operation.get("env") and operation.get("branch"):
+            return dict(operation, env=self.get_environment_for_branch(operation["branch"]))
+        return operation
+
+    def _mutate(self, via_daemon, func):
+        """Return via_daemon(client) if a daemon owns ports.json, else run func in a transaction"""
+        routed = self._via_daemon(via_daemon)
+        if routed is None:
+            try:
+                return self._transaction(func)
+            except PortDaemonStarted:
+                routed = self._via_daemon(via_daemon)
+                if routed is None:
+                    raise PortManagerError(f"The port daemon for {self.ports_file} stopped while starting")
+        return routed[0]
+
+    def _run_operation(self, operation):
+        if self.store is not None:
+            from state_store import StateStoreError
+            try:
+                return self.store.apply_port_operation(self.resolve_environment(operation))
+            except StateStoreError as e:
+                raise PortManagerError(str(e))
+        return self._mutate(lambda client: client.call(self.resolve_environment(operation)),
+                            lambda data, index: self.apply_operation(data, index, operation))
+
+    def get_next_available_port(self, branch_name, target_env=None):
+        operation = {"action": "assign", "branch": branch_name, "env": target_env}
+        return self.with_retries(self._run_operation, "assign")(operation)["port"]
+
+    def release_port(self, branch_name, environment=None):
+        operation = {"action": "release", "branch": branch_name, "env": environment}
+        self.with_retries(self._run_operation, "release")(operation)
 
     def migrate_port(self, branch_name, from_env, to_env):
-        return self.with_retries(self._migrate_port)(branch_name, from_env, to_env)
+        operation = {"action": "migrate", "branch": branch_name, "from_env": from_env, "to_env": to_env}
+        return self.with_retries(self._run_operation, "migrate")(operation)["port"]
+
+    def apply_batch(self, operations):
+        """Apply many assign/release/migrate operations under one lock and one write.
+
+        Each operation is a dict with an "action" and "branch" plus "env" (assign,
+        release) or "from_env"/"to_env" (migrate). A failing operation does not
+        stop the others; its result carries "ok": False and the error message.
+        """
+        if self.store is not None:
+            return self.with_retries(self.store.apply_port_operations, "batch")(
+                [self.resolve_environment(operation) for operation in operations]
+            )
+        return self.with_retries(self._mutate, "batch")(
+            lambda client: client.apply_batch(operations),
+            lambda data, index: self.apply_operations(data, index, operations)
+        )
+
+    def lookup_in(self, data, branch_name, environment=None):
+        """Return the port branch_name holds in its environment, or None"""
+        env = environment or self.get_environment_for_branch(branch_name)
+        self.validate_environments(data, env)
+        return {"env": env, "branch": branch_name, "port": data["environments"][env]["assignments"].get(branch_name)}
+
+    def list_in(self, data, environment=None):
+        """Return {env: {branch: port}} for one or all environments"""
+        envs = [environment] if environment else list(data["environments"])
+        self.validate_environments(data, *envs)
+        return {env: dict(data["environments"][env]["assignments"]) for env in envs}
+
+    def stats_in(self, data, index=None):
+        """Return per-environment range size, usage and lowest free port.
 
-    def _migrate_port(self, branch_name, from_env, to_env):
-        self.create_backup()
-        with open(self.ports_file, 'r') as f:
-            fcntl.flock(f, fcntl.LOCK_EX)
+        Uses the free-port index when given one, otherwise builds it from data.
+        """
+        stats = {}
+        for env, env_data in data["environments"].items():
+            env_index = index[env] if index is not None else FreePortIndex.from_assignments(
+                env_data["port_range"], env_data["assignments"])
+            size = env_index.end_port - env_index.start_port + 1
+            free = sum(end - start + 1 for start, end in env_index.intervals)
+            stats[env] = {
+                "port_range": [env_index.start_port, env_index.end_port],
+                "assigned": len(env_data["assignments"]),
+                "free": free,
+                "utilization": round((size - free) / size, 4) if size else 0.0,
+                "next_free": env_index.intervals[0][0] if env_index.intervals else None,
+            }
+        return stats
+
+    def lookup_port(self, branch_name, environment=None):
+        """Return the port assigned to branch_name, or None if it has none"""
+        routed = self._via_daemon(lambda client: client.lookup_port(branch_name, environment))
+        if routed is not None:
+            return routed[0]
+        if self.store is not None:
+            env = environment or self.get_environment_for_branch(branch_name)
+            return self.store.lookup_port(branch_name, env).get(env)
+        return self.with_retries(self._read, "lookup")(
+            lambda data: self.lookup_in(data, branch_name, environment)
+        )["port"]
+
+    def list_assignments(self, environment=None):
+        routed = self._via_daemon(lambda client: client.list_assignments(environment))
+        if routed is not None:
+            return routed[0]
+        if self.store is not None:
+            data = self.store.export_ports()
+            return self.list_in(data, environment)
+        return self.with_retries(self._read, "list")(lambda data: self.list_in(data, environment))
+
+    def stats(self):
+        routed = self._via_daemon(lambda client: client.stats())
+        if routed is not None:
+            return routed[0]
+        if self.store is not None:
+            return self.stats_in(self.store.export_ports())
+        return self.with_retries(self._read, "stats")(lambda data: self.stats_in(data, self.load_index(data)))
+
+    def history(self, limit=20):
+        """Return the most recent journal records, oldest first"""
+        if self.store is not None:
+            raise PortManagerError("History is not journaled when using the state store")
+        records = list(self.journal.records())
+        return records[-limit:] if limit else records
+
+    def restore(self, point):
+        """Restore ports.json to its state at a journal sequence number or ISO timestamp.
+
+        The restore itself is journaled, so it can be undone the same way.
+        """
+        if self.store is not None:
+            raise PortManagerError("Restore is not available when using the state store")
+        if self.daemon_running():
+            raise PortManagerError("Stop the port daemon before restoring")
+        with self.locked():
+            if self.daemon_running():
+                raise PortManagerError("Stop the port daemon before restoring")
+            seq = self.journal.resolve(point)
+            data = self.journal.state_at(seq)
+            self.commit(data, self.rebuild_index(data))
+            self.journal.append([{"op": "restore", "to_seq": seq}], data, force_snapshot=True)
+            return seq
+
+    def apply_operations(self, data, index, operations):
+        """Apply operations in memory, returning (per-operation results, records)"""
+        results = []
+        records = []
+        for operation in operations:
+            result = {"action": operation.get("action"), "branch": operation.get("branch")}
             try:
-                data = json.load(f)
-                
-                # Validate environments
-                if from_env not in data["environments"] or to_env not in data["environments"]:
-                    raise PortManagerError(f"Invalid environment(s): {from_env} and/or {to_env}")
-                
-                # Get target environment port range
-                target_env_data = data["environments"][to_env]
-                start_port = target_env_data["port_range"]["start"]
-                end_port = target_env_data["port_range"]["end"]
-                
-                # Get used ports in target environment
-                used_ports = set(target_env_data["assignments"].values())
-                
-                # Find next available port in target environment
-                for port in range(start_port, end_port + 1):
-                    if port not in used_ports:
-                        # Assign new port in target environment
-                        target_env_data["assignments"][branch_name] = port
-                        
-                        # Write changes atomically
-                        self.atomic_write(data)
-                        return port
-                
-                raise PortManagerError(f"No available ports in target environment range {start_port}-{end_port}")
-            finally:
-                fcntl.flock(f, fcntl.LOCK_UN)
+                outcome, op_records = self.apply_operation(data, index, operation)
+                result.update(outcome, ok=True)
+                records.extend(op_records)
+            except PortManagerError as e:
+                result.update(ok=False, error=str(e))
+            results.append(result)
+        return results, records
+
+class PortDaemonClient:
+    """Sends operations to a running 'port_manager.py serve' daemon.
+
+    Mirrors the PortManager operation methods so the CLI can use either.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.reader = sock.makefile('r')
+        self.next_id = 0
+
+    @classmethod
+    def connect(cls, socket_path, timeout=30):
+        """Return a connected client, or None when no daemon is listening"""
+        if not os.path.exists(socket_path):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            # Stale socket file left behind by a daemon that is gone
+            sock.close()
+            return None
+        return cls(sock)
+
+    def request(self, requests):
+        """Send requests pipelined on one connection and return their responses"""
+        lines = []
+        for request in requests:
+            self.next_id += 1
+            lines.append(json.dumps(dict(request, id=self.next_id)))
+        self.sock.sendall(("\n".join(lines) + "\n").encode())
+        responses = []
+        for _ in requests:
+            line = self.reader.readline()
+            if not line:
+                raise PortManagerError("Port daemon closed the connection")
+            responses.append(json.loads(line))
+        return responses
+
+    def call(self, request):
+        response = self.request([request])[0]
+        if not response.get("ok"):
+            raise PortManagerError(response.get("error", "Port daemon request failed"))
+        return response
+
+    def get_next_available_port(self, branch_name, target_env=None):
+        return self.call({"action": "assign", "branch": branch_name, "env": target_env})["port"]
+
+    def release_port(self, branch_name, environment=None):
+        self.call({"action": "release", "branch": branch_name, "env": environment})
+
+    def migrate_port(self, branch_name, from_env, to_env):
+        return self.call({
+            "action": "migrate", "branch": branch_name, "from_env": from_env, "to_env": to_env
+        })["port"]
+
+    def apply_batch(self, operations):
+        return self.call({"action": "batch", "operations": operations})["results"]
+
+    def lookup_port(self, branch_name, environment=None):
+        return self.call({"action": "lookup", "branch": branch_name, "env": environment})["port"]
+
+    def list_assignments(self, environment=None):
+        return self.call({"action": "list", "env": environment})["assignments"]
+
+    def stats(self):
+        return self.call({"action": "stats"})["stats"]
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+def read_operations(source):
+    """Read batch operations from a JSON array or JSON Lines text"""
+    text = source.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+USAGE = (
+    "Usage: port_manager.py [assign|release|migrate] <branch_name> [from_env] [to_env]\n"
+    "       port_manager.py batch [operations_file|-]\n"
+    "       port_manager.py lookup <branch_name> [env]\n"
+    "       port_manager.py list [env]\n"
+    "       port_manager.py stats\n"
+    "       port_manager.py history [limit]\n"
+    "       port_manager.py metrics\n"
+    "       port_manager.py restore <seq|iso_timestamp>\n"
+    "       port_manager.py serve"
+)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: port_manager.py [assign|release|migrate] <branch_name> [from_env] [to_env]")
+    if len(sys.argv) < 2 or (sys.argv[1] not in ("batch", "serve", "history", "list", "stats", "metrics") and len(sys.argv) < 3):
+        print(USAGE)
         sys.exit(1)
 
     action = sys.argv[1]
-    branch_name = sys.argv[2]
     
-    manager = PortManager()
+    # Timings are recorded next to the ports file (or STATE_DB); PORT_MANAGER_METRICS overrides
+    # the path and empty disables them
+    state_file = os.environ.get("STATE_DB") or "ports.json"
+    metrics_file = os.environ.get("PORT_MANAGER_METRICS", f"{state_file}.metrics")
+    # STATE_DB switches from ports.json to the SQLite state store
+    if os.environ.get("STATE_DB"):
+        from state_store import SqliteStateStore
+        manager = PortManager(store=SqliteStateStore(os.environ["STATE_DB"]), metrics_file=metrics_file)
+    else:
+        manager = PortManager(metrics_file=metrics_file)
     
     try:
-        if action == "assign":
+        if action == "serve":
+            from port_daemon import PortDaemon
+            PortDaemon.for_ports_file(manager.ports_file).run()
+            sys.exit(0)
+
+        if action == "metrics":
+            print(manager.metrics.prometheus(), end="")
+            sys.exit(0)
+        if action == "history":
+            limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+            for record in manager.history(limit):
+                print(json.dumps(record))
+            sys.exit(0)
+        if action == "restore":
+            seq = manager.restore(sys.argv[2])
+            print(f"Restored {manager.ports_file} to sequence {seq}")
+            sys.exit(0)
+
+        if action == "batch":
+            source = sys.argv[2] if len(sys.argv) > 2 else "-"
+            if source == "-":
+                operations = read_operations(sys.stdin)
+            else:
+                with open(source, 'r') as f:
+                    operations = read_operations(f)
+            results = manager.apply_batch(operations)
+            # One JSON result per line, in the order the operations were given
+            for result in results:
+                print(json.dumps(result))
+            sys.exit(0 if all(result["ok"] for result in results) else 1)
+
+        if action == "list":
+            environment = sys.argv[2] if len(sys.argv) > 2 else None
+            print(json.dumps(manager.list_assignments(environment), indent=2))
+            sys.exit(0)
+        if action == "stats":
+            print(json.dumps(manager.stats(), indent=2))
+            sys.exit(0)
+
+        branch_name = sys.argv[2]
+        if action == "lookup":
+            environment = sys.argv[3] if len(sys.argv) > 3 else None
+            port = manager.lookup_port(branch_name, environment)
+            if port is None:
+                print(f"Error: no port assigned to {branch_name}", file=sys.stderr)
+                sys.exit(1)
+            print(f"APP_PORT={port}")
+        elif action == "assign":
             target_env = sys.argv[3] if len(sys.argv) > 3 else None
             port = manager.get_next_available_port(branch_name, target_env)
             # Output in GitHub Actions environment format
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import sqlite3
+import tempfile
+import argparse
+from contextlib import contextmanager
+
+# Bump whenever the table layout below changes
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS port_ranges (
+    env TEXT PRIMARY KEY,
+    start_port INTEGER NOT NULL,
+    end_port INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS port_assignments (
+    env TEXT NOT NULL REFERENCES port_ranges(env),
+    branch TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    PRIMARY KEY (env, branch),
+    UNIQUE (env, port)
+);
+CREATE INDEX IF NOT EXISTS port_assignments_branch ON port_assignments(branch);
+CREATE TABLE IF NOT EXISTS feature_branches (
+    branch TEXT PRIMARY KEY,
+    microservice TEXT,
+    created_at TEXT,
+    last_updated TEXT,
+    environment_path TEXT
+);
+CREATE TABLE IF NOT EXISTS staging_references (
+    staging_path TEXT PRIMARY KEY,
+    source_branch TEXT NOT NULL,
+    linked_at TEXT
+);
+CREATE INDEX IF NOT EXISTS staging_references_source ON staging_references(source_branch);
+CREATE TABLE IF NOT EXISTS environment_states (
+    path TEXT PRIMARY KEY,
+    type TEXT,
+    source TEXT,
+    created_at TEXT
+);
+CREATE INDEX IF NOT EXISTS environment_states_source ON environment_states(source);
+"""
+
+# Tracking sections of environment_tracking.json and the table, key column
+# and value columns each one is stored in
+TRACKING_TABLES = {
+    "feature_branches": ("feature_branches", "branch",
+                         ("microservice", "created_at", "last_updated", "environment_path")),
+    "staging_references": ("staging_references", "staging_path", ("source_branch", "linked_at")),
+    "environment_states": ("environment_states", "path", ("type", "source", "created_at")),
+}
+
+class StateStoreError(Exception):
+    """Custom exception for StateStore errors"""
+    pass
+
+class SqliteStateStore:
+    """SQLite (WAL mode) storage for port assignments and environment tracking.
+
+    Holds the same state as ports.json and environment_tracking.json, but each
+    mutation is a row-level transaction and lookups by environment, branch or
+    port go through indexes instead of parsing and rewriting whole files.
+    """
+
+    def __init__(self, db_path="state.db", timeout=30):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise StateStoreError(f"Unsupported state schema version {version} in {db_path}")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    @contextmanager
+    def transaction(self):
+        """Run a block as one write transaction, taking the write lock up front.
+
+        Nested use joins the enclosing transaction.
+        """
+        if self.conn.in_transaction:
+            yield self.conn
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def close(self):
+        self.conn.close()
+
+    # Port assignments
+
+    def has_port_ranges(self):
+        return self.conn.execute("SELECT 1 FROM port_ranges LIMIT 1").fetchone() is not None
+
+    def _port_range(self, env):
+        row = self.conn.execute(
+            "SELECT start_port, end_port FROM port_ranges WHERE env = ?", (env,)
+        ).fetchone()
+        if row is None:
+            raise StateStoreError(f"Invalid environment: {env}")
+        return row
+
+    def _assign(self, env, branch_name):
+        """Assign the lowest free port in env to branch_name"""
+        start_port, end_port = self._port_range(env)
+        # The lowest free port is either the start of the range or directly
+        # after some used port; both candidates are checked via the port index
+        row = self.conn.execute("""
+            SELECT candidate FROM (
+                SELECT ? AS candidate
+                UNION ALL
+                SELECT port + 1 FROM port_assignments WHERE env = ?
+            )
+            WHERE candidate BETWEEN ? AND ?
+              AND NOT EXISTS (
+                SELECT 1 FROM port_assignments WHERE env = ? AND port = candidate
+              )
+            ORDER BY candidate
+            LIMIT 1
+        """, (start_port, env, start_port, end_port, env)).fetchone()
+        if row is None:
+            raise StateStoreError(f"No available ports in range {start_port}-{end_port}")
+        port = row[0]
+        updated = self.conn.execute(
+            "UPDATE port_assignments SET port = ? WHERE env = ? AND branch = ?",
+            (port, env, branch_name),
+        ).rowcount
+        if not updated:
+            self.conn.execute(
+                "INSERT INTO port_assignments (env, branch, port) VALUES (?, ?, ?)",
+                (env, branch_name, port),
+            )
+        return port
+
+    def _apply(self, operation):
+        """Apply one operation with its environment(s) already resolved"""
+        action = operation.get("action")
+        branch_name = operation.get("branch")
+        if not branch_name:
+            raise StateStoreError(f"Operation is missing a branch: {operation}")
+
+        if action == "assign":
+            env = operation["env"]
+            self._port_range(env)
+            existing = self.lookup_port(branch_name, env).get(env)
+            if existing is not None:
+                return {"env": env, "port": existing}
+            return {"env": env, "port": self._assign(env, branch_name)}
+
+        if action == "release":
+            env = operation["env"]
+            self._port_range(env)
+            row = self.conn.execute(
+                "DELETE FROM port_assignments WHERE env = ? AND branch = ? RETURNING port",
+                (env, branch_name),
+            ).fetchone()
+            return {"env": env, "released": row[0] if row else None}
+
+        if action == "migrate":
+            from_env = operation.get("from_env")
+            to_env = operation.get("to_env")
+            if not from_env or not to_env:
+                raise StateStoreError("migrate requires from_env and to_env parameters")
+            try:
+                self._port_range(from_env)
+                self._port_range(to_env)
+            except StateStoreError:
+                raise StateStoreError(f"Invalid environment(s): {from_env} and/or {to_env}")
+            return {"env": to_env, "port": self._assign(to_env, branch_name)}
+
+        raise StateStoreError(f"Unknown action: {action}")
+
+    def apply_port_operation(self, operation):
+        """Apply one operation in its own transaction, raising on failure"""
+        with self.transaction():
+            return self._apply(operation)
+
+    def apply_port_operations(self, operations):
+        """Apply many operations in one transaction with per-operation results"""
+        results = []
+        with self.transaction():
+            for operation in operations:
+                result = {"action": operation.get("action"), "branch": operation.get("branch")}
+                self.conn.execute("SAVEPOINT operation")
+                try:
+                    result.update(self._apply(operation), ok=True)
+                    self.conn.execute("RELEASE operation")
+                except StateStoreError as e:
+                    self.conn.execute("ROLLBACK TO operation")
+                    self.conn.execute("RELEASE operation")
+                    result.update(ok=False, error=str(e))
+                results.append(result)
+        return results
+
+    def lookup_port(self, branch_name, env=None):
+        """Return {env: port} for the branch, optionally limited to one environment"""
+        if env is None:
+            rows = self.conn.execute(
+                "SELECT env, port FROM port_assignments WHERE branch = ?", (branch_name,)
+            )
+        else:
+            rows = self.conn.execute(
+                "SELECT env, port FROM port_assignments WHERE env = ? AND branch = ?", (env, branch_name)
+            )
+        return dict(rows.fetchall())
+
+    def import_ports(self, data):
+        """Replace all port state with the contents of a ports.json document"""
+        with self.transaction():
+            self.conn.execute("DELETE FROM port_assignments")
+            self.conn.execute("DELETE FROM port_ranges")
+            for env, env_data in data["environments"].items():
+                self.conn.execute(
+                    "INSERT INTO port_ranges (env, start_port, end_port) VALUES (?, ?, ?)",
+                    (env, env_data["port_range"]["start"], env_data["port_range"]["end"]),
+                )
+                self.conn.executemany(
+                    "INSERT INTO port_assignments (env, branch, port) VALUES (?, ?, ?)",
+                    ((env, branch, port) for branch, port in env_data["assignments"].items()),
+                )
+
+    def export_ports(self):
+        """Return port state in the ports.json document format"""
+        environments = {}
+        for env, start_port, end_port in self.conn.execute(
+            "SELECT env, start_port, end_port FROM port_ranges ORDER BY rowid"
+        ):
+            environments[env] = {"port_range": {"start": start_port, "end": end_port}, "assignments": {}}
+        for env, branch, port in self.conn.execute(
+            "SELECT env, branch, port FROM port_assignments ORDER BY rowid"
+        ):
+            environments[env]["assignments"][branch] = port
+        return {"environments": environments}
+
+    # Environment tracking
+
+    def get_tracking(self, section, key):
+        """Return one tracking record as a dict, or None if it does not exist"""
+        table, key_column, columns = TRACKING_TABLES[section]
+        row = self.conn.execute(
+            f"SELECT {', '.join(columns)} FROM {table} WHERE {key_column} = ?", (key,)
+        ).fetchone()
+        return dict(zip(columns, row)) if row else None
+
+    def all_tracking(self, section):
+        """Return every record of one tracking section as {key: record}"""
+        table, key_column, columns = TRACKING_TABLES[section]
+        rows = self.conn.execute(f"SELECT {key_column}, {', '.join(columns)} FROM {table} ORDER BY rowid")
+        return {row[0]: dict(zip(columns, row[1:])) for row in rows}
+
+    def put_tracking(self, section, key, record):
+        table, key_column, columns = TRACKING_TABLES[section]
+        placeholders = ", ".join("?" * (len(columns) + 1))
+        with self.transaction():
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {table} ({key_column}, {', '.join(columns)}) VALUES ({placeholders})",
+                (key, *(record.get(column) for column in columns)),
+            )
+
+    def delete_tracking(self, section, key):
+        table, key_column, _ = TRACKING_TABLES[section]
+        with self.transaction():
+            self.conn.execute(f"DELETE FROM {table} WHERE {key_column} = ?", (key,))
+
+    def find_tracking(self, section, column, value):
+        """Return the keys of tracking records whose column equals value"""
+        table, key_column, columns = TRACKING_TABLES[section]
+        if column not in columns:
+            raise StateStoreError(f"Unknown {section} column: {column}")
+        rows = self.conn.execute(f"SELECT {key_column} FROM {table} WHERE {column} = ?", (value,))
+        return [row[0] for row in rows]
+
+    def is_staging_source(self, source_branch):
+        """Check whether any staging reference points back at source_branch"""
+        return self.conn.execute(
+            "SELECT 1 FROM staging_references WHERE source_branch = ? LIMIT 1", (source_branch,)
+        ).fetchone() is not None
+
+    def import_tracking(self, tracking_data):
+        """Replace all tracking state with an environment_tracking.json document"""
+        with self.transaction():
+            for section, (table, key_column, columns) in TRACKING_TABLES.items():
+                self.conn.execute(f"DELETE FROM {table}")
+                placeholders = ", ".join("?" * (len(columns) + 1))
+                self.conn.executemany(
+                    f"INSERT INTO {table} ({key_column}, {', '.join(columns)}) VALUES ({placeholders})",
+                    ((key, *(record.get(column) for column in columns))
+                     for key, record in tracking_data.get(section, {}).items()),
+                )
+
+    def export_tracking(self):
+        """Return tracking state in the environment_tracking.json document format"""
+        tracking_data = {}
+        for section in TRACKING_TABLES:
+            tracking_data[section] = self.all_tracking(section)
+        return tracking_data
+
+def atomic_write(data, path):
+    """Write data as JSON to path atomically using a temporary file"""
+    temp_fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or None)
+    try:
+        with os.fdopen(temp_fd, 'w') as temp_file:
+            json.dump(data, temp_file, indent=2)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export SQLite-backed deployment state")
+    parser.add_argument('action', choices=['import', 'export'])
+    parser.add_argument('--db', default='state.db', help='SQLite database path')
+    parser.add_argument('--ports', default='ports.json', help='ports.json path')
+    parser.add_argument('--tracking', default='environment_tracking.json', help='environment tracking file path')
+
+    args = parser.parse_args()
+    store = SqliteStateStore(args.db)
+
+    try:
+        if args.action == 'import':
+            with open(args.ports, 'r') as f:
+                store.import_ports(json.load(f))
+            try:
+                with open(args.tracking, 'r') as f:
+                    store.import_tracking(json.load(f))
+            except FileNotFoundError:
+                pass
+
+        elif args.action == 'export':
+            # Pipelines may read these files while the export runs
+            atomic_write(store.export_ports(), args.ports)
+            atomic_write(store.export_tracking(), args.tracking)
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        exit(1)
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,51 +1,286 @@
 #!/usr/bin/env python3
 
 import os
+import re
+import json
 import glob
+import heapq
+import xml.etree.ElementTree as ET
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
-def generate_report(report_dir):
-    """Generate a markdown report of test results."""
+TEST_TYPES = ["mandatory", "recommended", "optional"]
+SLOWEST_TESTS = 10
+# Slowest tests per suite whose durations are kept in the trend store
+TRACKED_TESTS = 50
+
+def _local_name(tag):
+    # Strip any {namespace} prefix
+    return tag.rsplit("}", 1)[-1]
+
+def parse_coverage(path):
+    """Return line/branch totals from a Cobertura coverage XML file.
+
+    Totals are read from the root element's attributes, so parsing stops
+    after the first tag; reports without them are counted line by line,
+    discarding each element once read.
+    """
+    totals = {"lines_valid": 0, "lines_covered": 0, "branches_valid": 0, "branches_covered": 0}
+    context = ET.iterparse(path, events=("start", "end"))
+    _, root = next(context)
+    if "lines-valid" in root.attrib:
+        totals["lines_valid"] = int(root.get("lines-valid", 0))
+        totals["lines_covered"] = int(root.get("lines-covered", 0))
+        totals["branches_valid"] = int(root.get("branches-valid", 0))
+        totals["branches_covered"] = int(root.get("branches-covered", 0))
+        return totals
+
+    for event, elem in context:
+        if event != "end" or _local_name(elem.tag) != "line":
+            continue
+        totals["lines_valid"] += 1
+        if int(elem.get("hits", 0)) > 0:
+            totals["lines_covered"] += 1
+        match = re.search(r"\((\d+)/(\d+)\)", elem.get("condition-coverage", ""))
+        if elem.get("branch") == "true" and match:
+            totals["branches_covered"] += int(match.group(1))
+            totals["branches_valid"] += int(match.group(2))
+        elem.clear()
+    root.clear()
+    return totals
+
+def parse_junit(path, slowest=SLOWEST_TESTS):
+    """Return pass/fail/skip counts, total duration and the slowest tests from a JUnit XML file.
+
+    Test cases are processed as they are parsed and then discarded, so
+    memory stays flat however many tests the report holds.
+    """
+    totals = {"tests": 0, "passed": 0, "failed": 0, "errors": 0, "skipped": 0, "duration": 0.0, "slowest": []}
+    # Open elements, so each finished test case can be detached from its parent
+    stack = []
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            continue
+        stack.pop()
+        if _local_name(elem.tag) != "testcase":
+            continue
+        duration = float(elem.get("time") or 0)
+        outcomes = {_local_name(child.tag) for child in elem}
+        totals["tests"] += 1
+        totals["duration"] += duration
+        if "failure" in outcomes:
+            totals["failed"] += 1
+        elif "error" in outcomes:
+            totals["errors"] += 1
+        elif "skipped" in outcomes:
+            totals["skipped"] += 1
+        else:
+            totals["passed"] += 1
+        name = f"{elem.get('classname', '')}::{elem.get('name', '')}".lstrip(":")
+        if len(totals["slowest"]) < slowest:
+            heapq.heappush(totals["slowest"], (duration, name))
+        else:
+            heapq.heappushpop(totals["slowest"], (duration, name))
+        if stack:
+            stack[-1].remove(elem)
+    return totals
+
+def parse_benchmarks(path):
+    """Return {benchmark: {statistic: value}} from a benchmark-*.json file"""
+    with open(path, 'r') as f:
+        return json.load(f).get("benchmarks", {})
+
+def _parse_file(kind, path):
+    if kind == "coverage":
+        return parse_coverage(path)
+    if kind == "benchmarks":
+        return parse_benchmarks(path)
+    return parse_junit(path, TRACKED_TESTS)
+
+def collect_results(report_dir, max_workers=None):
+    """Parse every coverage-*.xml, junit-*.xml and benchmark-*.json in report_dir, in parallel.
+
+    Returns {suite: {"coverage": totals or None, "tests": totals or None, "benchmarks": results or None}}.
+    """
+    jobs = []
+    for kind, pattern in (("coverage", "coverage-*.xml"), ("tests", "junit-*.xml"), ("benchmarks", "benchmark-*.json")):
+        prefix, suffix = pattern.split("*")
+        for path in sorted(glob.glob(os.path.join(report_dir, pattern))):
+            jobs.append((os.path.basename(path)[len(prefix):-len(suffix)] or "all", kind, path))
+
+    results = {}
+    if not jobs:
+        return results
+    if len(jobs) == 1 or max_workers == 1:
+        parsed = [_parse_file(kind, path) for _, kind, path in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers or min(len(jobs), os.cpu_count() or 1)) as pool:
+            parsed = list(pool.map(_parse_file, [kind for _, kind, _ in jobs], [path for _, _, path in jobs]))
+
+    for (suite, kind, path), totals in zip(jobs, parsed):
+        results.setdefault(suite, {"coverage": None, "tests": None, "benchmarks": None})[kind] = totals
+    return results
+
+def _percent(covered, valid):
+    return f"{covered / valid * 100:.1f}%" if valid else "n/a"
+
+def _status(suite_results):
+    if suite_results is None:
+        return "⚪ Not Required"
+    tests = suite_results["tests"]
+    if tests is None:
+        return "✅ Completed"
+    if tests["failed"] or tests["errors"]:
+        return "❌ Failed"
+    return "✅ Passed"
+
+def trend_metrics(results):
+    """Flatten collected results into (kind, suite, name, value) rows for the trend store"""
+    rows = []
+    for suite, suite_results in results.items():
+        cov = suite_results["coverage"]
+        if cov:
+            if cov["lines_valid"]:
+                rows.append(("coverage", suite, "line_rate", cov["lines_covered"] / cov["lines_valid"]))
+            if cov["branches_valid"]:
+                rows.append(("coverage", suite, "branch_rate", cov["branches_covered"] / cov["branches_valid"]))
+        tests = suite_results["tests"]
+        if tests:
+            for name in ("tests", "failed", "duration"):
+                rows.append(("tests", suite, name, tests[name]))
+            rows.extend(("test", suite, name, duration) for duration, name in tests["slowest"])
+        for benchmark, stats in (suite_results["benchmarks"] or {}).items():
+            rows.extend(("benchmark", suite, f"{benchmark}:{stat}", value)
+                        for stat, value in stats.items() if isinstance(value, (int, float)))
+    return rows
+
+def record_trends(results, trend_db):
+    """Append this run to the trend store and return its regression report"""
+    from trend_store import TrendStore
+    store = TrendStore(trend_db)
+    try:
+        run_id = store.record_run(
+            os.environ.get("MICROSERVICE_NAME", "unknown"),
+            os.environ.get("TARGET_ENV", "unknown"),
+            trend_metrics(results),
+            branch=os.environ.get("BRANCH_NAME"),
+            version=os.environ.get("VERSION"),
+            commit_hash=os.environ.get("COMMIT_HASH"),
+        )
+        return store.regressions(run_id)
+    finally:
+        store.close()
+
+def _format_value(kind, name, value):
+    if kind == "coverage":
+        return f"{value * 100:.1f}%"
+    if kind in ("test", "tests"):
+        return f"{value:.3f}s"
+    return f"{value:g}"
+
+def generate_report(report_dir, max_workers=None, trend_db=None):
+    """Generate a markdown report of test results.
+
+    With trend_db (or TREND_DB) the run is also appended to that trend store
+    and the report flags regressions against recent runs.
+    """
     report_file = os.path.join(report_dir, "test-report.md")
-    
+    results = collect_results(report_dir, max_workers)
+    trend_db = trend_db or os.environ.get("TREND_DB")
+    trends = record_trends(results, trend_db) if trend_db and results else None
+
     with open(report_file, "w") as f:
         f.write("# Test Results\n\n")
         f.write("## Summary\n\n")
         f.write(f"Generated at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-        
+
         # Add environment info
         f.write("### Environment\n")
         f.write(f"- Environment: {os.environ.get('TARGET_ENV', 'unknown')}\n")
         f.write(f"- Branch: {os.environ.get('BRANCH_NAME', 'unknown')}\n")
         f.write(f"- Version: {os.environ.get('VERSION', 'unknown')}\n\n")
-        
-        # Check for coverage reports
-        coverage_files = glob.glob(os.path.join(report_dir, "coverage*.xml"))
-        if coverage_files:
+
+        # Coverage per suite, from the coverage XML totals
+        covered_suites = [suite for suite in results if results[suite]["coverage"]]
+        if covered_suites:
             f.write("### Test Coverage\n")
-            for cov_file in coverage_files:
-                test_type = os.path.basename(cov_file).replace("coverage-", "").replace(".xml", "")
-                f.write(f"- {test_type.capitalize()} Tests: Coverage report generated\n")
-        
+            f.write("| Test Type | Lines | Line Coverage | Branches | Branch Coverage |\n")
+            f.write("|-----------|-------|---------------|----------|-----------------|\n")
+            for suite in covered_suites:
+                cov = results[suite]["coverage"]
+                f.write(f"| {suite.capitalize()} | {cov['lines_covered']}/{cov['lines_valid']} | "
+                        f"{_percent(cov['lines_covered'], cov['lines_valid'])} | "
+                        f"{cov['branches_covered']}/{cov['branches_valid']} | "
+                        f"{_percent(cov['branches_covered'], cov['branches_valid'])} |\n")
+
         f.write("\n### Test Execution\n")
-        f.write("| Test Type | Status |\n")
-        f.write("|-----------|--------|\n")
-        
-        # Check for test execution
-        test_types = ["mandatory", "recommended", "optional"]
-        for test_type in test_types:
-            status = "✅ Completed" if os.path.exists(os.path.join(report_dir, f"coverage-{test_type}.xml")) else "⚪ Not Required"
-            f.write(f"| {test_type.capitalize()} | {status} |\n")
+        f.write("| Test Type | Status | Tests | Passed | Failed | Skipped | Duration |\n")
+        f.write("|-----------|--------|-------|--------|--------|---------|----------|\n")
+
+        totals = {"tests": 0, "passed": 0, "failed": 0, "skipped": 0, "duration": 0.0}
+        slowest = []
+        for test_type in TEST_TYPES + sorted(set(results) - set(TEST_TYPES)):
+            suite_results = results.get(test_type)
+            tests = suite_results["tests"] if suite_results else None
+            if tests is None:
+                if test_type in TEST_TYPES:
+                    f.write(f"| {test_type.capitalize()} | {_status(suite_results)} | - | - | - | - | - |\n")
+                continue
+            failed = tests["failed"] + tests["errors"]
+            f.write(f"| {test_type.capitalize()} | {_status(suite_results)} | {tests['tests']} | {tests['passed']} | "
+                    f"{failed} | {tests['skipped']} | {tests['duration']:.2f}s |\n")
+            for key in ("tests", "passed", "skipped", "duration"):
+                totals[key] += tests[key]
+            totals["failed"] += failed
+            slowest.extend((duration, test_type, name) for duration, name in tests["slowest"])
+        if totals["tests"]:
+            f.write(f"| **Total** | | {totals['tests']} | {totals['passed']} | {totals['failed']} | "
+                    f"{totals['skipped']} | {totals['duration']:.2f}s |\n")
+
+        if slowest:
+            f.write("\n### Slowest Tests\n")
+            f.write("| Test | Type | Duration |\n")
+            f.write("|------|------|----------|\n")
+            for duration, test_type, name in heapq.nlargest(SLOWEST_TESTS, slowest):
+                f.write(f"| `{name}` | {test_type} | {duration:.3f}s |\n")
+
+        benchmarked = [suite for suite in results if results[suite]["benchmarks"]]
+        if benchmarked:
+            f.write("\n### Benchmarks\n")
+            f.write("| Benchmark | Type | p50 | p95 | p99 | Requests/s |\n")
+            f.write("|-----------|------|-----|-----|-----|------------|\n")
+            for suite in benchmarked:
+                for benchmark, stats in results[suite]["benchmarks"].items():
+                    cells = [f"{stats[key]:.3f} ms" if key in stats else "-" for key in ("p50_ms", "p95_ms", "p99_ms")]
+                    rps = f"{stats['rps']:.0f}" if "rps" in stats else "-"
+                    f.write(f"| `{benchmark}` | {suite} | {' | '.join(cells)} | {rps} |\n")
+
+        if trends is not None:
+            f.write("\n### Trends\n")
+            f.write(f"Compared {trends['compared']} metrics with the median of the last {trends['window']} "
+                    f"runs of {trends['run']['microservice']} in {trends['run']['environment']}.\n\n")
+            if trends["regressions"]:
+                f.write("| Metric | Type | Baseline | Current | Change |\n")
+                f.write("|--------|------|----------|---------|--------|\n")
+                for item in trends["regressions"]:
+                    kind, name = item["kind"], item["name"]
+                    f.write(f"| ⚠️ `{kind}/{name}` | {item['suite']} | {_format_value(kind, name, item['baseline'])} | "
+                            f"{_format_value(kind, name, item['value'])} | {item['change'] * 100:+.1f}% |\n")
+            else:
+                f.write("No regressions.\n")
+
+    return results
 
 if __name__ == "__main__":
     if "TEST_REPORTS_DIR" not in os.environ:
         print("Error: TEST_REPORTS_DIR environment variable not set")
         exit(1)
-        
+
     report_dir = os.environ["TEST_REPORTS_DIR"]
     if not os.path.exists(report_dir):
         print(f"Error: Test reports directory not found: {report_dir}")
         exit(1)
-        
+
     generate_report(report_dir)
-    print(f"Test report generated at {os.path.join(report_dir, 'test-report.md')}") 
\ No newline at end of file
+    print(f"Test report generated at {os.path.join(report_dir, 'test-report.md')}")
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from test_report_generator import TEST_TYPES
+
+# pytest exit codes
+PYTEST_OK = 0
+PYTEST_NO_TESTS = 5
+
+# Lines of a failed mandatory suite's pytest output echoed to the console
+LOG_TAIL_LINES = 40
+
+class TestRunnerError(Exception):
+    """Custom exception for TestRunner errors"""
+    pass
+
+def discover(environments_dir="environments"):
+    """Every app directory with tests under environments/<environment>/, at any depth"""
+    apps = []
+    if not os.path.isdir(environments_dir):
+        return apps
+    for environment in sorted(os.listdir(environments_dir)):
+        env_path = os.path.join(environments_dir, environment)
+        if environment.startswith(".") or not os.path.isdir(env_path):
+            continue
+        for root, dirs, _ in os.walk(env_path):
+            dirs.sort()
+            if "tests" in dirs:
+                apps.append(root)
+                # An app's own subfolders are not apps
+                dirs[:] = []
+            else:
+                dirs[:] = [name for name in dirs if not name.startswith(".")]
+    return apps
+
+def app_labels(app_dir, environments_dir="environments"):
+    """(environment, app name) for environments/<environment>/<app...>"""
+    relative = os.path.relpath(os.path.abspath(app_dir), os.path.abspath(environments_dir))
+    parts = relative.split(os.sep)
+    if parts[0] == os.pardir or len(parts) < 2:
+        path = os.path.abspath(app_dir)
+        return os.path.basename(os.path.dirname(path)), os.path.basename(path)
+    return parts[0], "/".join(parts[1:])
+
+class TestRunner:
+    """Runs each app's test suites as parallel pytest processes.
+
+    Every (app, suite) pair is its own interpreter with the app directory as
+    cwd and sole PYTHONPATH entry, writing junit-<suite>.xml,
+    coverage-<suite>.xml and its own coverage data file into the app's
+    tests/test-reports. Once an app's suites finish, their coverage data is
+    combined into .coverage and coverage-all.xml. Suites in no_coverage
+    (e.g. benchmarks, whose timings tracing would inflate) run without
+    coverage. Only mandatory failures make the run fail.
+    """
+
+    def __init__(self, python=sys.executable, max_workers=None, timeout=900, exclusive=(), env=None,
+                 environments_dir="environments", no_coverage=()):
+        self.python = python
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.exclusive = set(exclusive)
+        self.no_coverage = set(no_coverage)
+        self.env = dict(os.environ if env is None else env)
+        self.environments_dir = environments_dir
+
+    @staticmethod
+    def reports_dir(app_dir):
+        return os.path.join(app_dir, "tests", "test-reports")
+
+    def _job_env(self, app_dir, suite):
+        env = dict(self.env)
+        env["PYTHONPATH"] = os.path.abspath(app_dir)
+        env["COVERAGE_FILE"] = self._data_file(app_dir, suite)
+        return env
+
+    def _data_file(self, app_dir, suite):
+        return os.path.abspath(os.path.join(self.reports_dir(app_dir), f".coverage.{suite}"))
+
+    def run_suite(self, app_dir, suite):
+        """Run one suite; returns its result record"""
+        test_file = os.path.join("tests", f"test_{suite}.py")
+        result = {"app": app_dir, "suite": suite, "status": "skipped", "exit_code": None, "duration": 0.0}
+        if not os.path.exists(os.path.join(app_dir, test_file)):
+            return result
+
+        reports = os.path.join("tests", "test-reports")
+        command = [self.python, "-m", "pytest", test_file, "-q", "-p", "no:cacheprovider"]
+        if suite in self.no_coverage:
+            command.append("--no-cov")
+        else:
+            command += ["--cov=.", "--cov-branch", f"--cov-report=xml:{reports}/coverage-{suite}.xml"]
+        command.append(f"--junitxml={reports}/junit-{suite}.xml")
+        log_path = os.path.join(self.reports_dir(app_dir), f"pytest-{suite}.log")
+        started = time.perf_counter()
+        with open(log_path, "w") as log:
+            try:
+                process = subprocess.run(command, cwd=app_dir, env=self._job_env(app_dir, suite),
+                                         stdout=log, stderr=subprocess.STDOUT, timeout=self.timeout)
+                exit_code = process.returncode
+            except subprocess.TimeoutExpired:
+                log.write(f"\nTimed out after {self.timeout}s\n")
+                exit_code = None
+        result["duration"] = time.perf_counter() - started
+        result["exit_code"] = exit_code
+        result["log"] = log_path
+        if exit_code == PYTEST_OK:
+            result["status"] = "passed"
+        elif exit_code == PYTEST_NO_TESTS:
+            result["status"] = "no tests"
+        elif exit_code is None:
+            result["status"] = "timed out"
+        else:
+            result["status"] = "failed"
+        return result
+
+    def combine_coverage(self, app_dir):
+        """Merge the suites' coverage data into .coverage and coverage-all.xml"""
+        reports = self.reports_dir(app_dir)
+        data_files = sorted(
+            os.path.abspath(os.path.join(reports, name))
+            for name in os.listdir(reports) if name.startswith(".coverage.")
+        )
+        if not data_files:
+            return None
+        combined = os.path.abspath(os.path.join(reports, ".coverage"))
+        if os.path.exists(combined):
+            os.remove(combined)
+        for command in (
+            [self.python, "-m", "coverage", "combine", "--keep", "-q", f"--data-file={combined}", *data_files],
+            [self.python, "-m", "coverage", "xml", "-q", f"--data-file={combined}",
+             "-o", os.path.join("tests", "test-reports", "coverage-all.xml")],
+        ):
+            process = subprocess.run(command, cwd=app_dir, env=self.env, capture_output=True, text=True)
+            if process.returncode != 0:
+                raise TestRunnerError(f"Coverage merge failed for {app_dir}: {process.stderr.strip()}")
+        return combined
+
+    def run(self, app_dirs, suites=TEST_TYPES):
+        """Run suites for every app; returns {app_dir: {"environment", "app", "suites": {suite: result}}}"""
+        jobs = []
+        for app_dir in app_dirs:
+            os.makedirs(self.reports_dir(app_dir), exist_ok=True)
+            for suite in suites:
+                # Data left by an earlier run must not be merged into or reported with this one
+                stale = [self._data_file(app_dir, suite)]
+                if suite in self.no_coverage:
+                    stale.append(os.path.join(self.reports_dir(app_dir), f"coverage-{suite}.xml"))
+                for path in stale:
+                    if os.path.exists(path):
+                        os.remove(path)
+                jobs.append((app_dir, suite))
+
+        parallel = [job for job in jobs if job[1] not in self.exclusive]
+        serial = [job for job in jobs if job[1] in self.exclusive]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            finished = list(pool.map(lambda job: self.run_suite(*job), parallel))
+            # Suites marked exclusive (e.g. benchmarks) run alone so other jobs do not skew their timings
+            finished.extend(self.run_suite(*job) for job in serial)
+            results = {}
+            for app_dir in app_dirs:
+                environment, name = app_labels(app_dir, self.environments_dir)
+                results[app_dir] = {"environment": environment, "app": name, "suites": {}}
+            for result in finished:
+                results[result["app"]]["suites"][result["suite"]] = result
+            merges = {app_dir: pool.submit(self.combine_coverage, app_dir) for app_dir in app_dirs}
+            for app_dir, merge in merges.items():
+                results[app_dir]["coverage"] = merge.result()
+
+        for app_dir, app_results in results.items():
+            with open(os.path.join(self.reports_dir(app_dir), "test-run.json"), "w") as f:
+                json.dump(app_results, f, indent=2)
+        return results
+
+    @staticmethod
+    def failed_mandatory(results):
+        """(app_dir, result) for every mandatory suite that did not pass"""
+        return [
+            (app_dir, suite_result)
+            for app_dir, app_results in results.items()
+            for suite, suite_result in app_results["suites"].items()
+            if suite == "mandatory" and suite_result["status"] not in ("passed", "no tests", "skipped")
+        ]
+
+def generate_reports(results, max_workers=None):
+    """Write each app's test-report.md with the report generator, labelled with its environment"""
+    from test_report_generator import generate_report
+    saved = {key: os.environ.get(key) for key in ("TARGET_ENV", "MICROSERVICE_NAME")}
+    try:
+        for app_dir, app_results in results.items():
+            os.environ["TARGET_ENV"] = app_results["environment"]
+            # A name set by CI only labels a single app; discovered apps are named by their folder
+            os.environ["MICROSERVICE_NAME"] = (saved["MICROSERVICE_NAME"] if len(results) == 1 else None) or app_results["app"]
+            generate_report(TestRunner.reports_dir(app_dir), max_workers)
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+def print_summary(results, elapsed):
+    for app_dir, app_results in results.items():
+        print(f"{app_results['environment']}/{app_results['app']}")
+        for suite, result in app_results["suites"].items():
+            print(f"  {suite:<12} {result['status']:<10} {result['duration']:.1f}s")
+    suites = sum(len(app_results["suites"]) for app_results in results.values())
+    print(f"Ran {suites} suite(s) for {len(results)} app(s) in {elapsed:.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run test suites for environments in parallel")
+    parser.add_argument('--environments-dir', default='environments', help='Directory holding <environment>/<app> folders')
+    parser.add_argument('--app-dir', nargs='+', help='Test only these app directories instead of discovering them')
+    parser.add_argument('--environment', nargs='+', help='Only discover apps in these environments')
+    parser.add_argument('--suite', nargs='+', choices=TEST_TYPES, default=TEST_TYPES)
+    parser.add_argument('--workers', type=int, help='Parallel pytest processes (default: CPU count)')
+    parser.add_argument('--timeout', type=float, default=900, help='Seconds before a suite is stopped')
+    parser.add_argument('--exclusive', nargs='+', default=[], choices=TEST_TYPES,
+                        help='Suites run one at a time after the rest, e.g. optional for stable benchmarks')
+    parser.add_argument('--no-cov', nargs='+', default=[], choices=TEST_TYPES,
+                        help='Suites run without coverage, e.g. optional so benchmarks are not slowed by tracing')
+    parser.add_argument('--report', action='store_true', help='Write test-report.md for each app')
+    parser.add_argument('--summary', help='Also write all results to this JSON file')
+
+    args = parser.parse_args()
+    try:
+        app_dirs = args.app_dir or discover(args.environments_dir)
+        if args.environment:
+            app_dirs = [app_dir for app_dir in app_dirs if app_labels(app_dir, args.environments_dir)[0] in args.environment]
+        if not app_dirs:
+            raise ValueError("No app directories with tests found")
+
+        runner = TestRunner(max_workers=args.workers, timeout=args.timeout, exclusive=args.exclusive,
+                            environments_dir=args.environments_dir, no_coverage=args.no_cov)
+        started = time.perf_counter()
+        results = runner.run(app_dirs, args.suite)
+        print_summary(results, time.perf_counter() - started)
+        if args.report:
+            generate_reports(results)
+        if args.summary:
+            with open(args.summary, "w") as f:
+                json.dump(results, f, indent=2)
+
+        failed = runner.failed_mandatory(results)
+        for app_dir, result in failed:
+            print(f"\nMandatory tests {result['status']} in {app_dir} ({result['log']}):")
+            with open(result["log"]) as f:
+                print("".join(f.readlines()[-LOG_TAIL_LINES:]).rstrip())
+        if failed:
+            exit(1)
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        exit(1)
+
+if __name__ == "__main__":
+    main()
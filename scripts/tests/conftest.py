@@ -0,0 +1,13 @@
+import os
+import sys
+import pytest
+
+# The scripts import their siblings directly, as when run from scripts/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from port_manager import PortManager
+
+@pytest.fixture
+def manager(tmp_path):
+    """A PortManager on a fresh ports.json that never routes through a daemon"""
+    return PortManager(str(tmp_path / "ports.json"), max_retries=1, retry_delay=0, use_daemon=False)
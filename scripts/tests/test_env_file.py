@@ -0,0 +1,48 @@
+import pytest
+
+from env_file import EnvRenderer, parse_env, render_env, update_env
+
+def test_parse_env():
+    text = (
+        "# comment\n"
+        "\n"
+        "export APP_NAME=svc_feature\n"
+        "APP_PORT=5000 # assigned by port_manager\n"
+        "VIRTUAL_HOST='feature.example.com'\n"
+        'GREETING=" hello # world "\n'
+        "EMPTY=\n"
+    )
+    assert parse_env(text) == {
+        "APP_NAME": "svc_feature",
+        "APP_PORT": "5000",
+        "VIRTUAL_HOST": "feature.example.com",
+        "GREETING": " hello # world ",
+        "EMPTY": "",
+    }
+
+@pytest.mark.parametrize("value", [
+    "plain", "", " leading", "trailing ", "has # hash", "two\nlines", '"quoted"', "'single'", 'back\\slash #',
+])
+def test_render_parse_round_trip(value):
+    assert parse_env(render_env({"KEY": value})) == {"KEY": value}
+
+def test_update_env_keeps_comments_and_order():
+    text = "# Build metadata\nAPP_VERSION=1.0\nexport APP_PORT=5000\nCUSTOM=keep\n"
+    updated = update_env(text, {"APP_PORT": 5001, "APP_VERSION": "has # hash", "NEW": "value"})
+    assert updated == (
+        "# Build metadata\n"
+        'APP_VERSION="has # hash"\n'
+        "APP_PORT=5001\n"
+        "CUSTOM=keep\n"
+        "NEW=value\n"
+    )
+    assert parse_env(updated)["APP_VERSION"] == "has # hash"
+
+def test_config_image_tags(tmp_path):
+    renderer = EnvRenderer(tmp_path, image_repository="repo")
+    existing = {"APP_VERSION": "1.2.3", "CUSTOM": "keep"}
+    development = renderer.config("development", "feature", "svc", port=5000, existing=existing)
+    assert development["APP_IMAGE"] == "repo_feature:1.2.3"
+    assert development["CUSTOM"] == "keep"
+    staging = renderer.config("staging", "staging", "svc", port=6000, existing=existing)
+    assert staging["APP_IMAGE"] == "repo_staging:latest"
@@ -0,0 +1,61 @@
+import pytest
+
+from environment_manager import EnvironmentManager
+
+@pytest.fixture
+def environments(tmp_path, manager):
+    """Two tracked feature environments with development ports"""
+    env_manager = EnvironmentManager(tmp_path)
+    for branch in ("feature-a", "feature-b"):
+        env_manager.track_feature_branch(branch, "svc")
+        env_dir = tmp_path / "environments" / "development" / "svc" / branch
+        env_dir.mkdir(parents=True)
+        (env_dir / "app.py").write_bytes(b"x" * 100)
+        manager.get_next_available_port(f"svc/{branch}", "development")
+    return env_manager
+
+def test_gc_dry_run_changes_nothing(tmp_path, manager, environments):
+    report = environments.garbage_collect(existing_branches=["feature-b"], dry_run=True, port_manager=manager)
+
+    assert report["environments"] == ["feature-a"]
+    assert report["released_ports"] == {"svc/feature-a": 5000}
+    assert report["bytes_freed"] == 0
+    assert (tmp_path / "environments/development/svc/feature-a/app.py").exists()
+    assert environments.get_record("feature_branches", "feature-a") is not None
+    assert manager.lookup_port("svc/feature-a", "development") == 5000
+
+def test_gc_removes_stale_environments(tmp_path, manager, environments):
+    report = environments.garbage_collect(existing_branches=["feature-b"], port_manager=manager)
+
+    assert report["environments"] == ["feature-a"]
+    assert report["released_ports"] == {"svc/feature-a": 5000}
+    assert report["bytes_freed"] == 100
+    assert report["errors"] == {}
+    assert not (tmp_path / "environments/development/svc/feature-a").exists()
+    assert EnvironmentManager(tmp_path).get_record("feature_branches", "feature-a") is None
+    assert manager.lookup_port("svc/feature-a", "development") is None
+    # The live branch is untouched
+    assert (tmp_path / "environments/development/svc/feature-b/app.py").exists()
+    assert manager.lookup_port("svc/feature-b", "development") == 5001
+
+def test_gc_keeps_branch_with_failed_deletion(tmp_path, manager, environments, monkeypatch):
+    # The CI layout keeps a second copy of the environment at environments/development/<branch>
+    ci_dir = tmp_path / "environments" / "development" / "feature-a"
+    ci_dir.mkdir()
+    (ci_dir / ".env").write_bytes(b"y" * 10)
+    remove_tree = environments._remove_tree
+
+    def fail_on_ci_dir(path):
+        if path == ci_dir:
+            raise OSError("busy")
+        return remove_tree(path)
+
+    monkeypatch.setattr(environments, "_remove_tree", fail_on_ci_dir)
+    report = environments.garbage_collect(existing_branches=["feature-b"], port_manager=manager)
+
+    assert report["errors"] == {"feature-a": "busy"}
+    # The deletion that did complete is still counted
+    assert report["bytes_freed"] == 100
+    assert report["released_ports"] == {}
+    assert environments.get_record("feature_branches", "feature-a") is not None
+    assert manager.lookup_port("svc/feature-a", "development") == 5000
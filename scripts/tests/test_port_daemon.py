@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+from port_daemon import PortDaemon
+from port_manager import set_record, del_record
+
+def write_wal(daemon, text):
+    with open(daemon.manager.wal_file, 'w') as f:
+        f.write(text)
+
+def test_wal_replayed_and_compacted(manager):
+    manager.get_next_available_port("feature-a")
+    daemon = PortDaemon.for_ports_file(manager.ports_file)
+    write_wal(daemon, "".join(json.dumps(record) + "\n" for record in (
+        set_record("development", "feature-b", 5001),
+        del_record("development", "feature-a"),
+    )))
+
+    daemon.load_state()
+    daemon.wal.close()
+
+    assert manager.list_assignments("development") == {"development": {"feature-b": 5001}}
+    with open(manager.wal_file, 'r') as f:
+        assert f.read() == ""
+    # Replayed records reach the index as well as the assignments
+    assert manager.get_next_available_port("feature-c") == 5000
+    assert manager.get_next_available_port("feature-d") == 5002
+
+def test_torn_wal_tail_is_ignored(manager):
+    daemon = PortDaemon.for_ports_file(manager.ports_file)
+    complete = json.dumps(set_record("development", "feature-a", 5000)) + "\n"
+    write_wal(daemon, complete + '{"op": "set", "env": "devel')
+
+    daemon.load_state()
+    daemon.wal.close()
+
+    assert manager.list_assignments("development") == {"development": {"feature-a": 5000}}
+
+def test_acknowledged_requests_survive_restart(manager):
+    daemon = PortDaemon.for_ports_file(manager.ports_file)
+    daemon.load_state()
+
+    async def assign():
+        response, durable = daemon.handle_request(b'{"id": 1, "action": "assign", "branch": "feature-a"}')
+        await durable
+        return response
+
+    assert asyncio.run(assign())["port"] == 5000
+    # Nothing has been compacted yet; the write-ahead log alone holds the assignment
+    daemon.wal.close()
+    assert manager.list_assignments("development") == {"development": {}}
+
+    restarted = PortDaemon.for_ports_file(manager.ports_file)
+    restarted.load_state()
+    restarted.wal.close()
+    assert restarted.data["environments"]["development"]["assignments"] == {"feature-a": 5000}
+    assert manager.lookup_port("feature-a", "development") == 5000
+
+def test_malformed_requests_are_answered(manager):
+    daemon = PortDaemon.for_ports_file(manager.ports_file)
+    daemon.load_state()
+    daemon.wal.close()
+
+    for line in (b'not json', b'[1, 2]', b'{"action": "lookup"}', b'{"action": "batch", "operations": [1]}'):
+        response, durable = daemon.handle_request(line)
+        assert response["ok"] is False
+        assert durable is None
@@ -0,0 +1,42 @@
+import pytest
+
+from port_manager import PortManagerError
+
+def tear_journal(manager):
+    with open(manager.journal.journal_file, 'a') as f:
+        f.write('{"op":"set","env":"development","bra')
+
+def test_torn_tail_is_skipped(manager):
+    manager.get_next_available_port("feature-a")
+    manager.get_next_available_port("feature-b")
+    tear_journal(manager)
+
+    assert [record["seq"] for record in manager.history()] == [1, 2]
+    assert manager.journal.last_seq() == 2
+    assert manager.journal.state_at(1)["environments"]["development"]["assignments"] == {"feature-a": 5000}
+    with pytest.raises(PortManagerError):
+        manager.journal.state_at(3)
+
+def test_records_after_a_torn_tail_are_kept(manager):
+    manager.get_next_available_port("feature-a")
+    tear_journal(manager)
+    manager.get_next_available_port("feature-b")
+    manager.release_port("feature-a")
+
+    assert [(record["op"], record["seq"]) for record in manager.history()] == [("set", 1), ("set", 2), ("del", 3)]
+    assert manager.journal.state_at(2)["environments"]["development"]["assignments"] == {
+        "feature-a": 5000, "feature-b": 5001,
+    }
+
+def test_restore_replays_journal(manager):
+    manager.get_next_available_port("feature-a")
+    manager.get_next_available_port("feature-b")
+    manager.release_port("feature-a")
+    tear_journal(manager)
+
+    assert manager.restore(2) == 2
+    assert manager.list_assignments("development") == {"development": {"feature-a": 5000, "feature-b": 5001}}
+    # The restore is journaled after the valid records, so it can be undone too
+    assert manager.history()[-1]["op"] == "restore"
+    manager.restore(3)
+    assert manager.list_assignments("development") == {"development": {"feature-b": 5001}}
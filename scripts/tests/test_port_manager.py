@@ -0,0 +1,73 @@
+import json
+import os
+import pytest
+
+from port_manager import PortManager, PortManagerError
+
+def read_ports(manager):
+    with open(manager.ports_file, 'r') as f:
+        return json.load(f)
+
+def test_assign_release_migrate(manager):
+    assert manager.get_next_available_port("feature-a") == 5000
+    assert manager.get_next_available_port("feature-b") == 5001
+    # Re-assigning a branch keeps its port
+    assert manager.get_next_available_port("feature-a") == 5000
+
+    manager.release_port("feature-a")
+    assert manager.get_next_available_port("feature-c") == 5000
+
+    assert manager.migrate_port("feature-b", "development", "staging") == 6000
+    assert manager.lookup_port("feature-b", "staging") == 6000
+
+def test_batch_reports_failures_without_stopping(manager):
+    results = manager.apply_batch([
+        {"action": "assign", "branch": "feature-a", "env": "development"},
+        {"action": "assign", "branch": "feature-b", "env": "nowhere"},
+        {"action": "assign", "branch": "feature-c", "env": "development"},
+        {"action": "release", "branch": "feature-a", "env": "development"},
+        {"action": "migrate", "branch": "feature-c", "from_env": "development", "to_env": "staging"},
+    ])
+    assert [result["ok"] for result in results] == [True, False, True, True, True]
+    assert results[1]["error"] == "Invalid environment: nowhere"
+    assert results[3]["released"] == 5000
+    assert results[4]["port"] == 6000
+
+    assignments = read_ports(manager)["environments"]
+    assert assignments["development"]["assignments"] == {"feature-c": 5001}
+    assert assignments["staging"]["assignments"] == {"feature-c": 6000}
+
+def test_index_rebuilt_after_external_edit(manager):
+    manager.get_next_available_port("feature-a")
+    data = read_ports(manager)
+    data["environments"]["development"]["assignments"]["manual"] = 5001
+    with open(manager.ports_file, 'w') as f:
+        json.dump(data, f)
+
+    # The saved index no longer matches ports.json, so 5001 must not be handed out
+    assert manager.get_next_available_port("feature-b") == 5002
+
+def test_index_rebuilt_when_missing(manager):
+    manager.get_next_available_port("feature-a")
+    manager.get_next_available_port("feature-b")
+    manager.release_port("feature-a")
+    os.remove(manager.index_file)
+
+    fresh = PortManager(manager.ports_file, max_retries=1, retry_delay=0, use_daemon=False)
+    assert fresh.stats()["development"]["next_free"] == 5000
+    assert fresh.get_next_available_port("feature-c") == 5000
+
+def test_metrics_record_each_operation(tmp_path):
+    metrics_file = tmp_path / "ports.json.metrics"
+    manager = PortManager(str(tmp_path / "ports.json"), max_retries=1, retry_delay=0, use_daemon=False,
+                          metrics_file=str(metrics_file))
+    manager.get_next_available_port("feature-a")
+    manager.get_next_available_port("feature-b")
+    with pytest.raises(PortManagerError):
+        manager.release_port("feature-a", "nowhere")
+
+    assert len(metrics_file.read_text().splitlines()) == 3
+    text = manager.metrics.prometheus()
+    assert 'port_manager_operation_seconds_count{op="assign"} 2' in text
+    assert 'port_manager_failures_total{op="assign"} 0' in text
+    assert 'port_manager_failures_total{op="release"} 1' in text
@@ -0,0 +1,65 @@
+import sys
+import json
+import pytest
+
+import state_store
+from port_manager import PortManager, default_ports_data
+from state_store import SqliteStateStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteStateStore(str(tmp_path / "state.db"))
+    yield store
+    store.close()
+
+def test_ports_round_trip(store):
+    data = default_ports_data()
+    data["environments"]["development"]["assignments"] = {"feature-a": 5000, "feature-b": 5003}
+    data["environments"]["production"]["assignments"] = {"microservice": 7000}
+    store.import_ports(data)
+    assert store.export_ports() == data
+
+def test_tracking_round_trip(store):
+    tracking = {
+        "feature_branches": {"feature-a": {
+            "microservice": "svc", "created_at": "2026-01-01T00:00:00", "last_updated": "2026-01-02T00:00:00",
+            "environment_path": "environments/development/svc/feature-a",
+        }},
+        "staging_references": {"environments/staging/svc": {"source_branch": "feature-a", "linked_at": None}},
+        "environment_states": {"environments/staging/svc": {
+            "type": "preserved", "source": "environments/development/svc/feature-a", "created_at": None,
+        }},
+    }
+    store.import_tracking(tracking)
+    assert store.export_tracking() == tracking
+    assert store.is_staging_source("feature-a")
+    assert store.find_tracking("environment_states", "source", "environments/development/svc/feature-a") == [
+        "environments/staging/svc"
+    ]
+
+def test_port_manager_on_store(tmp_path, store):
+    manager = PortManager(str(tmp_path / "ports.json"), max_retries=1, retry_delay=0, store=store)
+    assert manager.get_next_available_port("feature-a") == 5000
+    results = manager.apply_batch([
+        {"action": "assign", "branch": "feature-b", "env": "development"},
+        {"action": "assign", "branch": "feature-c", "env": "nowhere"},
+        {"action": "release", "branch": "feature-a", "env": "development"},
+    ])
+    assert [result["ok"] for result in results] == [True, False, True]
+    assert manager.get_next_available_port("feature-d") == 5000
+    assert store.export_ports()["environments"]["development"]["assignments"] == {"feature-b": 5001, "feature-d": 5000}
+
+def test_export_replaces_files(tmp_path, store, monkeypatch):
+    data = default_ports_data()
+    data["environments"]["staging"]["assignments"] = {"staging": 6000}
+    store.import_ports(data)
+    (tmp_path / "ports.json").write_text("stale")
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, "argv", ["state_store.py", "export"])
+    state_store.main()
+
+    assert json.loads((tmp_path / "ports.json").read_text()) == data
+    assert json.loads((tmp_path / "environment_tracking.json").read_text())["feature_branches"] == {}
+    # No temporary files are left behind
+    assert not [path for path in tmp_path.iterdir() if path.name.startswith("tmp")]
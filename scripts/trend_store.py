@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import sqlite3
+import argparse
+import statistics
+
+# Bump whenever the table layout below changes
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    microservice TEXT NOT NULL,
+    environment TEXT NOT NULL,
+    branch TEXT,
+    version TEXT,
+    commit_hash TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_microservice ON runs(microservice, environment, id);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    suite TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (run_id, kind, suite, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS metrics_series ON metrics(kind, suite, name, run_id);
+"""
+
+# Per-test durations below this many seconds are too noisy to flag
+MIN_TEST_SECONDS = 0.05
+
+class TrendStoreError(Exception):
+    """Custom exception for TrendStore errors"""
+    pass
+
+def higher_is_better(kind, name):
+    return kind == "coverage" or name.endswith(":rps")
+
+def is_tracked(kind, name):
+    """Whether a metric is compared against its baseline (counts are not)"""
+    return kind in ("coverage", "test", "benchmark") or (kind == "tests" and name == "duration")
+
+class TrendStore:
+    """SQLite history of test, coverage and benchmark results per CI run.
+
+    Each run is one row keyed by microservice, environment, branch, version
+    and commit; its metrics are rows of (kind, suite, name, value). Baselines
+    are read through the (microservice, environment, id) index, so the cost
+    of a comparison depends on the window size, not on how much history is
+    stored.
+    """
+
+    def __init__(self, db_path="test-trends.db", timeout=30):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise TrendStoreError(f"Unsupported trend schema version {version} in {db_path}")
+        self.conn.executescript(SCHEMA)
+        self.conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def record_run(self, microservice, environment, metrics, branch=None, version=None, commit_hash=None,
+                   created_at=None):
+        """Store one run and its [(kind, suite, name, value)] metrics; returns the run id"""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (microservice, environment, branch, version, commit_hash, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (microservice, environment, branch, version, commit_hash, created_at or time.time()),
+            )
+            run_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO metrics (run_id, kind, suite, name, value) VALUES (?, ?, ?, ?, ?)",
+                [(run_id, kind, suite, name, float(value)) for kind, suite, name, value in metrics],
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return run_id
+
+    def run(self, run_id):
+        row = self.conn.execute(
+            "SELECT id, microservice, environment, branch, version, commit_hash, created_at FROM runs WHERE id = ?",
+            (run_id,),
+        ).fetchone()
+        if row is None:
+            raise TrendStoreError(f"Run {run_id} not found")
+        return dict(zip(("id", "microservice", "environment", "branch", "version", "commit_hash", "created_at"), row))
+
+    def run_metrics(self, run_id):
+        return {
+            (kind, suite, name): value
+            for kind, suite, name, value in self.conn.execute(
+                "SELECT kind, suite, name, value FROM metrics WHERE run_id = ?", (run_id,)
+            )
+        }
+
+    def baseline(self, microservice, environment, before_run_id, window=10):
+        """Median of each metric over the previous `window` runs: {(kind, suite, name): (median, samples)}"""
+        rows = self.conn.execute(
+            """
+            SELECT m.kind, m.suite, m.name, m.value
+            FROM (SELECT id FROM runs WHERE microservice = ? AND environment = ? AND id < ?
+                  ORDER BY id DESC LIMIT ?) AS r
+            JOIN metrics AS m ON m.run_id = r.id
+            """,
+            (microservice, environment, before_run_id, window),
+        )
+        series = {}
+        for kind, suite, name, value in rows:
+            series.setdefault((kind, suite, name), []).append(value)
+        return {key: (statistics.median(values), len(values)) for key, values in series.items()}
+
+    def regressions(self, run_id, window=10, threshold=0.1, coverage_threshold=0.01, min_samples=3):
+        """Compare a run with the rolling baseline of its microservice and environment.
+
+        Timings regress when more than `threshold` (relative) slower, coverage
+        when more than `coverage_threshold` (absolute) lower. Metrics with
+        fewer than min_samples previous values are not judged.
+        """
+        run = self.run(run_id)
+        baseline = self.baseline(run["microservice"], run["environment"], run_id, window)
+        found = []
+        compared = 0
+        for key, value in sorted(self.run_metrics(run_id).items()):
+            kind, suite, name = key
+            if not is_tracked(kind, name) or key not in baseline:
+                continue
+            reference, samples = baseline[key]
+            if samples < min_samples:
+                continue
+            if kind == "test" and max(reference, value) < MIN_TEST_SECONDS:
+                continue
+            compared += 1
+            if kind == "coverage":
+                regressed = reference - value > coverage_threshold
+            elif higher_is_better(kind, name):
+                regressed = reference > 0 and (reference - value) / reference > threshold
+            else:
+                regressed = reference > 0 and (value - reference) / reference > threshold
+            if regressed:
+                change = (value - reference) / reference if reference else 0.0
+                found.append({"kind": kind, "suite": suite, "name": name, "baseline": reference,
+                              "value": value, "change": change, "samples": samples})
+        return {"run": run, "compared": compared, "window": window, "regressions": found}
+
+    def history(self, microservice, kind, suite, name, environment=None, limit=50):
+        """Most recent values of one metric, newest first"""
+        query = (
+            "SELECT r.id, r.environment, r.branch, r.version, r.commit_hash, r.created_at, m.value "
+            "FROM runs AS r JOIN metrics AS m ON m.run_id = r.id "
+            "WHERE r.microservice = ? AND m.kind = ? AND m.suite = ? AND m.name = ?"
+        )
+        params = [microservice, kind, suite, name]
+        if environment:
+            query += " AND r.environment = ?"
+            params.append(environment)
+        query += " ORDER BY r.id DESC LIMIT ?"
+        params.append(limit)
+        columns = ("run_id", "environment", "branch", "version", "commit_hash", "created_at", "value")
+        return [dict(zip(columns, row)) for row in self.conn.execute(query, params)]
+
+    def prune(self, keep_days):
+        """Delete runs older than keep_days; returns the number removed"""
+        cursor = self.conn.execute("DELETE FROM runs WHERE created_at < ?", (time.time() - keep_days * 86400,))
+        return cursor.rowcount
+
+    def close(self):
+        self.conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the test and benchmark trend store")
+    parser.add_argument('action', choices=['history', 'regressions', 'prune'])
+    parser.add_argument('--db', default=os.environ.get("TREND_DB", "test-trends.db"), help='Trend database path')
+    parser.add_argument('--microservice', help='history: microservice name')
+    parser.add_argument('--environment', help='history: limit to one environment')
+    parser.add_argument('--metric', help='history: kind/suite/name, e.g. coverage/mandatory/line_rate')
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--run-id', type=int, help='regressions: run to check')
+    parser.add_argument('--window', type=int, default=10, help='regressions: runs in the rolling baseline')
+    parser.add_argument('--keep-days', type=float, help='prune: keep runs newer than this')
+
+    args = parser.parse_args()
+    try:
+        store = TrendStore(args.db)
+        if args.action == 'history':
+            if not args.microservice or not args.metric or args.metric.count("/") < 2:
+                raise ValueError("--microservice and --metric kind/suite/name are required for history action")
+            kind, suite, name = args.metric.split("/", 2)
+            for row in store.history(args.microservice, kind, suite, name, args.environment, args.limit):
+                print(f"{row['run_id']}\t{row['environment']}\t{row['branch']}\t{row['version']}\t{row['value']:g}")
+
+        elif args.action == 'regressions':
+            if args.run_id is None:
+                raise ValueError("--run-id is required for regressions action")
+            report = store.regressions(args.run_id, args.window)
+            for item in report["regressions"]:
+                print(f"{item['kind']}/{item['suite']}/{item['name']}: {item['baseline']:g} -> {item['value']:g}")
+            print(f"{len(report['regressions'])} regression(s) in {report['compared']} compared metrics")
+
+        elif args.action == 'prune':
+            if args.keep_days is None:
+                raise ValueError("--keep-days is required for prune action")
+            print(f"Removed {store.prune(args.keep_days)} run(s)")
+
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -44,7 +44,10 @@ for APP_DIR in $FEATURE_APPS; do
     pip install --upgrade pip
 
     # Ensure requirements.txt exists before trying to install dependencies
-    if [ -f "requirements.txt" ]; then
+    if [ -f "requirements-dev.txt" ]; then
+        echo "📦 Installing dependencies from requirements-dev.txt..."
+        pip install -r requirements-dev.txt || echo "⚠️ Failed to install requirements!"
+    elif [ -f "requirements.txt" ]; then
         echo "📦 Installing dependencies from requirements.txt..."
         pip install -r requirements.txt || echo "⚠️ Failed to install requirements!"
     else